@@ -38,6 +38,7 @@ interface Message {
     userName: string;
     userImage: string;
     image?: string;
+    thumbnail?: string | null;
     file?: string;
     fileName?: string;
     fileType?: string;
@@ -845,24 +846,6 @@ export class ChatComponent implements OnInit, OnDestroy, AfterViewChecked
             this.newMessage.trim()
         ).subscribe({
             next: (response) => {
-                const wsMessage = {
-                    action: 'message',
-                    roomId : this.selectedChat?.roomId,
-                    user: this.currentUserId,
-                    message: response.message,
-                    image: response.image,
-                    file: response.file || null,
-                    fileName: response.fileName || null,
-                    fileType: response.fileType || null,
-                    fileSize: response.fileSize || null,
-                    type: response.type,
-                    fromUpload: true,
-                    userName: response.userName,
-                    userImage: response.userImage,
-                    timestamp: response.timestamp
-                };
-                this.ws?.send(JSON.stringify(wsMessage));
-
                 this.ngZone.run( () => {
                     this.messages.push({
                         user: response.user,
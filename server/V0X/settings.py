@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'apps.chat.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,10 +70,26 @@ ASGI_APPLICATION = 'V0X.asgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection (init_command)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL', # Readers never block the writer
+    'synchronous': 'NORMAL', # Durable at checkpoints, safe with WAL
+    'busy_timeout': 5000, # ms a writer waits for the lock before failing
+    'mmap_size': 134217728, # 128MB memory-mapped reads
+    'cache_size': -20000, # Negative = KiB, 20MB page cache per connection
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+            # Take the write lock when the transaction starts, a read lock can
+            # not be upgraded later while another connection writes
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -190,4 +207,156 @@ SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
 
-TIME_HOUR_CHAT_EXPIRED = 1
\ No newline at end of file
+TIME_HOUR_CHAT_EXPIRED = 1
+
+# OUTBOX CONFIGS
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_POLL_INTERVAL = 1 # seconds
+OUTBOX_DISPATCH_INLINE = True # In-process dispatcher, required with InMemoryChannelLayer
+OUTBOX_CLAIM_TIMEOUT = 60 # seconds, claimed events of a crashed dispatcher are retried after it
+OUTBOX_RETRY_DELAY = 2 # seconds, doubled on each failed attempt
+OUTBOX_RETRY_MAX_DELAY = 300 # seconds
+
+
+# BULK INGESTION CONFIGS
+
+BULK_INGEST_CHUNK_SIZE = 500
+BULK_INGEST_MAX_ERRORS = 1000 # Per-line errors returned in the response
+
+
+# EXPORT CONFIGS
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+# DELTA SYNC CONFIGS
+
+DELTA_SYNC_OVERLAP_SECONDS = 2 # Watermark lag covering writes still committing
+DELTA_SYNC_TOMBSTONE_DAYS = 30 # Removed rooms kept for the delta, older watermarks get a full sync
+
+
+# ROOM CACHE CONFIGS
+
+ROOM_CACHE_BACKEND = 'apps.chat.cache.LRUCacheBackend' # Or 'apps.chat.cache.DjangoCacheBackend'
+ROOM_CACHE_ALIAS = 'default' # CACHES alias used by DjangoCacheBackend
+ROOM_CACHE_MAX_ENTRIES = 5000
+ROOM_CACHE_TIMEOUT = 300 # seconds, safety net for writes that bypass the signals
+
+
+# CHUNKED UPLOAD CONFIGS
+
+UPLOAD_CHUNK_MAX_SIZE = 2 * 1024 * 1024 # 2MB per PATCH
+UPLOAD_EXPIRE_HOURS = 24 # Pending uploads without a chunk for this long are deleted by apply_retention
+
+
+# IMAGE PREVIEW CONFIGS
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_PLACEHOLDER_SIZE = 16
+THUMBNAIL_WORKERS = 2 # Processes in the preview pool
+
+
+# MEDIA SERVING CONFIGS
+
+STORAGES = {
+    'default': {'BACKEND': 'apps.chat.storage.SignedMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+MEDIA_PROTECTED_PREFIXES = ('blobs/', 'chat_images/', 'chat_files/', 'chat_thumbnails/') # Need a signed URL
+MEDIA_IMMUTABLE_PREFIXES = ('blobs/', 'avatars/') # Content-addressed, cached for a year
+MEDIA_URL_TTL = 60 * 60 # seconds a signed URL stays valid after its window, and so how long a removed member keeps access
+MEDIA_URL_WINDOW = 60 * 60 # seconds, signed URLs (and message list ETags) are stable within a window
+MEDIA_CACHE_MAX_AGE = 60 * 60 # seconds, for media that can change (avatars, thumbnails)
+MEDIA_OFFLOAD = None # 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd), None serves from Django
+MEDIA_ACCEL_PREFIX = '/protected-media/' # nginx internal location aliased to MEDIA_ROOT
+
+
+# AVATAR CONFIGS
+
+AVATAR_VARIANTS = {'small': 64, 'medium': 256} # Square sizes in pixels, 'small' goes in message payloads
+
+
+# API KEY CONFIGS
+
+API_KEY_CACHE_TTL = 30 # seconds a validated key is trusted without a query
+API_KEY_CACHE_MAX_ENTRIES = 1000
+API_KEY_USAGE_FLUSH_INTERVAL = 10 # seconds between usage_count writes
+
+
+# RATE LIMIT CONFIGS
+
+RATE_LIMIT_BACKEND = 'apps.user.ratelimit.LocalRateLimitBackend' # Or 'apps.user.ratelimit.CacheRateLimitBackend'
+RATE_LIMIT_CACHE_ALIAS = 'default' # CACHES alias used by CacheRateLimitBackend
+RATE_LIMIT_MAX_KEYS = 10000 # Buckets kept by LocalRateLimitBackend
+RATE_LIMIT_TRUST_FORWARDED = False # Take the client IP from X-Forwarded-For (behind a proxy)
+API_KEY_RATE_BURST = 100 # Requests an API key can send at once, ApiKey.rate_limit is per hour
+GUEST_AUTH_IP_RATE_LIMIT = 60 # Guest auths per hour per client IP and API key (0 = unlimited)
+LOGIN_IP_RATE_LIMIT = 60 # Login attempts per hour per client IP (0 = unlimited)
+RATE_LIMIT_IP_BURST = 10
+
+
+# GUEST AUTH CONFIGS
+
+GUEST_IDEMPOTENCY_CACHE_ALIAS = 'default' # Idempotency-Key replays, use a shared cache with several workers
+GUEST_IDEMPOTENCY_TTL = 24 * 60 * 60 # seconds
+
+
+# USER PROFILE CACHE CONFIGS
+
+USER_PROFILE_CACHE_TTL = 30 # seconds, name/avatar/type rendered in WebSocket payloads
+USER_PROFILE_CACHE_MAX_ENTRIES = 5000
+
+
+# MESSAGE ARCHIVE CONFIGS
+
+MESSAGE_ARCHIVE_AFTER_DAYS = 180 # Messages older than this move to the archive table
+MESSAGE_ARCHIVE_IDLE_SUPPORT_DAYS = 30 # Unassigned support rooms idle this long are archived whole
+MESSAGE_ARCHIVE_BATCH_SIZE = 500 # Messages moved per transaction
+
+
+# RETENTION CONFIGS
+
+RETENTION_ROOM_DAYS = {} # Room type -> days without activity before it is deleted, e.g. {'SUPPORT': 365}
+RETENTION_USER_DAYS = {'GUEST': 90} # User type code -> days inactive before the user and the rooms they created are deleted
+RETENTION_BATCH_SIZE = 200 # Rows deleted per transaction
+RETENTION_BATCH_PAUSE = 0.05 # seconds between transactions, lets other writers take the lock
+
+
+# MEDIA GARBAGE COLLECTOR CONFIGS
+
+MEDIA_GC_PREFIXES = ('chat_images/', 'chat_files/', 'chat_thumbnails/', 'blobs/', 'user/', 'avatars/', 'chat_uploads/') # Directories under MEDIA_ROOT the collector manages
+MEDIA_GC_GRACE_HOURS = 24 # Files modified more recently are never collected
+MEDIA_GC_FALSE_POSITIVE_RATE = 0.001 # Share of orphans the bloom filter may keep, memory grows as it shrinks
+MEDIA_GC_BATCH_SIZE = 500 # Orphans re-checked and removed per batch
+MEDIA_GC_QUARANTINE_ROOT = os.path.join(BASE_DIR, 'media_quarantine/') # --quarantine moves orphans here
+
+
+# ATTACHMENT SWEEP CONFIGS
+
+ATTACHMENT_SWEEP_GRACE_HOURS = 24 # Blobs used more recently are never reclaimed, an upload may be about to reference them
+ATTACHMENT_SWEEP_BATCH_SIZE = 500 # Blobs examined per batch
+
+
+# BULK MEMBERSHIP CONFIGS
+
+BULK_MEMBERS_MAX = 5000 # Users added or removed per request
+BULK_ROOMS_MAX = 200 # Rooms created per bulk request
+
+
+# BOOTSTRAP CONFIGS
+
+BOOTSTRAP_ROOMS = 20 # Rooms (and support chats) returned at startup
+BOOTSTRAP_MESSAGE_ROOMS = 3 # Top rooms whose first message page is included
+BOOTSTRAP_MESSAGES = 30 # Messages per included page
+
+
+# COMPRESSION CONFIGS
+
+COMPRESSION_ENCODINGS = ('zstd', 'br', 'gzip') # Server preference, zstd needs `zstandard` and br needs `brotli` installed
+COMPRESSION_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6} # Fast levels, JSON already compresses well there
+COMPRESSION_MIN_SIZE = 1024 # bytes, smaller bodies are sent as is
+COMPRESSION_CONTENT_TYPES = ('application/json', 'application/x-ndjson', 'application/vnd.oai.openapi', 'application/javascript', 'text/') # Entries ending in '/' match the whole type
+COMPRESSION_STREAM_FLUSH = 16 * 1024 # bytes of a streamed body compressed before a flush sends them
@@ -1,7 +1,6 @@
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
-from django.conf import settings
+from django.urls import path, re_path, include
+from apps.chat.media import serve_media
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
 urlpatterns = [
@@ -13,6 +12,7 @@ urlpatterns = [
     path('api/schema/', SpectacularAPIView.as_view(), name="schema"),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name="schema"), name="swagger"),
     path('api/redoc/', SpectacularRedocView.as_view(url_name="schema"), name="redoc"),
-]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # Media, signed URLs for chat content
+    re_path(r'^media/(?P<path>.+)$', serve_media, name="media"),
+]
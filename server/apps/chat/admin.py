@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChatRoom, ChatMessage
+from .models import ChatRoom, ChatMessage, ArchivedChatMessage, OutboxEvent, Attachment
 
 
 class ChatRoomAdmin(admin.ModelAdmin):
@@ -24,5 +24,24 @@ class ChatMessageAdmin(admin.ModelAdmin):
     list_filter = ('timestamp',)
     search_fields = ('message',)
 
+class ArchivedChatMessageAdmin(admin.ModelAdmin):
+
+    list_display = ('id', 'room', 'user', 'message', 'timestamp', 'archived_at')
+    list_filter = ('archived_at',)
+    search_fields = ('message',)
+
+class OutboxEventAdmin(admin.ModelAdmin):
+
+    list_display = ('id', 'created_at', 'dispatched_at', 'attempts')
+    list_filter = ('dispatched_at',)
+
+class AttachmentAdmin(admin.ModelAdmin):
+
+    list_display = ('sha256', 'file', 'size', 'content_type', 'last_used_at')
+    search_fields = ('sha256', 'file')
+
 admin.site.register(ChatRoom, ChatRoomAdmin)
-admin.site.register(ChatMessage, ChatMessageAdmin)
\ No newline at end of file
+admin.site.register(ChatMessage, ChatMessageAdmin)
+admin.site.register(ArchivedChatMessage, ArchivedChatMessageAdmin)
+admin.site.register(OutboxEvent, OutboxEventAdmin)
+admin.site.register(Attachment, AttachmentAdmin)
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Archive tier for chat messages.
+
+Old messages, and every message of support rooms nobody has touched for a
+while, are moved from ChatMessage to ArchivedChatMessage in small
+transactions so the hot table and its indexes stay small. History reads go
+through `MessageHistory`, which continues into the archive once a page
+passes the last hot message.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from V0X.settings import (
+    MESSAGE_ARCHIVE_AFTER_DAYS,
+    MESSAGE_ARCHIVE_IDLE_SUPPORT_DAYS,
+    MESSAGE_ARCHIVE_BATCH_SIZE
+)
+from .models import ChatRoom, ChatMessage, ArchivedChatMessage
+from datetime import timedelta
+
+# Columns copied as is, foreign keys by their raw id
+ARCHIVED_COLUMNS = [
+    field.attname for field in ArchivedChatMessage._meta.concrete_fields
+    if field.name != 'archived_at'
+]
+
+
+def archive_candidates(
+    now = None,
+    after_days = MESSAGE_ARCHIVE_AFTER_DAYS,
+    idle_support_days = MESSAGE_ARCHIVE_IDLE_SUPPORT_DAYS
+):
+
+    now = now or timezone.now()
+
+    return ChatMessage.objects.filter(
+        Q(timestamp__lt = now - timedelta(days = after_days)) |
+        Q(
+            room__type = ChatRoom.ChatType.SUPPORT,
+            room__assigned_agent__isnull = True,
+            room__updated_at__lt = now - timedelta(days = idle_support_days)
+        )
+    )
+
+
+def archive_batch(message_ids):
+    """
+    Copies the messages to the archive and deletes them from the hot table
+    in one transaction. Returns the number of messages moved.
+    """
+
+    now = timezone.now()
+
+    with transaction.atomic():
+
+        rows = list(ChatMessage.objects.filter(id__in = message_ids).values(*ARCHIVED_COLUMNS))
+        if not rows:
+            return 0
+
+        ArchivedChatMessage.objects.bulk_create([
+            ArchivedChatMessage(archived_at = now, **row) for row in rows
+        ])
+
+        # The delete signals invalidate the cached room payloads
+        ChatMessage.objects.filter(id__in = [row['id'] for row in rows]).delete()
+
+    return len(rows)
+
+
+def archive_messages(queryset = None, batch_size = MESSAGE_ARCHIVE_BATCH_SIZE):
+    """
+    Archives `queryset` (default: `archive_candidates()`) batch by batch.
+    Yields the number of messages moved by each batch.
+    """
+
+    if queryset is None:
+        queryset = archive_candidates()
+
+    last_id = 0
+
+    while True:
+
+        ids = list(
+            queryset.filter(id__gt = last_id).order_by('id').values_list('id', flat = True)[:batch_size]
+        )
+        if not ids:
+            return
+
+        yield archive_batch(ids)
+        last_id = ids[-1]
+
+
+class MessageHistory:
+    """
+    Newest-first history of a room: hot messages, then archived ones.
+    Supports `count()` and slicing, which is all LimitOffsetPagination
+    needs; the archive is only queried for pages past the hot window.
+    """
+
+    def __init__(self, hot, archived):
+
+        self.hot = hot
+        self.archived = archived
+        self._hot_count = None
+
+    def hot_count(self):
+
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def count(self):
+        return self.hot_count() + self.archived.count()
+
+    def values_list(self, *fields):
+        """
+        Same history as rows of `fields`, for read paths that skip models.
+        """
+
+        return MessageHistory(self.hot.values_list(*fields), self.archived.values_list(*fields))
+
+    def __getitem__(self, index):
+
+        if not isinstance(index, slice):
+            raise TypeError("MessageHistory only supports slicing")
+
+        start = index.start or 0
+        stop = index.stop
+        hot_count = self.hot_count()
+
+        results = []
+
+        if start < hot_count:
+            results.extend(self.hot[start:stop])
+
+        if stop is None or stop > hot_count:
+            archived_start = max(start - hot_count, 0)
+            archived_stop = None if stop is None else stop - hot_count
+            results.extend(self.archived[archived_start:archived_stop])
+
+        return results
+
+
+def room_history(room):
+
+    return MessageHistory(
+        ChatMessage.objects.filter(room = room).select_related('user').order_by('-timestamp'),
+        ArchivedChatMessage.objects.filter(room = room).select_related('user').order_by('-timestamp')
+    )
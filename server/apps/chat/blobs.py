@@ -0,0 +1,135 @@
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Attachment
+import hashlib
+import os
+
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def blob_name(digest, file_name):
+    """
+    Storage name of a blob: sharded by hash prefix, keeping the original
+    extension so the media server still guesses the content type.
+    """
+
+    extension = os.path.splitext(file_name or '')[1].lower()[:10]
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def hash_chunks(chunks):
+
+    hasher = hashlib.sha256()
+    size = 0
+
+    for chunk in chunks:
+        hasher.update(chunk)
+        size += len(chunk)
+
+    return hasher.hexdigest(), size
+
+
+def hash_path(path):
+
+    with open(path, 'rb') as source:
+        return hash_chunks(iter(lambda: source.read(HASH_BLOCK_SIZE), b''))
+
+
+def find_blob(digest):
+    """
+    Existing attachment for a hash, only if its file is still on disk.
+    """
+
+    attachment = Attachment.objects.filter(sha256 = digest).first()
+
+    if attachment and default_storage.exists(attachment.file.name):
+        Attachment.objects.filter(id = attachment.id).update(last_used_at = timezone.now())
+        return attachment
+    return None
+
+
+def register_blob(digest, name, size, content_type):
+
+    try:
+        with transaction.atomic():
+            attachment, _ = Attachment.objects.update_or_create(
+                sha256 = digest,
+                defaults = {
+                    'file': name,
+                    'size': size,
+                    'content_type': content_type,
+                    'last_used_at': timezone.now(),
+                }
+            )
+    except IntegrityError:
+        # A concurrent upload of the same content registered it first
+        attachment = Attachment.objects.get(sha256 = digest)
+
+    return attachment
+
+
+def store_uploaded_file(uploaded_file, content_type):
+    """
+    Hashes an UploadedFile and stores it once per content. A repeated
+    upload costs one read pass and no write.
+    """
+
+    digest, size = hash_chunks(uploaded_file.chunks())
+
+    attachment = find_blob(digest)
+    if attachment:
+        return attachment
+
+    name = blob_name(digest, uploaded_file.name)
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        file_move_safe(uploaded_file.temporary_file_path(), target, allow_overwrite=True)
+    else:
+        with open(target, 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                destination.write(chunk)
+
+    return register_blob(digest, name, size, content_type)
+
+
+def store_path(path, file_name, content_type):
+    """
+    Same as `store_uploaded_file` for a file already on disk (finished
+    chunked uploads). The file is renamed into place or removed if the
+    content is already stored.
+    """
+
+    digest, size = hash_path(path)
+
+    attachment = find_blob(digest)
+    if attachment:
+        os.remove(path)
+        return attachment
+
+    name = blob_name(digest, file_name)
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+
+    return register_blob(digest, name, size, content_type)
+
+
+def attachment_fields(attachment, is_image, file_name):
+    """
+    ChatMessage fields pointing at a stored blob.
+    """
+
+    if is_image:
+        return {'image': attachment.file.name, 'attachment': attachment}
+
+    return {
+        'file': attachment.file.name,
+        'attachment': attachment,
+        'file_name': file_name,
+        'file_type': attachment.content_type,
+        'file_size': attachment.size,
+    }
@@ -0,0 +1,143 @@
+"""
+Everything the client needs to draw its first screen, in one response and
+a fixed number of queries: the rooms, their unread counts, last messages
+and first message pages are each loaded for all rooms at once.
+"""
+from django.db.models import Q, F, Count, Exists, OuterRef, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
+from apps.user.models import OnlineUser
+from apps.user.loader import get_request_user
+from apps.user.serializers import ProfileSerializer
+from V0X.settings import BOOTSTRAP_ROOMS, BOOTSTRAP_MESSAGE_ROOMS, BOOTSTRAP_MESSAGES
+from .models import ChatRoom, ChatMessage, ArchivedChatMessage
+from .serializers import ChatRoomSerializer, ChatMessageSerializer
+from .fieldsets import UserDirectory, is_compact
+
+
+def user_room_queryset(user):
+    """
+    Rooms listed for `user`: the ones they belong to, except support chats,
+    that have messages or that they created. Newest first.
+    """
+
+    # Rooms whose whole history was archived are still listed
+    has_messages = Exists(ChatMessage.objects.filter(room=OuterRef('pk')))
+    has_archived = Exists(ArchivedChatMessage.objects.filter(room=OuterRef('pk')))
+
+    return ChatRoom.objects.filter(
+        member = user
+    ).exclude(
+        type = ChatRoom.ChatType.SUPPORT
+    ).filter(
+        has_messages | has_archived | Q(created_by=user)
+    ).distinct().order_by('-updated_at')
+
+
+def unread_counts(room_ids, user):
+    """
+    {room id: messages from others after the user's read mark}, one query.
+    """
+
+    return dict(
+        ChatMessage.objects.filter(
+            room_id__in = room_ids,
+            room__memberships__user = user,
+            timestamp__gt = F('room__memberships__last_read_at')
+        ).exclude(
+            user_id = user.id
+        ).values('room_id').annotate(
+            count = Count('id')
+        ).values_list('room_id', 'count')
+    )
+
+
+def ranked_messages(model, room_ids, per_room):
+    """
+    Newest `per_room` rows of `model` for each room, one query.
+    """
+
+    return model.objects.filter(
+        room_id__in = room_ids
+    ).annotate(
+        rank = Window(RowNumber(), partition_by = F('room_id'), order_by = F('timestamp').desc())
+    ).filter(
+        rank__lte = per_room
+    ).select_related('user').order_by('room_id', 'rank')
+
+
+def latest_messages(room_ids, per_room):
+    """
+    {room id: newest `per_room` messages, newest first}. Like room_history,
+    rooms with fewer hot messages continue into the archive; two queries
+    at most.
+    """
+
+    messages = {room_id: [] for room_id in room_ids}
+    for message in ranked_messages(ChatMessage, room_ids, per_room):
+        messages[message.room_id].append(message)
+
+    # Archived messages are older than every hot one of their room
+    short = [room_id for room_id, found in messages.items() if len(found) < per_room]
+    if short:
+        for message in ranked_messages(ArchivedChatMessage, short, per_room):
+            if len(messages[message.room_id]) < per_room:
+                messages[message.room_id].append(message)
+
+    return messages
+
+
+def build_bootstrap(
+    request,
+    rooms_limit = BOOTSTRAP_ROOMS,
+    message_rooms = BOOTSTRAP_MESSAGE_ROOMS,
+    page_size = BOOTSTRAP_MESSAGES
+):
+
+    user = get_request_user(request)
+
+    rooms = list(user_room_queryset(user)[:rooms_limit])
+    support = []
+    if not user.is_guest():
+        support = list(ChatRoom.objects.filter(type = ChatRoom.ChatType.SUPPORT).order_by('-updated_at')[:rooms_limit])
+
+    all_rooms = list({room.id: room for room in rooms + support}.values())
+    room_ids = [room.id for room in all_rooms]
+
+    prefetch_related_objects(all_rooms, 'member')
+    last_messages = {
+        room_id: messages[0]
+        for room_id, messages in latest_messages(room_ids, 1).items() if messages
+    }
+
+    # One extra message tells whether older ones exist
+    page_rooms = rooms[:message_rooms]
+    pages = latest_messages([room.id for room in page_rooms], page_size + 1)
+
+    users = UserDirectory() if is_compact(request) else None
+    context = {
+        'request': request,
+        'unread_counts': unread_counts(room_ids, user),
+        'last_messages': last_messages,
+        'users': users,
+    }
+
+    payload = {
+        'profile': ProfileSerializer(user, context = {'request': request}).data,
+        'rooms': ChatRoomSerializer(rooms, many = True, context = context).data,
+        'support': ChatRoomSerializer(support, many = True, context = context).data,
+        'messages': {
+            room.roomId: {
+                'results': ChatMessageSerializer(
+                    pages[room.id][:page_size], many = True, context = {'request': request, 'users': users}
+                ).data,
+                'hasMore': len(pages[room.id]) > page_size,
+            }
+            for room in page_rooms
+        },
+        'onlineUsers': list(OnlineUser.objects.values_list('user_id', flat = True)),
+    }
+
+    if users is not None:
+        payload['users'] = users.data(request)
+
+    return payload
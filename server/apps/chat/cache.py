@@ -0,0 +1,164 @@
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from V0X.settings import (
+    ROOM_CACHE_BACKEND,
+    ROOM_CACHE_MAX_ENTRIES,
+    ROOM_CACHE_TIMEOUT,
+    ROOM_CACHE_ALIAS
+)
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCacheBackend:
+    """
+    In-process LRU bounded to `max_entries` rooms.
+    """
+
+    def __init__(self, max_entries = ROOM_CACHE_MAX_ENTRIES, timeout = ROOM_CACHE_TIMEOUT):
+
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+
+    def size(self):
+        return len(self.entries)
+
+
+class DjangoCacheBackend:
+    """
+    Stores the payloads in a Django cache (CACHES[ROOM_CACHE_ALIAS]), shared
+    between processes when that cache is. Size bounds come from its OPTIONS.
+    The alias may hold other data (rate limits, idempotency keys), so
+    `clear` bumps the version of the room keys instead of clearing it.
+    """
+
+    prefix = "chat:room:"
+    version_key = "chat:room:version"
+
+    def __init__(self, alias = ROOM_CACHE_ALIAS, timeout = ROOM_CACHE_TIMEOUT):
+
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.evictions = 0
+
+    def version(self):
+        return self.cache.get_or_set(self.version_key, 1, None)
+
+    def get(self, key):
+        return self.cache.get(self.prefix + str(key), version = self.version())
+
+    def set(self, key, value):
+        self.cache.set(self.prefix + str(key), value, self.timeout, version = self.version())
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.prefix + str(key) for key in keys], version = self.version())
+
+    def clear(self):
+
+        # Entries of older versions are never read again and expire
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.set(self.version_key, 2, None)
+
+    def size(self):
+        return None
+
+
+class RoomPayloadCache:
+    """
+    Serialized ChatRoom payloads without the per-user fields, keyed by room
+    id. Each entry holds one payload per media base URL, because nested
+    user images are absolute URLs.
+    """
+
+    def __init__(self, backend):
+
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, room_id, variant):
+
+        payloads = self.backend.get(room_id)
+
+        if payloads is not None and variant in payloads:
+            self.hits += 1
+            return payloads[variant]
+
+        self.misses += 1
+        return None
+
+    def set(self, room_id, variant, payload):
+
+        payloads = self.backend.get(room_id) or {}
+        payloads[variant] = payload
+        self.backend.set(room_id, payloads)
+
+    def invalidate(self, *room_ids):
+
+        room_ids = [room_id for room_id in room_ids if room_id is not None]
+
+        if room_ids:
+            self.backend.delete_many(room_ids)
+            self.invalidations += len(room_ids)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+            'evictions': self.backend.evictions,
+            'size': self.backend.size(),
+        }
+
+
+room_cache = RoomPayloadCache(import_string(ROOM_CACHE_BACKEND)())
@@ -0,0 +1,257 @@
+"""
+Response compression for the API.
+
+Room lists, message pages and exports are large and very repetitive JSON,
+they shrink to a fraction of their size. `CompressionMiddleware` picks the
+best encoding both sides support (zstd and Brotli when their modules are
+installed, gzip always) and leaves alone bodies under
+COMPRESSION_MIN_SIZE, content types outside COMPRESSION_CONTENT_TYPES
+(images, video and archives are already compressed), media files served
+with byte ranges and responses that are already encoded. Streamed
+responses are compressed chunk by chunk and flushed every
+COMPRESSION_STREAM_FLUSH bytes, the body is never held in memory.
+"""
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from V0X.settings import (
+    COMPRESSION_ENCODINGS,
+    COMPRESSION_LEVELS,
+    COMPRESSION_MIN_SIZE,
+    COMPRESSION_CONTENT_TYPES,
+    COMPRESSION_STREAM_FLUSH
+)
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipStream:
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def write(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliStream:
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality = level)
+
+    def write(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdStream:
+
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level = level).compressobj()
+
+    def write(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+STREAMS = {
+    'gzip': GzipStream,
+    'br': BrotliStream if brotli else None,
+    'zstd': ZstdStream if zstandard else None,
+}
+
+
+def available_encodings(preference = COMPRESSION_ENCODINGS):
+    """
+    Encodings of `preference` whose module is installed, in order.
+    """
+
+    return [encoding for encoding in preference if STREAMS.get(encoding)]
+
+
+def open_stream(encoding, levels = COMPRESSION_LEVELS):
+    return STREAMS[encoding](levels[encoding])
+
+
+def compress(data, encoding, levels = COMPRESSION_LEVELS):
+
+    stream = open_stream(encoding, levels)
+    return stream.write(data) + stream.finish()
+
+
+def parse_accept_encoding(header):
+    """
+    {coding: q} of an Accept-Encoding header.
+    """
+
+    accepted = {}
+
+    for part in header.split(','):
+
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+
+        accepted[coding] = quality
+
+    return accepted
+
+
+def negotiate(header, encodings):
+    """
+    Encoding of `encodings` (server preference order) the client ranks
+    highest, None when it accepts none of them.
+    """
+
+    accepted = parse_accept_encoding(header or '')
+    wildcard = accepted.get('*', 0.0)
+
+    best, best_quality = None, 0.0
+
+    for encoding in encodings:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+def is_compressible(content_type, content_types = COMPRESSION_CONTENT_TYPES):
+
+    mime = content_type.split(';')[0].strip().lower()
+
+    return any(
+        mime.startswith(allowed) if allowed.endswith('/') else mime == allowed
+        for allowed in content_types
+    )
+
+
+def compress_chunks(chunks, stream, flush_size = COMPRESSION_STREAM_FLUSH):
+
+    pending = 0
+
+    for chunk in chunks:
+
+        data = stream.write(chunk)
+        pending += len(chunk)
+
+        if pending >= flush_size:
+            data += stream.flush()
+            pending = 0
+
+        if data:
+            yield data
+
+    yield stream.finish()
+
+
+async def compress_chunks_async(chunks, stream, flush_size = COMPRESSION_STREAM_FLUSH):
+
+    pending = 0
+
+    async for chunk in chunks:
+
+        data = stream.write(chunk)
+        pending += len(chunk)
+
+        if pending >= flush_size:
+            data += stream.flush()
+            pending = 0
+
+        if data:
+            yield data
+
+    yield stream.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Place it above the middleware that read or change response bodies.
+    """
+
+    encodings = available_encodings()
+
+    def skip(self, response):
+
+        return (
+            response.has_header('Content-Encoding')
+            # Media files, their byte ranges are offsets in the stored file
+            or response.has_header('Accept-Ranges')
+            or response.has_header('Content-Range')
+            or response.has_header('X-Accel-Redirect')
+            or response.has_header('X-Sendfile')
+            or 'no-transform' in response.get('Cache-Control', '')
+            or not is_compressible(response.get('Content-Type', ''))
+            or (not response.streaming and len(response.content) < COMPRESSION_MIN_SIZE)
+        )
+
+    def process_response(self, request, response):
+
+        if self.skip(response):
+            return response
+
+        # The body now depends on the request's Accept-Encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'), self.encodings)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            stream = open_stream(encoding)
+            if response.is_async:
+                response.streaming_content = compress_chunks_async(response.streaming_content, stream)
+            else:
+                response.streaming_content = compress_chunks(response.streaming_content, stream)
+
+            # Unknown until the last chunk
+            del response.headers['Content-Length']
+        else:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Another representation of the same resource (RFC 9110 8.8.1),
+        # If-None-Match still matches it with the weak comparison
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,115 @@
+from django.db.models import Max, Count
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from apps.user.models import User
+from .models import ChatMessage, ChatRoomMembership
+from .storage import media_url_window
+import hashlib
+
+
+def make_etag(*parts):
+    return hashlib.md5(
+        ":".join(str(part) for part in parts).encode('utf-8')
+    ).hexdigest()
+
+
+def room_list_validators(rooms, user, *extra):
+    """
+    Cheap validators for a list of rooms as seen by `user`: room state,
+    latest message and the user's read marks. Three aggregate queries,
+    no serialization.
+    """
+
+    room_ids = rooms.order_by().values('id')
+
+    room_stats = rooms.model.objects.filter(id__in = room_ids).aggregate(
+        updated = Max('updated_at'),
+        count = Count('id')
+    )
+    last_message_id = ChatMessage.objects.filter(
+        room__in = room_ids
+    ).aggregate(last = Max('id'))['last']
+    last_read_at = ChatRoomMembership.objects.filter(
+        user = user,
+        room__in = room_ids
+    ).aggregate(last = Max('last_read_at'))['last']
+
+    etag = make_etag(
+        user.id, room_stats['count'], room_stats['updated'],
+        last_message_id, last_read_at, *extra
+    )
+    moments = [moment for moment in (room_stats['updated'], last_read_at) if moment]
+    last_modified = max(moments) if moments else None
+
+    return etag, last_modified
+
+
+def message_list_validators(room, user, *extra):
+    """
+    Validators for the message history of `room`. Authors' names and
+    avatars are in the payload, so the latest profile change among the
+    authors of hot messages is part of it. Authors seen only on archived
+    pages are not (that would read the whole archive of the room), their
+    changes show once the media window below rolls over.
+    """
+
+    messages = ChatMessage.objects.filter(room = room)
+
+    stats = messages.aggregate(
+        last = Max('id'),
+        count = Count('id')
+    )
+    authors_updated = User.objects.filter(
+        id__in = messages.order_by().values('user_id')
+    ).aggregate(last = Max('updated_at'))['last']
+
+    # Media URLs in the payload are re-signed every window
+    etag = make_etag(
+        user.id, room.id, room.updated_at, room.messages_updated_at,
+        stats['last'], stats['count'], authors_updated, media_url_window(), *extra
+    )
+    moments = [
+        moment for moment in (room.updated_at, room.messages_updated_at, authors_updated) if moment
+    ]
+
+    return etag, max(moments) if moments else None
+
+
+class ConditionalGetMixin:
+    """
+    Answers GET with 304 Not Modified when the client's validators match,
+    before the queryset is evaluated or the serializer runs.
+    """
+
+    def get_validators(self, request):
+        """
+        Returns (etag, last_modified), or None to skip conditional handling.
+        """
+        return None
+
+    def conditional_get(self, request, handler, *args, **kwargs):
+
+        validators = self.get_validators(request)
+
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request,
+            etag = quote_etag(etag),
+            last_modified = timestamp
+        )
+
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+            if timestamp:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, private = True, no_cache = True)
+
+        return response
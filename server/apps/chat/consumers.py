@@ -1,7 +1,9 @@
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from .models import ChatRoom, ChatMessage
+from .writer import database_write_to_async
 from apps.user.models import User, OnlineUser
+from apps.user.loader import user_profile
 from django.utils import timezone
 import json
 
@@ -14,17 +16,16 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def getOnlineUsers(self):
 
-        onlineUsers = OnlineUser.objects.all()
-        return [onlineUser.user.id for onlineUser in onlineUsers]
+        return list(OnlineUser.objects.values_list('user_id', flat=True))
     
-    @database_sync_to_async
+    @database_write_to_async
     def addOnlineUsers(self, user):
         try:
             OnlineUser.objects.create(user=user)
         except:
             pass
     
-    @database_sync_to_async
+    @database_write_to_async
     def deleteOnlineUser(self, user):
         try:
             OnlineUser.objects.get(user=user).delete()
@@ -44,24 +45,24 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except ChatRoom.DoesNotExist:
             return []
     
-    @database_sync_to_async
+    @database_write_to_async
     def saveMessage(self, message, id, roomId, image=None):
 
-        userObj = User.objects.get(id=id)
+        profile = user_profile(id)
         chatObj = ChatRoom.objects.get(roomId=roomId)
         ChatMessageObj = ChatMessage.objects.create(
-            room=chatObj, user=userObj, message=message
+            room=chatObj, user_id=profile['id'], message=message
         )
         chatObj.save(update_fields = ['updated_at'])
         data = {
             'action': 'message',
-            'user': userObj.id,
-            'userId': userObj.id,
+            'user': profile['id'],
+            'userId': profile['id'],
             'roomId': roomId,
             'message': message,
             'chatType': chatObj.type,
-            'userImage': userObj.image.url if userObj.image else None,
-            'userName': userObj.first_name + " " + userObj.last_name,
+            'userImage': profile['userImage'],
+            'userName': profile['userName'],
             'timestamp': str(ChatMessageObj.timestamp),
             'image': image
         }
@@ -200,4 +201,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     async def chat_message(self, event):
         message = event['message']
+
+        # Membership changes made through the API move this socket in or out of the room group
+        action = message.get('action') if isinstance(message, dict) else None
+        if action in ('members_added', 'members_removed') and self.user.id in message['userIds']:
+            if action == 'members_added':
+                await self.channel_layer.group_add(message['roomId'], self.channel_name)
+            else:
+                await self.channel_layer.group_discard(message['roomId'], self.channel_name)
+
         await self.send(text_data=json.dumps(message))
\ No newline at end of file
@@ -0,0 +1,194 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+from V0X.settings import MEDIA_URL, EXPORT_CHUNK_SIZE
+from .models import ChatMessage, ArchivedChatMessage
+from .storage import signed_name
+import csv
+import itertools
+import json
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+EXPORT_FIELDS = [
+    'messageId', 'roomId', 'userId', 'userName', 'message', 'timestamp',
+    'image', 'file', 'fileName', 'fileType', 'fileSize'
+]
+
+_VALUES = [
+    'id', 'room__roomId', 'user_id', 'user__first_name', 'user__last_name',
+    'message', 'timestamp', 'image', 'file', 'file_name', 'file_type', 'file_size'
+]
+
+
+def parse_bound(value):
+    """
+    Accepts an ISO-8601 date or datetime, returns an aware datetime.
+    """
+
+    if not value:
+        return None
+
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{value}' is not a valid ISO-8601 date or datetime.")
+        moment = datetime.combine(day, time.min)
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def transcript_queryset(room = None, since = None, until = None, model = ChatMessage):
+
+    queryset = model.objects.all()
+
+    if room is not None:
+        queryset = queryset.filter(room = room)
+    if since:
+        queryset = queryset.filter(timestamp__gte = since)
+    if until:
+        queryset = queryset.filter(timestamp__lt = until)
+
+    return queryset
+
+
+def transcript_querysets(room = None, since = None, until = None):
+    """
+    Archived messages first (they are the older ones), then the hot table.
+    """
+
+    return [
+        transcript_queryset(room, since, until, model = ArchivedChatMessage),
+        transcript_queryset(room, since, until),
+    ]
+
+
+def fetch_chunk(queryset, last = None, chunk_size = EXPORT_CHUNK_SIZE):
+    """
+    Next `chunk_size` message rows after `last` (timestamp, id), as a
+    fresh keyset query: no offset scans and no cursor held open.
+    """
+
+    if last:
+        queryset = queryset.filter(
+            Q(timestamp__gt = last[0]) | Q(timestamp = last[0], id__gt = last[1])
+        )
+
+    return list(queryset.order_by('timestamp', 'id').values(*_VALUES)[:chunk_size])
+
+
+def next_key(rows, chunk_size):
+    """
+    Keyset position after `rows`, None when it was the last chunk.
+    """
+
+    if len(rows) < chunk_size:
+        return None
+    return (rows[-1]['timestamp'], rows[-1]['id'])
+
+
+def iter_transcript(queryset, chunk_size = EXPORT_CHUNK_SIZE):
+    """
+    Yields message rows in (timestamp, id) order, chunk by chunk.
+    """
+
+    last = None
+
+    while True:
+
+        rows = fetch_chunk(queryset, last, chunk_size)
+
+        for row in rows:
+            yield row
+
+        last = next_key(rows, chunk_size)
+        if last is None:
+            return
+
+
+def build_row(row, media_base = MEDIA_URL):
+
+    user_name = None
+    if row['user_id']:
+        user_name = f"{row['user__first_name']} {row['user__last_name']}"
+
+    return {
+        'messageId': row['id'],
+        'roomId': row['room__roomId'],
+        'userId': row['user_id'],
+        'userName': user_name,
+        'message': row['message'],
+        'timestamp': row['timestamp'].isoformat(),
+        'image': media_base + signed_name(row['image']) if row['image'] else None,
+        'file': media_base + signed_name(row['file']) if row['file'] else None,
+        'fileName': row['file_name'],
+        'fileType': row['file_type'],
+        'fileSize': row['file_size'],
+    }
+
+
+class _Echo:
+
+    def write(self, value):
+        return value
+
+
+def render_ndjson(rows, media_base = MEDIA_URL):
+
+    for row in rows:
+        yield json.dumps(build_row(row, media_base)) + "\n"
+
+
+def render_csv(rows, media_base = MEDIA_URL):
+
+    writer = csv.DictWriter(_Echo(), fieldnames = EXPORT_FIELDS)
+    yield writer.writeheader()
+
+    for row in rows:
+        yield writer.writerow(build_row(row, media_base))
+
+
+def render_transcript(querysets, export_format, media_base = MEDIA_URL):
+
+    rows = itertools.chain.from_iterable(iter_transcript(queryset) for queryset in querysets)
+
+    if export_format == 'csv':
+        return render_csv(rows, media_base)
+    return render_ndjson(rows, media_base)
+
+
+async def stream_transcript(querysets, export_format, media_base = MEDIA_URL, chunk_size = EXPORT_CHUNK_SIZE):
+    """
+    `render_transcript` for StreamingHttpResponse under ASGI. Django would
+    drain a sync iterator into a list before sending it, this one fetches
+    a chunk in a worker thread, sends it and only then fetches the next,
+    so memory stays at one chunk.
+    """
+
+    fetch = sync_to_async(fetch_chunk)
+
+    if export_format == 'csv':
+        writer = csv.DictWriter(_Echo(), fieldnames = EXPORT_FIELDS)
+        yield writer.writeheader()
+        render_row = lambda row: writer.writerow(build_row(row, media_base))
+    else:
+        render_row = lambda row: json.dumps(build_row(row, media_base)) + "\n"
+
+    for queryset in querysets:
+
+        last = None
+
+        while True:
+
+            rows = await fetch(queryset, last, chunk_size)
+            if rows:
+                yield ''.join(render_row(row) for row in rows)
+
+            last = next_key(rows, chunk_size)
+            if last is None:
+                break
@@ -0,0 +1,109 @@
+"""
+Read path for message history that skips DRF serializers.
+
+A page of history is the bulk of what clients download, and building it
+through ChatMessageSerializer costs more than the query: a model instance
+per row, a field object call per column and a `build_absolute_uri` per
+media URL. `render_messages` builds the same dictionaries from
+`values_list` rows, with the absolute media base computed once per
+request. It honours the `?fields=` and `?compact=` context of
+apps.chat.fieldsets. ChatMessageSerializer stays the reference, writes
+and every other payload still go through it.
+"""
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from V0X.settings import MEDIA_URL
+from .storage import is_protected, signed_query
+
+MESSAGE_COLUMNS = (
+    'user_id', 'user__first_name', 'user__last_name', 'user__image', 'user__image_variants',
+    'message', 'timestamp', 'image', 'thumbnail', 'image_width', 'image_height',
+    'image_placeholder', 'file', 'file_name', 'file_type', 'file_size',
+)
+
+# Same rendering (timezone, ISO 8601, 'Z') as the serializer field
+_timestamp = serializers.DateTimeField()
+
+
+def media_url(name, base):
+    """
+    What `request.build_absolute_uri(storage.url(name))` returns, given the
+    absolute MEDIA_URL as `base`.
+    """
+
+    url = base + filepath_to_uri(name).lstrip('/')
+
+    if is_protected(name):
+        url = f"{url}?{signed_query(name)}"
+
+    return url
+
+
+def message_rows(history):
+    """
+    Rows for `render_messages`, from a message queryset or MessageHistory.
+    """
+
+    return history.values_list(*MESSAGE_COLUMNS)
+
+
+def render_messages(rows, context):
+    """
+    ChatMessageSerializer(many = True) output for rows of MESSAGE_COLUMNS.
+    """
+
+    request = context.get('request')
+    wanted = context.get('fields')
+    users = context.get('users')
+
+    base = request.build_absolute_uri(MEDIA_URL) if request else MEDIA_URL
+    timestamp = _timestamp.to_representation
+    data = []
+
+    for (
+        user_id, first_name, last_name, avatar, variants,
+        message, moment, image, thumbnail, width, height,
+        placeholder, file, file_name, file_type, file_size
+    ) in rows:
+
+        item = {
+            'user': user_id,
+            'userId': user_id,
+            'message': message,
+            'timestamp': timestamp(moment),
+        }
+
+        # Compact payloads describe the author once, in the response `users`
+        if users is None:
+            if user_id is None:
+                item['userName'] = "User not found"
+                item['userImage'] = None
+            else:
+                item['userName'] = f"{first_name} - {last_name}"
+                if avatar:
+                    # User.avatar_url()
+                    if variants and 'small' in variants:
+                        avatar = variants['small']
+                    item['userImage'] = media_url(avatar, base)
+                else:
+                    item['userImage'] = None
+
+        item['image'] = media_url(image, base) if image else None
+        item['thumbnail'] = media_url(thumbnail, base) if thumbnail else None
+        item['imageWidth'] = width
+        item['imageHeight'] = height
+        item['placeholder'] = placeholder
+        item['file'] = media_url(file, base) if file else None
+        item['fileName'] = file_name
+        item['fileType'] = file_type
+        item['fileSize'] = file_size
+
+        if wanted:
+            item = {name: value for name, value in item.items() if name in wanted}
+
+        if users is not None and 'userId' in item:
+            users.add(user_id)
+
+        data.append(item)
+
+    return data
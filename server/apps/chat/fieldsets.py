@@ -0,0 +1,153 @@
+"""
+Sparse fieldsets (`?fields=a,b`) and compact payloads (`?compact=1`) for
+read endpoints.
+
+Views opt in through the serializer context (`fieldset_context`). Fields
+that were not asked for are removed from the serializer before anything
+is rendered, so their SerializerMethodFields never run. In compact mode
+users are referenced by id and described once per response in a `users`
+dictionary (`UserDirectory`).
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from apps.user.models import User
+from apps.user.serializers import UserSerializer
+
+COMPACT_VALUES = ('1', 'true', 'yes')
+
+
+def requested_fields(request):
+
+    value = request.query_params.get('fields') if request else None
+    if not value:
+        return None
+
+    return frozenset(name.strip() for name in value.split(',') if name.strip()) or None
+
+
+def is_compact(request):
+    return bool(request) and request.query_params.get('compact', '').lower() in COMPACT_VALUES
+
+
+class UserDirectory:
+    """
+    Users referenced by a compact response. Ids are collected while
+    serializing and loaded in one query at the end.
+    """
+
+    def __init__(self):
+        self.ids = set()
+
+    def add(self, *user_ids):
+        self.ids.update(user_id for user_id in user_ids if user_id is not None)
+
+    def data(self, request):
+
+        users = User.objects.filter(id__in = self.ids).order_by('id')
+        directory = {}
+
+        for user in users:
+            entry = UserSerializer(user, context = {'request': request}).data
+            entry['userName'] = f"{user.first_name} - {user.last_name}"
+            entry['userImage'] = request.build_absolute_uri(user.avatar_url()) if user.image else None
+            directory[str(user.id)] = entry
+
+        return directory
+
+
+def fieldset_context(request):
+    """
+    Serializer context entries enabling `?fields=` and `?compact=` for a
+    read request.
+    """
+
+    return {
+        'fields': requested_fields(request),
+        'users': UserDirectory() if is_compact(request) else None,
+    }
+
+
+class SparseFieldsetMixin:
+    """
+    For ModelSerializers rendered by opted-in views. `compact_fields` maps
+    a field to its compact replacement, `None` drops it.
+    """
+
+    compact_fields = {}
+
+    def get_fields(self):
+
+        fields = super().get_fields()
+
+        wanted = self.context.get('fields')
+        if wanted:
+            for name in list(fields):
+                if name not in wanted and not fields[name].write_only:
+                    del fields[name]
+
+        if self.context.get('users') is not None:
+            for name, replacement in self.compact_fields.items():
+                if name not in fields:
+                    continue
+                if replacement is None:
+                    del fields[name]
+                else:
+                    fields[name] = replacement()
+
+        return fields
+
+    def fieldset_key(self):
+        """
+        Identifies the requested shape, for caches of rendered payloads.
+        """
+
+        wanted = self.context.get('fields')
+        compact = self.context.get('users') is not None
+
+        return f"{','.join(sorted(wanted)) if wanted else '*'}:{'compact' if compact else 'full'}"
+
+
+class MemberIdsField(serializers.Field):
+    """
+    Compact `member`: user ids instead of nested users.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, members):
+        return [user.id for user in members.all()]
+
+
+class FieldsetViewMixin:
+    """
+    For generic list views: GET requests get `?fields=` and `?compact=`,
+    compact pages carry the `users` dictionary next to `results`.
+    """
+
+    def get_fieldset_context(self):
+
+        if not hasattr(self, '_fieldset_context'):
+            self._fieldset_context = fieldset_context(self.request)
+        return self._fieldset_context
+
+    def get_serializer_context(self):
+
+        context = super().get_serializer_context()
+
+        # Writes always see every field
+        if self.request.method in SAFE_METHODS:
+            context.update(self.get_fieldset_context())
+
+        return context
+
+    def get_paginated_response(self, data):
+
+        response = super().get_paginated_response(data)
+
+        users = self.get_fieldset_context()['users']
+        if users is not None:
+            response.data['users'] = users.data(self.request)
+
+        return response
@@ -0,0 +1,45 @@
+"""
+Image work that runs inside the preview process pool. Only Pillow and the
+standard library are used here, no Django, so worker processes start fast
+and never touch the database.
+"""
+from PIL import Image, ImageFilter, ImageOps
+import base64
+import io
+import os
+
+
+def render_previews(source_path, thumbnail_path, thumbnail_size, placeholder_size):
+    """
+    Writes a resized WEBP thumbnail and returns the original dimensions plus
+    a tiny blurred placeholder as a data URI.
+    """
+
+    with Image.open(source_path) as image:
+
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
+
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        thumbnail.save(thumbnail_path, 'WEBP', quality=80, method=4)
+
+        placeholder = image.convert('RGB')
+        placeholder.thumbnail((placeholder_size, placeholder_size), Image.Resampling.BILINEAR)
+        placeholder = placeholder.filter(ImageFilter.GaussianBlur(1))
+
+        buffer = io.BytesIO()
+        placeholder.save(buffer, 'JPEG', quality=50)
+
+    return {
+        'width': width,
+        'height': height,
+        'thumbnail_width': thumbnail.width,
+        'thumbnail_height': thumbnail.height,
+        'placeholder': "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode('ascii'),
+    }
@@ -0,0 +1,232 @@
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from apps.user.models import User
+from V0X.settings import BULK_INGEST_CHUNK_SIZE, BULK_INGEST_MAX_ERRORS
+from .models import ChatRoom, ChatMessage
+from .outbox import publish_events, user_groups
+from .cache import room_cache
+import json
+
+
+class MessageIngestor:
+    """
+    Loads NDJSON messages in chunks. Each line looks like:
+
+        {"roomId": "...", "userId": 1, "message": "...", "timestamp": "ISO-8601"}
+
+    `userId` defaults to the caller and `timestamp` to now. Invalid lines are
+    reported and skipped, the rest of the batch is still written.
+    """
+
+    def __init__(self, default_user, fanout = True, chunk_size = BULK_INGEST_CHUNK_SIZE):
+
+        self.default_user = default_user
+        self.fanout = fanout
+        self.chunk_size = chunk_size
+
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+        self.rooms = {}
+        self.room_members = {}
+        self.touched_rooms = set()
+
+    def ingest(self, lines):
+
+        chunk = []
+
+        for number, line in lines:
+            chunk.append((number, line))
+
+            if len(chunk) >= self.chunk_size:
+                self.process_chunk(chunk)
+                chunk = []
+
+        if chunk:
+            self.process_chunk(chunk)
+
+        self.touch_rooms()
+
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'rooms': len(self.touched_rooms),
+            'errors': sorted(self.errors, key = lambda error: error['line']),
+            'errorsTruncated': self.failed > len(self.errors),
+        }
+
+    def add_error(self, number, error):
+
+        self.failed += 1
+        if len(self.errors) < BULK_INGEST_MAX_ERRORS:
+            self.errors.append({'line': number, 'error': error})
+
+    def parse_line(self, number, line):
+
+        try:
+            item = json.loads(line)
+        except (ValueError, UnicodeDecodeError):
+            self.add_error(number, "Invalid JSON.")
+            return None
+
+        if not isinstance(item, dict):
+            self.add_error(number, "Each line must be a JSON object.")
+            return None
+
+        if not item.get('roomId'):
+            self.add_error(number, "roomId not provided.")
+            return None
+
+        if not isinstance(item['roomId'], str):
+            self.add_error(number, "roomId must be a string.")
+            return None
+
+        user_id = item.get('userId')
+        if user_id is not None and (isinstance(user_id, bool) or not isinstance(user_id, (int, str))):
+            self.add_error(number, "userId must be an integer or a string.")
+            return None
+
+        message = item.get('message')
+        if message is not None and not isinstance(message, str):
+            self.add_error(number, "message must be a string.")
+            return None
+
+        timestamp = item.get('timestamp')
+        if timestamp:
+            try:
+                timestamp = parse_datetime(str(timestamp))
+            except ValueError:
+                # Well formed but out of range, e.g. month 13
+                timestamp = None
+            if timestamp is None:
+                self.add_error(number, "timestamp is not a valid ISO-8601 datetime.")
+                return None
+            if timezone.is_naive(timestamp):
+                timestamp = timezone.make_aware(timestamp)
+        else:
+            timestamp = timezone.now()
+
+        item['timestamp'] = timestamp
+        item['userId'] = item.get('userId') or self.default_user.id
+
+        return item
+
+    def load_rooms(self, items):
+
+        missing = {item['roomId'] for item in items} - self.rooms.keys()
+
+        if not missing:
+            return
+
+        found = ChatRoom.objects.filter(roomId__in = missing).only('id', 'roomId', 'type')
+        for room in found:
+            self.rooms[room.roomId] = room
+
+        memberships = ChatRoom.member.through.objects.filter(
+            chatroom__roomId__in = missing
+        ).values_list('chatroom_id', 'user_id')
+
+        for room in found:
+            self.room_members[room.id] = set()
+        for room_id, user_id in memberships:
+            self.room_members[room_id].add(user_id)
+
+    def load_users(self, items):
+
+        user_ids = set()
+        for item in items:
+            try:
+                user_ids.add(int(item['userId']))
+            except (TypeError, ValueError):
+                pass
+
+        return {
+            user.id: user
+            for user in User.objects.filter(id__in = user_ids).only(
+                'id', 'first_name', 'last_name', 'image', 'image_variants'
+            )
+        }
+
+    def process_chunk(self, chunk):
+
+        items = []
+        for number, line in chunk:
+            item = self.parse_line(number, line)
+            if item is not None:
+                items.append((number, item))
+
+        if not items:
+            return
+
+        self.load_rooms([item for _, item in items])
+        users = self.load_users([item for _, item in items])
+
+        messages = []
+        for number, item in items:
+
+            room = self.rooms.get(item['roomId'])
+            if not room:
+                self.add_error(number, "Chat room does not exists.")
+                continue
+
+            try:
+                user = users.get(int(item['userId']))
+            except (TypeError, ValueError):
+                user = None
+
+            if not user:
+                self.add_error(number, "User does not exists.")
+                continue
+
+            if user.id not in self.room_members[room.id]:
+                self.add_error(number, "User isn't member of this chat room!")
+                continue
+
+            messages.append(
+                ChatMessage(
+                    room = room,
+                    user = user,
+                    message = item.get('message'),
+                    timestamp = item['timestamp']
+                )
+            )
+
+        if not messages:
+            return
+
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create(messages)
+
+            if self.fanout:
+                publish_events([
+                    (user_groups(self.room_members[message.room.id]), self.event_payload(message))
+                    for message in messages
+                ])
+
+        self.created += len(messages)
+        self.touched_rooms.update(message.room.id for message in messages)
+
+    def event_payload(self, message):
+
+        user = message.user
+        return {
+            'action': 'message',
+            'userId': user.id,
+            'chatType': message.room.type,
+            'roomId': message.room.roomId,
+            'message': message.message,
+            'userName': f"{user.first_name} {user.last_name}",
+            'userImage': user.avatar_url(),
+            'timestamp': str(message.timestamp),
+            'image': None,
+        }
+
+    def touch_rooms(self):
+
+        if self.touched_rooms:
+            ChatRoom.objects.filter(
+                id__in = self.touched_rooms
+            ).update(updated_at = timezone.now())
+            room_cache.invalidate(*self.touched_rooms)
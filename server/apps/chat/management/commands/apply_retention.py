@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from apps.chat.retention import RetentionJob
+from V0X.settings import (
+    RETENTION_ROOM_DAYS,
+    RETENTION_USER_DAYS,
+    RETENTION_BATCH_SIZE,
+    RETENTION_BATCH_PAUSE
+)
+
+class Command(BaseCommand):
+
+    help = "Delete rooms, users, messages and files past their retention period"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RETENTION_BATCH_SIZE,
+            help=f"Rows deleted per transaction (default: {RETENTION_BATCH_SIZE})"
+        )
+
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=RETENTION_BATCH_PAUSE,
+            help=f"Seconds to wait between transactions (default: {RETENTION_BATCH_PAUSE})"
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would be deleted without deleting anything"
+        )
+
+    def handle(self, *args, **options):
+
+        for room_type, days in RETENTION_ROOM_DAYS.items():
+            self.stdout.write(f'  ➜ {room_type} rooms idle for {days} days')
+        for code, days in RETENTION_USER_DAYS.items():
+            self.stdout.write(f'  ➜ {code} users inactive for {days} days, with the rooms they created')
+
+        job = RetentionJob(
+            batch_size = options['batch_size'],
+            pause = options['pause'],
+            dry_run = options['dry_run']
+        )
+        report = job.run()
+
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{action} {report}.'))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from apps.chat.archive import archive_candidates, archive_messages
+from V0X.settings import (
+    MESSAGE_ARCHIVE_AFTER_DAYS,
+    MESSAGE_ARCHIVE_IDLE_SUPPORT_DAYS,
+    MESSAGE_ARCHIVE_BATCH_SIZE
+)
+
+class Command(BaseCommand):
+
+    help = "Move old messages and idle support conversations to the archive table"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--after-days',
+            type=int,
+            default=MESSAGE_ARCHIVE_AFTER_DAYS,
+            help=f"Archive messages older than this (default: {MESSAGE_ARCHIVE_AFTER_DAYS})"
+        )
+
+        parser.add_argument(
+            '--idle-support-days',
+            type=int,
+            default=MESSAGE_ARCHIVE_IDLE_SUPPORT_DAYS,
+            help=f"Archive unassigned support rooms idle this long (default: {MESSAGE_ARCHIVE_IDLE_SUPPORT_DAYS})"
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=MESSAGE_ARCHIVE_BATCH_SIZE,
+            help=f"Messages moved per transaction (default: {MESSAGE_ARCHIVE_BATCH_SIZE})"
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Count the messages that would be archived without moving them"
+        )
+
+    def handle(self, *args, **options):
+
+        candidates = archive_candidates(
+            after_days = options['after_days'],
+            idle_support_days = options['idle_support_days']
+        )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Would archive {candidates.count()} messages.'))
+            return
+
+        archived = 0
+
+        for moved in archive_messages(candidates, options['batch_size']):
+            archived += moved
+            self.stdout.write(f'  ➜ Archived {archived} messages')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} messages.'))
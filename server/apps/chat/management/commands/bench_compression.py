@@ -0,0 +1,130 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.chat.compression import available_encodings, compress
+from apps.chat.models import ChatRoom, ChatMessage
+from apps.user.models import User
+from datetime import timedelta
+import time
+import uuid
+
+class Command(BaseCommand):
+
+    help = "Measure bytes saved and CPU time of each response encoding on room list and message pages. Everything is rolled back"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--rooms',
+            type=int,
+            default=50,
+            help="Rooms of the benchmark user, the list page shows up to 50 (default: 50)"
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help="Compressions per payload and encoding, the best run is kept (default: 20)"
+        )
+
+    def seed(self, room_count):
+
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create(
+                username = f"bench-{tag}-{index}",
+                email = f"bench-{tag}-{index}@example.com",
+                first_name = 'Bench',
+                last_name = f"User {index}",
+                image = f"user/bench-{index}.png"
+            )
+            for index in range(6)
+        ]
+
+        start = timezone.now() - timedelta(days = 1)
+        rooms = []
+        messages = []
+
+        for index in range(room_count):
+
+            room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = f"Team {index}", created_by = users[0])
+            room.member.add(*users)
+            rooms.append(room)
+
+            messages.append(ChatMessage(room = room, user = users[index % 6], message = f"Last message of team {index}"))
+
+        # One long history with text, images and files
+        for index in range(1000):
+
+            message = ChatMessage(
+                room = rooms[0],
+                user = users[index % 6],
+                message = f"Message {index}, about the usual things a team talks about",
+                timestamp = start + timedelta(seconds = index)
+            )
+            if index % 5 == 0:
+                message.image = f"chat_images/bench-{index}.png"
+                message.thumbnail = f"chat_thumbnails/bench-{index}.webp"
+                message.image_width, message.image_height = 640, 480
+            messages.append(message)
+
+        ChatMessage.objects.bulk_create(messages, batch_size = 500)
+        return users[0], rooms[0]
+
+    def payloads(self, user, room):
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(user)))
+
+        urls = [
+            ('UserChatRoomView, 50 rooms', '/api/v1/user/chats?limit=50'),
+            ('MessagesView, 50 messages', f'/api/v1/chats/messages/{room.roomId}?limit=50'),
+            ('MessagesView, 200 messages', f'/api/v1/chats/messages/{room.roomId}?limit=200'),
+            ('MessagesView, 200 compact', f'/api/v1/chats/messages/{room.roomId}?limit=200&compact=1'),
+        ]
+
+        for label, url in urls:
+            yield label, client.get(url).content
+
+    def best_time(self, body, encoding, repeat):
+
+        best = None
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            compress(body, encoding)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        return best
+
+    def handle(self, *args, **options):
+
+        repeat = options['repeat']
+        encodings = available_encodings()
+
+        self.stdout.write(f"Encodings available: {', '.join(encodings)}")
+
+        with transaction.atomic():
+
+            user, room = self.seed(options['rooms'])
+
+            for label, body in self.payloads(user, room):
+
+                self.stdout.write(f"{label}: {len(body):,} bytes")
+
+                for encoding in encodings:
+
+                    size = len(compress(body, encoding))
+                    elapsed = self.best_time(body, encoding, repeat)
+
+                    self.stdout.write(
+                        f'  ➜ {encoding}: {size:,} bytes ({1 - size / len(body):.0%} saved), '
+                        f'{elapsed * 1000:.2f} ms, {len(body) / elapsed / 1e6:.0f} MB/s'
+                    )
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, changes rolled back.'))
@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from apps.chat.archive import room_history
+from apps.chat.fastread import message_rows, render_messages
+from apps.chat.models import ChatRoom, ChatMessage
+from apps.chat.serializers import ChatMessageSerializer
+from apps.user.models import User
+from datetime import timedelta
+import time
+import uuid
+
+class Command(BaseCommand):
+
+    help = "Compare message history rows per second, ChatMessageSerializer against apps.chat.fastread. Everything is rolled back"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[50, 200, 1000],
+            help="Page sizes to measure (default: 50 200 1000)"
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help="Pages rendered per size and implementation, the best run is kept (default: 20)"
+        )
+
+    def seed(self, count):
+
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create(
+                username = f"bench-{tag}-{index}",
+                email = f"bench-{tag}-{index}@example.com",
+                first_name = 'Bench',
+                last_name = str(index),
+                image = f"user/bench-{index}.png"
+            )
+            for index in range(4)
+        ]
+
+        room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = f"bench-{tag}", created_by = users[0])
+        room.member.add(*users)
+
+        # A mix of text, images and files, like a real history
+        start = timezone.now() - timedelta(days = 1)
+        messages = []
+
+        for index in range(count):
+
+            message = ChatMessage(
+                room = room,
+                user = users[index % len(users)],
+                message = f"Message {index}",
+                timestamp = start + timedelta(seconds = index)
+            )
+            if index % 5 == 0:
+                message.image = f"chat_images/bench-{index}.png"
+                message.thumbnail = f"chat_thumbnails/bench-{index}.webp"
+                message.image_width, message.image_height = 640, 480
+            elif index % 7 == 0:
+                message.file = f"chat_files/bench-{index}.pdf"
+                message.file_name, message.file_type, message.file_size = 'report.pdf', 'application/pdf', 1024
+
+            messages.append(message)
+
+        ChatMessage.objects.bulk_create(messages, batch_size = 500)
+        return room
+
+    def best_time(self, render, repeat):
+
+        best = None
+
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        return best
+
+    def handle(self, *args, **options):
+
+        sizes = options['sizes']
+        repeat = options['repeat']
+
+        with transaction.atomic():
+
+            room = self.seed(max(sizes))
+            request = Request(APIRequestFactory().get(f"/api/v1/chats/messages/{room.roomId}"))
+            context = {'request': request}
+
+            for size in sizes:
+
+                # Query and rendering both count, building rows is part of the cost
+                serializer = self.best_time(
+                    lambda: ChatMessageSerializer(room_history(room)[0:size], many = True, context = context).data,
+                    repeat
+                )
+                fast = self.best_time(
+                    lambda: render_messages(message_rows(room_history(room))[0:size], context),
+                    repeat
+                )
+
+                self.stdout.write(
+                    f'  ➜ {size} rows: serializer {size / serializer:,.0f} rows/s, '
+                    f'fastread {size / fast:,.0f} rows/s ({serializer / fast:.1f}x)'
+                )
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, changes rolled back.'))
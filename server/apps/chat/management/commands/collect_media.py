@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from apps.chat.mediagc import MediaCollector
+from V0X.settings import (
+    MEDIA_GC_GRACE_HOURS,
+    MEDIA_GC_BATCH_SIZE,
+    MEDIA_GC_QUARANTINE_ROOT
+)
+
+class Command(BaseCommand):
+
+    help = "Delete (or quarantine) files under MEDIA_ROOT that no row references"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=MEDIA_GC_GRACE_HOURS,
+            help=f"Skip files modified in the last hours (default: {MEDIA_GC_GRACE_HOURS})"
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=MEDIA_GC_BATCH_SIZE,
+            help=f"Orphans re-checked against the database per batch (default: {MEDIA_GC_BATCH_SIZE})"
+        )
+
+        parser.add_argument(
+            '--quarantine',
+            action='store_true',
+            help=f"Move orphans to {MEDIA_GC_QUARANTINE_ROOT} instead of deleting them"
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would be collected without touching any file"
+        )
+
+    def handle(self, *args, **options):
+
+        collector = MediaCollector(
+            grace_hours = options['grace_hours'],
+            batch_size = options['batch_size'],
+            quarantine_root = MEDIA_GC_QUARANTINE_ROOT if options['quarantine'] else None,
+            dry_run = options['dry_run']
+        ).run()
+
+        self.stdout.write(f'  ➜ Scanned {collector.scanned} files')
+
+        if options['dry_run']:
+            action = 'Would collect'
+        elif options['quarantine']:
+            action = 'Quarantined'
+        else:
+            action = 'Deleted'
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{action} {collector.collected} orphaned files, {collector.collected_bytes / (1024 * 1024):.2f} MB.'
+            )
+        )
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.chat.outbox import dispatch_all, purge_dispatched
+from V0X.settings import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL
+from datetime import timedelta
+import time
+
+class Command(BaseCommand):
+
+    help = "Deliver pending real-time events from the outbox to the channel layer"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help=f"Events delivered per batch (default: {OUTBOX_BATCH_SIZE})"
+        )
+
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=OUTBOX_POLL_INTERVAL,
+            help=f"Seconds between polls when the outbox is empty (default: {OUTBOX_POLL_INTERVAL})"
+        )
+
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the outbox once and exit"
+        )
+
+        parser.add_argument(
+            '--purge-hours',
+            type=int,
+            default=24,
+            help="Delete dispatched events older than this many hours (default: 24, 0=never)"
+        )
+
+    def handle(self, *args, **options):
+
+        batch_size = options['batch_size']
+        interval = options['interval']
+        purge_hours = options['purge_hours']
+
+        while True:
+
+            dispatched = dispatch_all(batch_size = batch_size)
+
+            if dispatched:
+                self.stdout.write(f'  ➜ Dispatched {dispatched} events')
+
+            if purge_hours:
+                purge_dispatched(timezone.now() - timedelta(hours=purge_hours))
+
+            if options['once']:
+                break
+
+            time.sleep(interval)
+
+        self.stdout.write(self.style.SUCCESS('Outbox drained.'))
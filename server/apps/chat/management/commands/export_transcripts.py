@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.chat.models import ChatRoom
+from apps.chat.export import EXPORT_FORMATS, parse_bound, transcript_querysets, render_transcript
+import sys
+
+class Command(BaseCommand):
+
+    help = "Stream a room transcript, or every room in a date range, as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--room',
+            type=str,
+            help="roomId of the chat room to export (default: every room)"
+        )
+
+        parser.add_argument(
+            '--since',
+            type=str,
+            help="ISO-8601 date or datetime, inclusive"
+        )
+
+        parser.add_argument(
+            '--until',
+            type=str,
+            help="ISO-8601 date or datetime, exclusive"
+        )
+
+        parser.add_argument(
+            '--format',
+            type=str,
+            choices=EXPORT_FORMATS,
+            default='ndjson',
+            help="Output format (default: ndjson)"
+        )
+
+        parser.add_argument(
+            '--output',
+            type=str,
+            help="File to write to (default: stdout)"
+        )
+
+    def handle(self, *args, **options):
+
+        try:
+            since = parse_bound(options['since'])
+            until = parse_bound(options['until'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        room = None
+        if options['room']:
+            try:
+                room = ChatRoom.objects.get(roomId=options['room'])
+            except ChatRoom.DoesNotExist:
+                raise CommandError(f"Chat room '{options['room']}' does not exist.")
+
+        querysets = transcript_querysets(room=room, since=since, until=until)
+        chunks = render_transcript(querysets, options['format'])
+        has_header = options['format'] == 'csv'
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                written = self.write_chunks(chunks, output, has_header)
+            self.stderr.write(self.style.SUCCESS(f'Exported {written} messages to {options["output"]}.'))
+        else:
+            written = self.write_chunks(chunks, sys.stdout, has_header)
+            self.stderr.write(self.style.SUCCESS(f'Exported {written} messages.'))
+
+    def write_chunks(self, chunks, output, has_header):
+
+        written = -1 if has_header else 0
+        for chunk in chunks:
+            output.write(chunk)
+            written += 1
+        return written
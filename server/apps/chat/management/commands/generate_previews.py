@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from apps.chat.models import ChatMessage
+from apps.chat.imaging import render_previews
+from apps.chat.previews import get_pool, preview_job, save_previews
+
+class Command(BaseCommand):
+
+    help = "Generate thumbnails and blur placeholders for image messages that do not have them"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help="Images submitted to the process pool per batch (default: 100)"
+        )
+
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Regenerate previews that already exist"
+        )
+
+    def handle(self, *args, **options):
+
+        batch_size = options['batch_size']
+
+        queryset = ChatMessage.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            queryset = queryset.filter(Q(thumbnail='') | Q(thumbnail__isnull=True))
+
+        pool = get_pool()
+        last_id = 0
+        generated = 0
+        failed = 0
+
+        while True:
+
+            messages = list(
+                queryset.filter(id__gt=last_id).order_by('id').only('id', 'room_id', 'image')[:batch_size]
+            )
+
+            if not messages:
+                break
+
+            futures = [
+                (message, pool.submit(render_previews, *preview_job(message)))
+                for message in messages
+            ]
+
+            for message, future in futures:
+                try:
+                    save_previews(message.id, message.room_id, future.result())
+                    generated += 1
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'  ➜ Message {message.id}: {str(e)}'))
+
+            last_id = messages[-1].id
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Previews generated: {generated} ok, {failed} failed.')
+        )
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from apps.chat.models import Attachment
+from V0X.settings import ATTACHMENT_SWEEP_GRACE_HOURS, ATTACHMENT_SWEEP_BATCH_SIZE
+from datetime import timedelta
+
+class Command(BaseCommand):
+
+    help = "Delete attachment blobs that no message references anymore"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=ATTACHMENT_SWEEP_GRACE_HOURS,
+            help=f"Only reclaim blobs unused for this many hours (default: {ATTACHMENT_SWEEP_GRACE_HOURS})"
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ATTACHMENT_SWEEP_BATCH_SIZE,
+            help=f"Blobs examined per batch (default: {ATTACHMENT_SWEEP_BATCH_SIZE})"
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would be reclaimed without deleting anything"
+        )
+
+    def handle(self, *args, **options):
+
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        # Mark: blobs without messages (live or archived) that have been idle past the grace period
+        unreferenced = Attachment.objects.filter(
+            messages__isnull = True,
+            archived_messages__isnull = True,
+            last_used_at__lt = cutoff
+        )
+
+        last_id = 0
+        reclaimed = 0
+        reclaimed_bytes = 0
+
+        while True:
+
+            batch = list(
+                unreferenced.filter(id__gt=last_id).order_by('id').only('id', 'file', 'size')[:batch_size]
+            )
+
+            if not batch:
+                break
+
+            for attachment in batch:
+
+                if dry_run:
+                    self.stdout.write(f'  ➜ Would delete {attachment.file.name} ({attachment.size} bytes)')
+                    reclaimed += 1
+                    reclaimed_bytes += attachment.size
+                    continue
+
+                # Sweep: check again at delete time, an upload may have reused it
+                with transaction.atomic():
+                    deleted, _ = unreferenced.filter(id = attachment.id).delete()
+
+                if deleted:
+                    default_storage.delete(attachment.file.name)
+                    reclaimed += 1
+                    reclaimed_bytes += attachment.size
+
+            last_id = batch[-1].id
+
+        action = 'Would reclaim' if dry_run else 'Reclaimed'
+        self.stdout.write(
+            self.style.SUCCESS(f'{action} {reclaimed} blobs, {reclaimed_bytes / (1024 * 1024):.2f} MB.')
+        )
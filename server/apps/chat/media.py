@@ -0,0 +1,176 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse, Http404
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, quote_etag
+from django.views.decorators.http import require_http_methods
+from V0X.settings import (
+    MEDIA_OFFLOAD,
+    MEDIA_ACCEL_PREFIX,
+    MEDIA_IMMUTABLE_PREFIXES,
+    MEDIA_CACHE_MAX_AGE
+)
+from .storage import is_protected, verify_media
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) inclusive for a single byte range, None when the
+    header is absent or not understood (full response), or False when the
+    range cannot be satisfied.
+    """
+
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+
+    if not match:
+        return None
+
+    first, last = match.groups()
+
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        return False
+
+    return start, end
+
+
+async def aiter_range(path, start, length):
+    """
+    Yields `length` bytes of the file from `start`. Reads run in worker
+    threads: under ASGI a sync iterator would be read whole into memory
+    before the first byte is sent.
+    """
+
+    source = await sync_to_async(open, thread_sensitive = False)(path, 'rb')
+    read = sync_to_async(source.read, thread_sensitive = False)
+
+    try:
+        source.seek(start)
+
+        while length > 0:
+            block = await read(min(RANGE_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        source.close()
+
+
+def offload_response(name, full_path, content_type):
+    """
+    Empty response that tells the front server to send the file itself,
+    ranges included, so no worker stays busy during the transfer.
+    """
+
+    response = HttpResponse(content_type = content_type)
+
+    if MEDIA_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + quote(name)
+    else:
+        response['X-Sendfile'] = full_path
+
+    return response
+
+
+def file_response(request, path, size, content_type):
+
+    byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status = 416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = StreamingHttpResponse(aiter_range(path, 0, size), content_type = content_type)
+        response['Content-Length'] = str(size)
+        response['Content-Disposition'] = content_disposition_header(False, os.path.basename(path))
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            aiter_range(path, start, end - start + 1),
+            status = 206,
+            content_type = content_type
+        )
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    """
+    Serves MEDIA_ROOT. Chat content needs the signature added by
+    `SignedMediaStorage.url`, other media (avatars) is public.
+    """
+
+    name = os.path.normpath(path).replace('\\', '/').lstrip('/')
+
+    if name.startswith('..') or name.startswith('chat_uploads/'):
+        raise Http404
+
+    if is_protected(name) and not verify_media(name, request.GET.get('e'), request.GET.get('s')):
+        return HttpResponse(status = 403)
+
+    try:
+        full_path = default_storage.path(name)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = quote_etag(f"{stat.st_size:x}-{int(stat.st_mtime):x}")
+    response = get_conditional_response(
+        request,
+        etag = etag,
+        last_modified = int(stat.st_mtime)
+    )
+
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+        if MEDIA_OFFLOAD:
+            response = offload_response(name, full_path, content_type)
+        else:
+            response = file_response(request, full_path, stat.st_size, content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+
+    # Blob names are content hashes, what they point to never changes
+    if name.startswith(MEDIA_IMMUTABLE_PREFIXES):
+        patch_cache_control(response, max_age = 31536000, immutable = True)
+    else:
+        patch_cache_control(response, max_age = MEDIA_CACHE_MAX_AGE)
+
+    if is_protected(name):
+        patch_cache_control(response, private = True)
+    else:
+        patch_cache_control(response, public = True)
+
+    return response
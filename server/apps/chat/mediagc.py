@@ -0,0 +1,241 @@
+"""
+Orphaned media collection.
+
+Every file name stored in the database is added to a bloom filter, a fixed
+bit array sized from the row counts, so memory stays bounded whatever the
+number of files. MEDIA_ROOT is then walked lazily: a file the filter has
+never seen is certainly unreferenced. Candidates are re-checked against the
+database in batches (a reference may have been added while walking) before
+being deleted or moved to quarantine.
+"""
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from apps.user.models import User
+from V0X.settings import (
+    MEDIA_GC_PREFIXES,
+    MEDIA_GC_GRACE_HOURS,
+    MEDIA_GC_FALSE_POSITIVE_RATE,
+    MEDIA_GC_BATCH_SIZE,
+    AVATAR_VARIANTS
+)
+from .models import ChatMessage, ArchivedChatMessage, Attachment, ChatUpload
+import hashlib
+import math
+import os
+import shutil
+
+# (model, file columns) holding media names
+FILE_COLUMNS = [
+    (ChatMessage, ('image', 'file', 'thumbnail')),
+    (ArchivedChatMessage, ('image', 'file', 'thumbnail')),
+    (Attachment, ('file',)),
+    (User, ('image',)),
+]
+
+
+class BloomFilter:
+    """
+    Set membership without false negatives in `-n ln(p) / ln(2)^2` bits.
+    """
+
+    def __init__(self, capacity, false_positive_rate = MEDIA_GC_FALSE_POSITIVE_RATE):
+
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+
+    def positions(self, value):
+
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size = 16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def add(self, value):
+
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(value)
+        )
+
+
+def iter_referenced_names():
+    """
+    Every media name stored in the database, streamed.
+    """
+
+    for model, columns in FILE_COLUMNS:
+        for column in columns:
+            queryset = model.objects.exclude(**{f"{column}__isnull": True}).exclude(**{column: ''})
+            yield from queryset.values_list(column, flat = True).iterator(chunk_size = 2000)
+
+    variants = User.objects.filter(image_variants__isnull = False).values_list('image_variants', flat = True)
+    for names in variants.iterator(chunk_size = 2000):
+        yield from (names or {}).values()
+
+    for upload_id in ChatUpload.objects.values_list('uploadId', flat = True).iterator(chunk_size = 2000):
+        yield f"chat_uploads/{upload_id}.part"
+
+
+def count_referenced_names():
+
+    total = sum(
+        model.objects.count() * len(columns)
+        for model, columns in FILE_COLUMNS
+    )
+    total += User.objects.filter(image_variants__isnull = False).count() * len(AVATAR_VARIANTS)
+    total += ChatUpload.objects.count()
+
+    return total
+
+
+def build_reference_index(false_positive_rate = MEDIA_GC_FALSE_POSITIVE_RATE):
+
+    index = BloomFilter(count_referenced_names(), false_positive_rate)
+
+    for name in iter_referenced_names():
+        index.add(name)
+
+    return index
+
+
+def referenced_among(names):
+    """
+    Exact check of a batch of candidate names, one query per column.
+    """
+
+    names = list(names)
+    referenced = set()
+
+    for model, columns in FILE_COLUMNS:
+        condition = Q()
+        for column in columns:
+            condition |= Q(**{f"{column}__in": names})
+
+        for values in model.objects.filter(condition).values_list(*columns):
+            referenced.update(values)
+
+    variants = User.objects.filter(image_variants__isnull = False).values_list('image_variants', flat = True)
+    wanted = set(name for name in names if name.startswith('avatars/'))
+    if wanted:
+        for stored in variants.iterator(chunk_size = 2000):
+            referenced.update(wanted.intersection((stored or {}).values()))
+
+    uploads = [name[len('chat_uploads/'):-len('.part')] for name in names if name.startswith('chat_uploads/')]
+    if uploads:
+        referenced.update(
+            f"chat_uploads/{upload_id}.part"
+            for upload_id in ChatUpload.objects.filter(uploadId__in = uploads).values_list('uploadId', flat = True)
+        )
+
+    return referenced
+
+
+def iter_media_files(root, prefixes = MEDIA_GC_PREFIXES):
+    """
+    Yields (name, path, stat) for the files under `prefixes`, walking one
+    directory at a time.
+    """
+
+    for prefix in prefixes:
+
+        pending = [os.path.join(root, prefix)]
+
+        while pending:
+            directory = pending.pop()
+
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks = False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks = False):
+                        name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                        yield name, entry.path, entry.stat(follow_symlinks = False)
+
+
+class MediaCollector:
+
+    def __init__(
+        self,
+        root = None,
+        grace_hours = MEDIA_GC_GRACE_HOURS,
+        batch_size = MEDIA_GC_BATCH_SIZE,
+        quarantine_root = None,
+        dry_run = False
+    ):
+
+        self.root = root or default_storage.location
+        self.grace_hours = grace_hours
+        self.batch_size = batch_size
+        self.quarantine_root = quarantine_root
+        self.dry_run = dry_run
+
+        self.scanned = 0
+        self.collected = 0
+        self.collected_bytes = 0
+
+    def run(self):
+
+        # Files written after this moment may be referenced by rows the index missed
+        cutoff = timezone.now().timestamp() - self.grace_hours * 3600
+        index = build_reference_index()
+
+        batch = []
+
+        for name, path, stat in iter_media_files(self.root):
+
+            self.scanned += 1
+
+            if name in index or stat.st_mtime > cutoff:
+                continue
+
+            batch.append((name, path, stat.st_size))
+            if len(batch) >= self.batch_size:
+                self.collect(batch)
+                batch = []
+
+        if batch:
+            self.collect(batch)
+
+        return self
+
+    def collect(self, batch):
+
+        referenced = referenced_among(name for name, _, _ in batch)
+
+        for name, path, size in batch:
+
+            if name in referenced:
+                continue
+
+            if not self.dry_run:
+                try:
+                    self.remove(name, path)
+                except FileNotFoundError:
+                    continue
+
+            self.collected += 1
+            self.collected_bytes += size
+
+    def remove(self, name, path):
+
+        if self.quarantine_root:
+            target = os.path.join(self.quarantine_root, name)
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            shutil.move(path, target)
+        else:
+            os.remove(path)
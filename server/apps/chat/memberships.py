@@ -0,0 +1,161 @@
+"""
+Membership changes in bulk. A room member is two rows, the `member` M2M
+row and its ChatRoomMembership (read marks); both are written with one
+`bulk_create(ignore_conflicts=True)` per call whatever the number of rooms
+and users. `bulk_create` and queryset deletes send no m2m_changed signals,
+so room caches are invalidated here, once per call, and members are told
+through one outbox event per room so their sockets join or leave the room
+group.
+"""
+from django.db import transaction
+from django.utils import timezone
+from apps.user.models import User
+from .models import ChatRoom, ChatRoomMembership, RoomTombstone
+from .cache import room_cache
+from .outbox import publish_events, user_groups
+
+MemberThrough = ChatRoom.member.through
+
+
+def parse_ids(user_ids):
+    """
+    Ints of `user_ids` (ints or numeric strings), anything else dropped.
+    """
+
+    ids = set()
+    for user_id in user_ids:
+        try:
+            ids.add(int(user_id))
+        except (TypeError, ValueError):
+            continue
+
+    return ids
+
+
+def existing_user_ids(user_ids):
+
+    return set(User.objects.filter(id__in = parse_ids(user_ids)).values_list('id', flat = True))
+
+
+def room_member_ids(rooms):
+
+    members = {room.id: set() for room in rooms}
+    for room_id, user_id in MemberThrough.objects.filter(
+        chatroom_id__in = list(members)
+    ).values_list('chatroom_id', 'user_id'):
+        members[room_id].add(user_id)
+
+    return members
+
+
+def touch_rooms(rooms):
+    """
+    Member lists are part of the room payloads: bump `updated_at` so list
+    validators change, and drop the cached payloads.
+    """
+
+    room_ids = [room.id for room in rooms]
+    ChatRoom.objects.filter(id__in = room_ids).update(updated_at = timezone.now())
+    transaction.on_commit(lambda: room_cache.invalidate(*room_ids))
+
+
+def add_room_members(members_by_room):
+    """
+    Adds users to rooms, `members_by_room` maps a room to user ids. Unknown
+    ids and existing members are skipped. Returns {room: added user ids}.
+    """
+
+    rooms = list(members_by_room)
+    valid = existing_user_ids(user_id for user_ids in members_by_room.values() for user_id in user_ids)
+
+    with transaction.atomic():
+
+        current = room_member_ids(rooms)
+        added = {
+            room: sorted((parse_ids(members_by_room[room]) & valid) - current[room.id])
+            for room in rooms
+        }
+
+        MemberThrough.objects.bulk_create(
+            [
+                MemberThrough(chatroom_id = room.id, user_id = user_id)
+                for room, user_ids in added.items() for user_id in user_ids
+            ],
+            ignore_conflicts = True
+        )
+        ChatRoomMembership.objects.bulk_create(
+            [
+                ChatRoomMembership(room_id = room.id, user_id = user_id)
+                for room, user_ids in added.items() for user_id in user_ids
+            ],
+            ignore_conflicts = True
+        )
+
+        changed = [room for room, user_ids in added.items() if user_ids]
+        if changed:
+            touch_rooms(changed)
+            publish_events([
+                (
+                    user_groups(current[room.id] | set(added[room])),
+                    {'action': 'members_added', 'roomId': room.roomId, 'userIds': added[room]}
+                )
+                for room in changed
+            ])
+
+    return added
+
+
+def add_members(room, user_ids):
+    return add_room_members({room: user_ids})[room]
+
+
+def remove_members(room, user_ids):
+    """
+    Removes users from a room. Returns the ids that were members.
+    """
+
+    with transaction.atomic():
+
+        current = room_member_ids([room])[room.id]
+        removed = sorted(parse_ids(user_ids) & current)
+
+        if not removed:
+            return []
+
+        MemberThrough.objects.filter(chatroom_id = room.id, user_id__in = removed).delete()
+        ChatRoomMembership.objects.filter(room_id = room.id, user_id__in = removed).delete()
+        RoomTombstone.record(room.roomId, removed)
+
+        touch_rooms([room])
+
+        # Removed users get the event too, so their sockets leave the group
+        publish_events([(
+            user_groups(current),
+            {'action': 'members_removed', 'roomId': room.roomId, 'userIds': removed}
+        )])
+
+    return removed
+
+
+def create_rooms(rooms_data, created_by = None):
+    """
+    Creates rooms with their members, `rooms_data` is a list of dicts with
+    ChatRoom fields and a `members` list. Returns {room: member ids}, rooms
+    in the order given. The rooms are one `bulk_create`, which needs a
+    backend that returns the new ids (SQLite 3.35+, PostgreSQL).
+    """
+
+    rooms = []
+    member_ids = []
+
+    for data in rooms_data:
+        data = dict(data)
+        member_ids.append(data.pop('members', []))
+        rooms.append(ChatRoom(**{'created_by': created_by, **data}))
+
+    with transaction.atomic():
+
+        ChatRoom.objects.bulk_create(rooms)
+        added = add_room_members(dict(zip(rooms, member_ids)))
+
+    return added
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:02
+
+import django.db.models.deletion
+import shortuuidfield.fields
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatRoom',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('roomId', shortuuidfield.fields.ShortUUIDField(blank=True, editable=False, max_length=22)),
+                ('type', models.CharField(choices=[('DM', 'Direct Message'), ('GROUP', 'Group Chat'), ('SELF', 'Personal Chat'), ('SUPPORT', 'Support Chat')], default='DM', max_length=10)),
+                ('name', models.CharField(blank=True, max_length=20, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('taken_at', models.DateTimeField(blank=True, null=True)),
+                ('assigned_agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_chats', to=settings.AUTH_USER_MODEL)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_chats', to=settings.AUTH_USER_MODEL)),
+                ('member', models.ManyToManyField(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='chat_images/')),
+                ('file', models.FileField(blank=True, null=True, upload_to='chat_files/')),
+                ('file_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('file_type', models.CharField(blank=True, max_length=50, null=True)),
+                ('file_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('room', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='chat.chatroom')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChatRoomMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_at', models.DateTimeField(auto_now_add=True)),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_read_at'],
+                'unique_together': {('user', 'room')},
+            },
+        ),
+    ]
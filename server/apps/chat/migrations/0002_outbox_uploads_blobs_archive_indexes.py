@@ -0,0 +1,193 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:02
+
+import django.db.models.deletion
+import django.utils.timezone
+import shortuuidfield.fields
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        ('user', '0005_users_email_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedChatMessage',
+            fields=[
+                ('message', models.TextField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='chat_images/')),
+                ('file', models.FileField(blank=True, null=True, upload_to='chat_files/')),
+                ('file_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('file_type', models.CharField(blank=True, max_length=50, null=True)),
+                ('file_size', models.PositiveIntegerField(blank=True, null=True)),
+                ('image_width', models.PositiveIntegerField(blank=True, null=True)),
+                ('image_height', models.PositiveIntegerField(blank=True, null=True)),
+                ('thumbnail', models.ImageField(blank=True, null=True, upload_to='chat_thumbnails/')),
+                ('image_placeholder', models.TextField(blank=True, help_text='Tiny blurred preview as a data URI', null=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to='blobs/')),
+                ('size', models.PositiveBigIntegerField()),
+                ('content_type', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChatUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uploadId', shortuuidfield.fields.ShortUUIDField(blank=True, editable=False, max_length=22)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_type', models.CharField(max_length=100)),
+                ('file_size', models.PositiveIntegerField(help_text='Declared size in bytes')),
+                ('received', models.PositiveIntegerField(default=0)),
+                ('checksum', models.CharField(blank=True, default='', help_text='SHA-256 (hex) declared by the client, checked on finalize', max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'pending'), ('COMPLETE', 'complete')], default='PENDING', max_length=8)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('groups', models.JSONField(default=list, help_text='Channel layer groups the event is delivered to')),
+                ('payload', models.JSONField(help_text="Message sent to the consumers as 'chat_message'")),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('claimed_by', models.CharField(blank=True, default='', help_text='Dispatcher run currently sending the event', max_length=32)),
+                ('next_attempt_at', models.DateTimeField(blank=True, help_text='Not taken again before this time: claim lease or retry backoff', null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('roomId', models.CharField(max_length=22)),
+                ('removed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='image_placeholder',
+            field=models.TextField(blank=True, help_text='Tiny blurred preview as a data URI', null=True),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='chat_thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='room',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='chat.chatroom'),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['roomId'], name='rooms_room_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['type', '-updated_at'], name='rooms_type_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['type', 'taken_at'], name='rooms_type_taken_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(fields=['assigned_agent', 'type', '-updated_at'], name='rooms_agent_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatroommembership',
+            index=models.Index(fields=['user', 'last_read_at'], name='memberships_user_read_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedchatmessage',
+            name='room',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_messages', to='chat.chatroom'),
+        ),
+        migrations.AddField(
+            model_name='archivedchatmessage',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedchatmessage',
+            name='attachment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_messages', to='chat.attachment'),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='attachment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='messages', to='chat.attachment'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['room', 'timestamp', 'user'], name='messages_room_time_user_idx'),
+        ),
+        migrations.AddField(
+            model_name='chatupload',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='chat.chatroom'),
+        ),
+        migrations.AddField(
+            model_name='chatupload',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_uploads', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='roomtombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedchatmessage',
+            index=models.Index(fields=['room', 'timestamp'], name='archived_room_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatupload',
+            index=models.Index(fields=['status', 'updated_at'], name='uploads_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roomtombstone',
+            index=models.Index(fields=['user', 'removed_at'], name='tombstones_user_time_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_support_rooms(apps, schema_editor):
+    """
+    Keeps the oldest support room of each user, the one support lookups
+    (`.filter(...).first()`) already resolved to, and moves the messages,
+    uploads and members of the others into it before deleting them.
+    Members of a deleted room get a tombstone for the delta sync.
+    """
+
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    ArchivedChatMessage = apps.get_model('chat', 'ArchivedChatMessage')
+    ChatUpload = apps.get_model('chat', 'ChatUpload')
+    ChatRoomMembership = apps.get_model('chat', 'ChatRoomMembership')
+    RoomTombstone = apps.get_model('chat', 'RoomTombstone')
+    MemberThrough = ChatRoom.member.through
+
+    support = ChatRoom.objects.filter(type = 'SUPPORT', created_by__isnull = False)
+    duplicated = (
+        support.values('created_by')
+        .annotate(rooms = Count('id'))
+        .filter(rooms__gt = 1)
+        .values_list('created_by', flat = True)
+    )
+
+    for user_id in list(duplicated):
+
+        rooms = list(support.filter(created_by = user_id).order_by('id'))
+        keep, duplicates = rooms[0], rooms[1:]
+        duplicate_ids = [room.id for room in duplicates]
+
+        ChatMessage.objects.filter(room_id__in = duplicate_ids).update(room = keep)
+        ArchivedChatMessage.objects.filter(room_id__in = duplicate_ids).update(room = keep)
+        ChatUpload.objects.filter(room_id__in = duplicate_ids).update(room = keep)
+
+        members = set(MemberThrough.objects.filter(chatroom_id = keep.id).values_list('user_id', flat = True))
+        moved = set(
+            MemberThrough.objects.filter(chatroom_id__in = duplicate_ids).values_list('user_id', flat = True)
+        ) - members
+
+        MemberThrough.objects.bulk_create([
+            MemberThrough(chatroom_id = keep.id, user_id = member_id) for member_id in moved
+        ])
+        ChatRoomMembership.objects.bulk_create(
+            [ChatRoomMembership(room_id = keep.id, user_id = member_id) for member_id in moved],
+            ignore_conflicts = True
+        )
+
+        RoomTombstone.objects.bulk_create([
+            RoomTombstone(roomId = room.roomId, user_id = member_id)
+            for room in duplicates
+            for member_id in MemberThrough.objects.filter(chatroom_id = room.id).values_list('user_id', flat = True)
+        ])
+
+        # Memberships and the remaining through rows cascade
+        ChatRoom.objects.filter(id__in = duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_outbox_uploads_blobs_archive_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_support_rooms, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chatroom',
+            constraint=models.UniqueConstraint(condition=models.Q(('type', 'SUPPORT')), fields=('created_by',), name='one_support_room_per_user'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_one_support_room_per_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedchatmessage',
+            index=models.Index(fields=['timestamp', 'id'], name='archived_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['timestamp', 'id'], name='messages_time_id_idx'),
+        ),
+    ]
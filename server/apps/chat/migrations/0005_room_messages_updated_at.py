@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_export_time_id_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='messages_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
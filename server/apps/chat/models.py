@@ -3,6 +3,7 @@ from django.db.models import Count
 from shortuuidfield import ShortUUIDField
 from apps.user.models import User
 from django.utils import timezone
+from django.conf import settings
 import os
 
 def get_file_upload_path(instance, filename):
@@ -14,6 +15,20 @@ def get_file_upload_path(instance, filename):
     return f'chat_files/{filename}'
 
 
+class Attachment(models.Model):
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs/', max_length=255)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every reuse, the sweeper only reclaims blobs idle past a grace period
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} - {self.file.name}"
+
+
 class ChatRoom(models.Model):
 
     class ChatType(models.TextChoices):
@@ -39,6 +54,9 @@ class ChatRoom(models.Model):
         related_name='created_chats'
     )
     updated_at = models.DateTimeField(auto_now=True)
+    # Existing messages changed in place (previews). Part of the message
+    # list validators only, the room keeps its place in the lists.
+    messages_updated_at = models.DateTimeField(null=True, blank=True)
 
     assigned_agent = models.ForeignKey(
         User,
@@ -54,6 +72,20 @@ class ChatRoom(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields = ['roomId'], name = 'rooms_room_id_idx'),
+            # Support queue listing and the expiry sweep that runs before it
+            models.Index(fields = ['type', '-updated_at'], name = 'rooms_type_updated_idx'),
+            models.Index(fields = ['type', 'taken_at'], name = 'rooms_type_taken_idx'),
+            models.Index(fields = ['assigned_agent', 'type', '-updated_at'], name = 'rooms_agent_type_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields = ['created_by'],
+                condition = models.Q(type = 'SUPPORT'),
+                name = 'one_support_room_per_user'
+            ),
+        ]
 
     def __str__(self):
         return self.roomId + "-" + str(self.name)
@@ -73,12 +105,22 @@ class ChatRoom(models.Model):
     
     def get_last_message(self):
 
-        return ChatMessage.objects.filter(
+        last_message = ChatMessage.objects.filter(
             room=self
         ).order_by(
             '-timestamp'
         ).first()
 
+        # Rooms idle long enough may have all their messages archived
+        if last_message is None:
+            last_message = ArchivedChatMessage.objects.filter(
+                room=self
+            ).order_by(
+                '-timestamp'
+            ).first()
+
+        return last_message
+
 
     @staticmethod
     def get_existing_dm_room(users_ids):
@@ -98,17 +140,29 @@ class ChatRoom(models.Model):
                 return chat
         return None
     
-class ChatMessage(models.Model):
+class MessageContent(models.Model):
+    """
+    Fields shared by live messages and their archived copies.
+    """
 
-    room = models.ForeignKey(ChatRoom, on_delete=models.SET_NULL, null=True, related_name="messages")
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     message = models.TextField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     image = models.ImageField(upload_to='chat_images/', blank=True, null=True)
     file = models.FileField(upload_to='chat_files/', blank=True, null=True)
     file_name = models.CharField(max_length=255, null=True, blank=True)
     file_type = models.CharField(max_length=50, null=True, blank=True)
     file_size = models.PositiveIntegerField(null=True, blank=True)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail = models.ImageField(upload_to='chat_thumbnails/', blank=True, null=True)
+    image_placeholder = models.TextField(
+        null=True,
+        blank=True,
+        help_text="Tiny blurred preview as a data URI"
+    )
+
+    class Meta:
+        abstract = True
 
     def __str__(self):
         return self.message or f"File: {self.file_name}" or f"Image: {os.path.basename(self.image.name)}" or "Empty Message"
@@ -118,6 +172,58 @@ class ChatMessage(models.Model):
             return self.file_name.split('.')[-1].lower()
         return None
 
+class ChatMessage(MessageContent):
+
+    # Indexed by messages_room_time_user_idx, which starts with room
+    room = models.ForeignKey(ChatRoom, on_delete=models.SET_NULL, null=True, related_name="messages", db_index=False)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    attachment = models.ForeignKey(
+        Attachment,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="messages"
+    )
+
+    class Meta:
+        indexes = [
+            # History pages, last message and unread counts (covering, the
+            # user column lets the count skip the table)
+            models.Index(fields = ['room', 'timestamp', 'user'], name = 'messages_room_time_user_idx'),
+            # Transcript export across all rooms, keyset on (timestamp, id)
+            models.Index(fields = ['timestamp', 'id'], name = 'messages_time_id_idx'),
+        ]
+
+class ArchivedChatMessage(MessageContent):
+    """
+    Messages moved out of ChatMessage by the archiver (apps.chat.archive),
+    keeping their original id.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    room = models.ForeignKey(
+        ChatRoom,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="archived_messages",
+        db_index=False
+    )
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    attachment = models.ForeignKey(
+        Attachment,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="archived_messages"
+    )
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['room', 'timestamp'], name = 'archived_room_time_idx'),
+            models.Index(fields = ['timestamp', 'id'], name = 'archived_time_id_idx'),
+        ]
+
 class ChatRoomMembership(models.Model):
 
     user = models.ForeignKey(
@@ -132,6 +238,10 @@ class ChatRoomMembership(models.Model):
     class Meta:
         unique_together = ('user', 'room')
         ordering = ['-last_read_at']
+        indexes = [
+            # Delta sync and list validators read the user's read marks
+            models.Index(fields = ['user', 'last_read_at'], name = 'memberships_user_read_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.room.roomId}"
@@ -139,10 +249,114 @@ class ChatRoomMembership(models.Model):
     def get_unread_count(self):
 
         return ChatMessage.objects.filter(
-            room=self.room,
+            room_id=self.room_id,
             timestamp__gt=self.last_read_at
-        ).exclude(user=self.user).count()
+        ).exclude(user_id=self.user_id).count()
     
     def mark_as_read(self):
         self.last_read_at = timezone.now()
-        self.save(update_fields=['last_read_at'])
\ No newline at end of file
+        self.save(update_fields=['last_read_at'])
+
+class RoomTombstone(models.Model):
+    """
+    A room a user no longer sees, because they were removed from it or the
+    room was deleted. The delta sync reports them as `removed`.
+    """
+
+    roomId = models.CharField(max_length=22)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    removed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields = ['user', 'removed_at'], name = 'tombstones_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.roomId}"
+
+    @classmethod
+    def record(cls, roomId, user_ids):
+
+        now = timezone.now()
+        cls.objects.bulk_create([
+            cls(roomId = roomId, user_id = user_id, removed_at = now) for user_id in user_ids
+        ])
+
+class OutboxEvent(models.Model):
+
+    groups = models.JSONField(
+        default = list,
+        help_text = "Channel layer groups the event is delivered to"
+    )
+    payload = models.JSONField(
+        help_text = "Message sent to the consumers as 'chat_message'"
+    )
+    attempts = models.PositiveIntegerField(default = 0)
+    created_at = models.DateTimeField(auto_now_add = True)
+    dispatched_at = models.DateTimeField(
+        null = True,
+        blank = True,
+        db_index = True
+    )
+    claimed_by = models.CharField(
+        max_length = 32,
+        blank = True,
+        default = '',
+        help_text = "Dispatcher run currently sending the event"
+    )
+    next_attempt_at = models.DateTimeField(
+        null = True,
+        blank = True,
+        help_text = "Not taken again before this time: claim lease or retry backoff"
+    )
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.id} - {self.payload.get('action')}"
+
+
+class ChatUpload(models.Model):
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'pending'
+        COMPLETE = 'COMPLETE', 'complete'
+
+    uploadId = ShortUUIDField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_uploads")
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name="uploads")
+    message = models.TextField(null=True, blank=True)
+    file_name = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=100)
+    file_size = models.PositiveIntegerField(help_text="Declared size in bytes")
+    received = models.PositiveIntegerField(default=0)
+    checksum = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="SHA-256 (hex) declared by the client, checked on finalize"
+    )
+    status = models.CharField(
+        max_length=8,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields = ['status', 'updated_at'], name = 'uploads_status_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.uploadId} - {self.file_name}"
+
+    def get_part_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'chat_uploads', f"{self.uploadId}.part")
+
+    def is_image(self):
+        return self.file_type in settings.ALLOWED_IMAGE_TYPES
@@ -0,0 +1,218 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from V0X.settings import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_DISPATCH_INLINE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_CLAIM_TIMEOUT,
+    OUTBOX_RETRY_DELAY,
+    OUTBOX_RETRY_MAX_DELAY
+)
+from .models import OutboxEvent
+from datetime import timedelta
+import threading
+import uuid
+
+
+def user_groups(user_ids):
+    return [f"user_{user_id}" for user_id in user_ids]
+
+
+def publish_event(groups, message):
+    """
+    Stores a real-time event in the outbox. Call it inside the same
+    transaction as the write that produced it, the event only becomes
+    visible to the dispatcher once that transaction commits.
+    """
+
+    return publish_events([(groups, message)])[0]
+
+
+def publish_events(events):
+    """
+    Bulk version of `publish_event`, takes a list of (groups, message).
+    """
+
+    created = OutboxEvent.objects.bulk_create([
+        OutboxEvent(groups = list(groups), payload = message)
+        for groups, message in events
+    ])
+
+    if created and OUTBOX_DISPATCH_INLINE:
+        transaction.on_commit(wake_dispatcher)
+
+    return created
+
+
+def retry_delay(attempts):
+    """
+    Backoff before the next try of an event that failed `attempts` times.
+    """
+
+    return timedelta(seconds = min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_DELAY))
+
+
+def claim_events(batch_size):
+    """
+    Marks up to `batch_size` due events as taken by this run and returns
+    them. The claim is a conditional UPDATE, so two dispatchers (inline
+    threads, `dispatch_outbox` processes) never send the same event; an
+    event whose dispatcher died is due again once the lease expires. Each
+    claim counts as an attempt, an event that keeps crashing its dispatcher
+    is given up after OUTBOX_MAX_ATTEMPTS like one that keeps failing.
+    """
+
+    now = timezone.now()
+    due = Q(next_attempt_at__isnull = True) | Q(next_attempt_at__lte = now)
+    pending = OutboxEvent.objects.filter(
+        due,
+        dispatched_at__isnull = True,
+        attempts__lt = OUTBOX_MAX_ATTEMPTS
+    )
+
+    ids = list(pending.order_by('id').values_list('id', flat = True)[:batch_size])
+    if not ids:
+        return []
+
+    owner = uuid.uuid4().hex
+    claimed = pending.filter(id__in = ids).update(
+        claimed_by = owner,
+        attempts = F('attempts') + 1,
+        next_attempt_at = now + timedelta(seconds = OUTBOX_CLAIM_TIMEOUT)
+    )
+    if not claimed:
+        return []
+
+    return list(OutboxEvent.objects.filter(claimed_by = owner).order_by('id'))
+
+
+def dispatch_pending(batch_size = OUTBOX_BATCH_SIZE, channel_layer = None):
+    """
+    Delivers one batch of pending events. Returns the number of events
+    taken from the outbox (delivered or failed).
+    """
+
+    events = claim_events(batch_size)
+
+    if not events:
+        return 0
+
+    channel_layer = channel_layer or get_channel_layer()
+    delivered, failed = async_to_sync(_send_events)(channel_layer, events)
+
+    now = timezone.now()
+
+    if delivered:
+        OutboxEvent.objects.filter(id__in = delivered).update(
+            dispatched_at = now,
+            claimed_by = '',
+            next_attempt_at = None
+        )
+
+    # One update per attempt count, each gets its own backoff
+    failed_ids = set(failed)
+    failed_by_attempts = {}
+    for event in events:
+        if event.id in failed_ids:
+            failed_by_attempts.setdefault(event.attempts, []).append(event.id)
+
+    for attempts, ids in failed_by_attempts.items():
+        OutboxEvent.objects.filter(id__in = ids).update(
+            claimed_by = '',
+            next_attempt_at = now + retry_delay(attempts)
+        )
+
+    return len(events)
+
+
+def dispatch_all(batch_size = OUTBOX_BATCH_SIZE, channel_layer = None):
+
+    total = 0
+    while True:
+        count = dispatch_pending(batch_size, channel_layer)
+        if not count:
+            return total
+        total += count
+
+
+def purge_dispatched(older_than):
+
+    deleted, _ = OutboxEvent.objects.filter(
+        dispatched_at__lt = older_than
+    ).delete()
+    return deleted
+
+
+async def _send_events(channel_layer, events):
+
+    delivered = []
+    failed = []
+
+    for event in events:
+        try:
+            for group in event.groups:
+                await channel_layer.group_send(
+                    group,
+                    {
+                        'type': 'chat_message',
+                        'message': event.payload
+                    }
+                )
+            delivered.append(event.id)
+        except Exception as e:
+            print(f"[OUTBOX] Event {event.id} failed: {str(e)}")
+            failed.append(event.id)
+
+    return delivered, failed
+
+
+class OutboxDispatcher(threading.Thread):
+    """
+    In-process worker that drains the outbox after each commit. Needed when
+    the channel layer lives in memory, with a shared layer (redis) the
+    `dispatch_outbox` command can run as a separate process instead.
+    """
+
+    def __init__(self, interval = OUTBOX_POLL_INTERVAL):
+
+        super().__init__(name = "outbox-dispatcher", daemon = True)
+        self.interval = interval
+        self.pending = threading.Event()
+
+    def wake(self):
+        self.pending.set()
+
+    def run(self):
+
+        from django.db import close_old_connections
+
+        while True:
+            self.pending.wait(self.interval)
+            self.pending.clear()
+
+            try:
+                dispatch_all()
+            except Exception as e:
+                print(f"[OUTBOX] Dispatcher error: {str(e)}")
+            finally:
+                close_old_connections()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def wake_dispatcher():
+
+    global _dispatcher
+
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = OutboxDispatcher()
+            _dispatcher.start()
+
+    _dispatcher.wake()
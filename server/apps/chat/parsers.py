@@ -0,0 +1,21 @@
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline delimited JSON. Returns an iterator of (line number, raw line)
+    so the body is consumed as it is read instead of buffered whole.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+
+        if stream is None:
+            return iter(())
+
+        return (
+            (number, line)
+            for number, line in enumerate(stream, start=1)
+            if line.strip()
+        )
@@ -0,0 +1,149 @@
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from V0X.settings import (
+    THUMBNAIL_SIZE,
+    THUMBNAIL_PLACEHOLDER_SIZE,
+    THUMBNAIL_WORKERS
+)
+from .imaging import render_previews
+from .models import ChatRoom, ChatMessage
+from .cache import room_cache
+from .outbox import publish_event, user_groups
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers = THUMBNAIL_WORKERS,
+                mp_context = multiprocessing.get_context('spawn')
+            )
+    return _pool
+
+
+def thumbnail_name(message_id):
+    return f"chat_thumbnails/{message_id}.webp"
+
+
+def preview_job(message):
+    """
+    Arguments for `render_previews`, paths only so they can be pickled.
+    """
+
+    return (
+        message.image.path,
+        default_storage.path(thumbnail_name(message.id)),
+        THUMBNAIL_SIZE,
+        THUMBNAIL_PLACEHOLDER_SIZE,
+    )
+
+
+def save_previews(message_id, room_id, result):
+
+    ChatMessage.objects.filter(id = message_id).update(
+        image_width = result['width'],
+        image_height = result['height'],
+        thumbnail = thumbnail_name(message_id),
+        image_placeholder = result['placeholder']
+    )
+
+    # Conditional GETs of the history pick up the new preview, the room
+    # keeps its updated_at and so its place in the room lists
+    if room_id:
+        ChatRoom.objects.filter(id = room_id).update(messages_updated_at = timezone.now())
+        room_cache.invalidate(room_id)
+
+
+def reuse_previews(message):
+    """
+    Deduplicated images share one blob, so a message whose image was already
+    processed takes the existing previews instead of rendering them again.
+    """
+
+    source = ChatMessage.objects.filter(
+        image = message.image.name,
+        image_width__isnull = False
+    ).exclude(thumbnail = '').exclude(id = message.id).only(
+        'image_width', 'image_height', 'thumbnail', 'image_placeholder'
+    ).first()
+
+    if not source:
+        return False
+
+    ChatMessage.objects.filter(id = message.id).update(
+        image_width = source.image_width,
+        image_height = source.image_height,
+        thumbnail = source.thumbnail.name,
+        image_placeholder = source.image_placeholder
+    )
+    message.image_width = source.image_width
+    message.image_height = source.image_height
+    message.thumbnail = source.thumbnail.name
+    message.image_placeholder = source.image_placeholder
+
+    return True
+
+
+def schedule_previews(message):
+    """
+    Queues thumbnail generation for an image message once the current
+    transaction commits. Returns immediately, the request never waits.
+    """
+
+    if not message.image:
+        return
+
+    if reuse_previews(message):
+        return
+
+    message_id = message.id
+    room_id = message.room_id
+    job = preview_job(message)
+
+    def submit():
+        future = get_pool().submit(render_previews, *job)
+        future.add_done_callback(lambda done: _on_previews_done(message_id, room_id, done))
+
+    transaction.on_commit(submit)
+
+
+def _on_previews_done(message_id, room_id, future):
+
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"[PREVIEWS] Message {message_id} failed: {str(e)}")
+        return
+
+    try:
+        save_previews(message_id, room_id, result)
+
+        message = ChatMessage.objects.select_related('room').get(id = message_id)
+        if message.room:
+            members = message.room.member.values_list('id', flat=True)
+            publish_event(
+                user_groups(members),
+                {
+                    'action': 'preview',
+                    'roomId': message.room.roomId,
+                    'messageId': message_id,
+                    'thumbnail': message.thumbnail.url,
+                    'imageWidth': result['width'],
+                    'imageHeight': result['height'],
+                    'placeholder': result['placeholder'],
+                }
+            )
+    except Exception as e:
+        print(f"[PREVIEWS] Message {message_id} not updated: {str(e)}")
+    finally:
+        close_old_connections()
@@ -0,0 +1,315 @@
+"""
+Retention policies: rooms of a type idle for RETENTION_ROOM_DAYS and users
+of a type inactive for RETENTION_USER_DAYS (with the rooms they created)
+are deleted, together with their messages and files.
+
+Every delete is a small transaction of at most `batch_size` rows followed
+by a short pause, so the job never keeps the SQLite write lock for long.
+Files are removed after the transaction commits and only when no remaining
+row references them. Deduplicated blobs are not touched, once unreferenced
+`sweep_attachments` reclaims them after its grace period.
+"""
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from apps.user.models import User
+from V0X.settings import (
+    RETENTION_ROOM_DAYS,
+    RETENTION_USER_DAYS,
+    RETENTION_BATCH_SIZE,
+    RETENTION_BATCH_PAUSE,
+    DELTA_SYNC_TOMBSTONE_DAYS,
+    UPLOAD_EXPIRE_HOURS
+)
+from .models import ChatRoom, ChatMessage, ArchivedChatMessage, ChatUpload, RoomTombstone
+from datetime import timedelta
+import os
+import time
+
+MESSAGE_MODELS = (ChatMessage, ArchivedChatMessage)
+
+
+def expired_users(now = None, user_days = RETENTION_USER_DAYS):
+    """
+    Users of a type with a retention period that joined before it and have
+    no room with activity inside it.
+    """
+
+    now = now or timezone.now()
+    condition = Q(pk__in = [])
+
+    for code, days in user_days.items():
+        cutoff = now - timedelta(days = days)
+        condition |= Q(user_type__code = code, date_joined__lt = cutoff) & (
+            Q(last_login__isnull = True) | Q(last_login__lt = cutoff)
+        ) & ~Q(chatroom__updated_at__gte = cutoff)
+
+    return User.objects.filter(condition).distinct()
+
+
+def abandoned_uploads(now = None, expire_hours = UPLOAD_EXPIRE_HOURS):
+    """
+    Pending chunked uploads that received nothing for `expire_hours`.
+    """
+
+    now = now or timezone.now()
+
+    return ChatUpload.objects.filter(
+        status = ChatUpload.Status.PENDING,
+        updated_at__lt = now - timedelta(hours = expire_hours)
+    )
+
+
+def expired_rooms(now = None, room_days = RETENTION_ROOM_DAYS, user_days = RETENTION_USER_DAYS):
+
+    now = now or timezone.now()
+    condition = Q(created_by__in = expired_users(now, user_days).values('id'))
+
+    for room_type, days in room_days.items():
+        condition |= Q(type = room_type, updated_at__lt = now - timedelta(days = days))
+
+    return ChatRoom.objects.filter(condition)
+
+
+class RetentionReport:
+
+    def __init__(self):
+
+        self.rooms = 0
+        self.messages = 0
+        self.users = 0
+        self.uploads = 0
+        self.files = 0
+        self.bytes = 0
+
+    def __str__(self):
+        return (
+            f"{self.rooms} rooms, {self.messages} messages, {self.users} users, "
+            f"{self.uploads} abandoned uploads, {self.files} files ({self.bytes / (1024 * 1024):.2f} MB)"
+        )
+
+
+class RetentionJob:
+
+    def __init__(
+        self,
+        now = None,
+        batch_size = RETENTION_BATCH_SIZE,
+        pause = RETENTION_BATCH_PAUSE,
+        dry_run = False,
+        room_days = RETENTION_ROOM_DAYS,
+        user_days = RETENTION_USER_DAYS,
+        upload_hours = UPLOAD_EXPIRE_HOURS
+    ):
+
+        self.now = now or timezone.now()
+        self.batch_size = batch_size
+        self.pause = pause
+        self.dry_run = dry_run
+        self.room_days = room_days
+        self.user_days = user_days
+        self.upload_hours = upload_hours
+        self.report = RetentionReport()
+
+    def run(self):
+
+        # Rooms first: their messages reference the users deleted afterwards
+        rooms = expired_rooms(self.now, self.room_days, self.user_days)
+        for room_id in self.iter_ids(rooms):
+            self.purge_room(room_id)
+
+        users = expired_users(self.now, self.user_days)
+        for user_ids in self.iter_batches(users):
+            self.purge_users(user_ids)
+
+        uploads = abandoned_uploads(self.now, self.upload_hours)
+        for upload_ids in self.iter_batches(uploads):
+            self.purge_uploads(upload_ids)
+
+        # Watermarks this old get a full sync, their tombstones are not read
+        tombstones = RoomTombstone.objects.filter(
+            removed_at__lt = self.now - timedelta(days = DELTA_SYNC_TOMBSTONE_DAYS)
+        )
+        self.commit(lambda: tombstones.delete())
+
+        return self.report
+
+    def iter_batches(self, queryset):
+        """
+        Id batches in keyset order. In dry-run nothing is deleted, so the
+        next batch starts after the last id seen.
+        """
+
+        last_id = 0
+
+        while True:
+            ids = list(
+                queryset.filter(id__gt = last_id).order_by('id').values_list('id', flat = True)[:self.batch_size]
+            )
+            if not ids:
+                return
+
+            yield ids
+            last_id = ids[-1]
+
+    def iter_ids(self, queryset):
+
+        for ids in self.iter_batches(queryset):
+            yield from ids
+
+    def commit(self, delete):
+        """
+        Runs `delete` in its own short transaction, then pauses.
+        """
+
+        if self.dry_run:
+            return None
+
+        with transaction.atomic():
+            result = delete()
+
+        if self.pause:
+            time.sleep(self.pause)
+
+        return result
+
+    def purge_messages(self, room_id):
+
+        for model in MESSAGE_MODELS:
+            for ids in self.iter_batches(model.objects.filter(room_id = room_id)):
+
+                rows = list(model.objects.filter(id__in = ids).values('attachment_id', 'image', 'file', 'thumbnail'))
+                self.commit(lambda: model.objects.filter(id__in = ids).delete())
+
+                self.report.messages += len(ids)
+                self.delete_message_files(rows, model, ids)
+
+    def purge_room(self, room_id):
+
+        part_paths = [upload.get_part_path() for upload in ChatUpload.objects.filter(room_id = room_id).only('uploadId')]
+
+        def delete_room():
+            # Messages sent since the batches went through another round
+            if any(model.objects.filter(room_id = room_id).exists() for model in MESSAGE_MODELS):
+                return False
+
+            # Memberships and uploads cascade
+            ChatRoom.objects.filter(id = room_id).delete()
+            return True
+
+        while True:
+            self.purge_messages(room_id)
+            if self.dry_run or self.commit(delete_room):
+                break
+
+        self.report.rooms += 1
+
+        for path in part_paths:
+            self.delete_path(path)
+
+    def purge_users(self, user_ids):
+
+        users = list(User.objects.filter(id__in = user_ids).only('id', 'image', 'image_variants'))
+        part_paths = [
+            upload.get_part_path()
+            for upload in ChatUpload.objects.filter(user_id__in = user_ids).only('uploadId')
+        ]
+
+        # Online status, memberships and uploads cascade, messages in rooms
+        # that are kept lose their author
+        self.commit(lambda: User.objects.filter(id__in = user_ids).delete())
+        self.report.users += len(user_ids)
+
+        self.delete_avatar_files(users)
+        for path in part_paths:
+            self.delete_path(path)
+
+    def purge_uploads(self, upload_ids):
+
+        expired = abandoned_uploads(self.now, self.upload_hours).filter(id__in = upload_ids)
+
+        def delete_uploads():
+            # A chunk may have arrived since the batch was read, that upload stays
+            uploads = list(expired.only('id', 'uploadId'))
+            ChatUpload.objects.filter(id__in = [upload.id for upload in uploads]).delete()
+            return uploads
+
+        uploads = self.commit(delete_uploads)
+        if uploads is None:
+            uploads = list(expired.only('id', 'uploadId'))
+
+        self.report.uploads += len(uploads)
+        for upload in uploads:
+            self.delete_path(upload.get_part_path())
+
+    def delete_message_files(self, rows, deleted_model, deleted_ids):
+
+        # Blob backed messages share files, those are left to sweep_attachments
+        names = set()
+        for row in rows:
+            if not row['attachment_id']:
+                names.update(name for name in (row['image'], row['file']) if name)
+            if row['thumbnail']:
+                # Thumbnails are shared between messages of the same image
+                names.add(row['thumbnail'])
+
+        if not names:
+            return
+
+        # Excluding the batch keeps the dry-run report close to a real run
+        referenced = set()
+        for model in MESSAGE_MODELS:
+            remaining = model.objects.filter(Q(image__in = names) | Q(file__in = names) | Q(thumbnail__in = names))
+            if model is deleted_model:
+                remaining = remaining.exclude(id__in = deleted_ids)
+            for values in remaining.values_list('image', 'file', 'thumbnail'):
+                referenced.update(values)
+
+        for name in names - referenced:
+            self.delete_name(name)
+
+    def delete_avatar_files(self, users):
+
+        names = set()
+        for user in users:
+            if user.image:
+                names.add(user.image.name)
+            names.update((user.image_variants or {}).values())
+
+        if not names:
+            return
+
+        # Variants are content addressed, users with the same picture share them
+        others = User.objects.exclude(id__in = [user.id for user in users])
+        referenced = set(others.filter(image__in = names).values_list('image', flat = True))
+        for variants in others.filter(image_variants__isnull = False).values_list('image_variants', flat = True):
+            referenced.update((variants or {}).values())
+
+        for name in names - referenced:
+            self.delete_name(name)
+
+    def delete_name(self, name):
+
+        try:
+            size = default_storage.size(name)
+        except OSError:
+            return
+
+        if not self.dry_run:
+            default_storage.delete(name)
+
+        self.report.files += 1
+        self.report.bytes += size
+
+    def delete_path(self, path):
+
+        if not os.path.exists(path):
+            return
+
+        size = os.path.getsize(path)
+        if not self.dry_run:
+            os.remove(path)
+
+        self.report.files += 1
+        self.report.bytes += size
@@ -1,10 +1,17 @@
 from rest_framework import serializers
-from apps.chat.models import ChatRoom, ChatMessage, ChatRoomMembership
+from apps.chat.models import ChatRoom, ChatMessage
 from apps.user.serializers import UserSerializer
 from apps.user.models import User
+from apps.user.loader import get_request_user
 from django.db.models import Q
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from .cache import room_cache
+from .memberships import create_rooms
+from .fieldsets import SparseFieldsetMixin, MemberIdsField
+from V0X.settings import BULK_MEMBERS_MAX, BULK_ROOMS_MAX
 
-class ChatRoomSerializer(serializers.ModelSerializer):
+class ChatRoomSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     member = UserSerializer(many=True, read_only=True)
     members = serializers.ListField(write_only=True)
@@ -12,21 +19,83 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     last_message = serializers.SerializerMethodField()
     last_message_at = serializers.SerializerMethodField()
 
+    # Fields that depend on the requesting user, never cached
+    per_user_fields = ('unread_count',)
+
+    compact_fields = {'member': MemberIdsField}
+
+    def to_representation(self, instance):
+
+        request = self.context.get('request')
+        variant = (request.build_absolute_uri('/') if request else '') + self.fieldset_key()
+
+        shared = room_cache.get(instance.pk, variant)
+
+        if shared is None:
+            shared = self.to_shared_representation(instance)
+            room_cache.set(instance.pk, variant, shared)
+
+        ret = {}
+        for field in self._readable_fields:
+            if field.field_name in self.per_user_fields:
+                ret[field.field_name] = field.to_representation(field.get_attribute(instance))
+            elif field.field_name in shared:
+                ret[field.field_name] = shared[field.field_name]
+
+        users = self.context.get('users')
+        if users is not None:
+            users.add(*ret.get('member', []))
+
+        return ret
+
+    def to_shared_representation(self, instance):
+
+        ret = {}
+        for field in self._readable_fields:
+
+            if field.field_name in self.per_user_fields:
+                continue
+
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+
+            check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            if check_for_none is None:
+                ret[field.field_name] = None
+            else:
+                ret[field.field_name] = field.to_representation(attribute)
+
+        return ret
+
     def get_unread_count(self, obj):
 
+        # Precomputed for a whole page of rooms (bootstrap)
+        unread_counts = self.context.get('unread_counts')
+        if unread_counts is not None:
+            return unread_counts.get(obj.id, 0)
+
         request = self.context.get('request')
 
         if request and request.user.is_authenticated:
             try:
-                user = User.objects.get(id=request.user.id)
+                user = get_request_user(request)
                 return obj.get_unread_count_for_user(user)
             except User.DoesNotExist:
                 return 0
         return 0
     
+    def last_message_for(self, obj):
+
+        last_messages = self.context.get('last_messages')
+        if last_messages is not None:
+            return last_messages.get(obj.id)
+        return obj.get_last_message()
+
     def get_last_message(self, obj):
 
-        last_msg = obj.get_last_message()
+        last_msg = self.last_message_for(obj)
         if last_msg:
             if last_msg.image and not last_msg.message:
                 return "[Imagen]"
@@ -35,7 +104,7 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     
     def get_last_message_at(self, obj):
 
-        last_msg = obj.get_last_message()
+        last_msg = self.last_message_for(obj)
 
         if last_msg:
             return last_msg.timestamp
@@ -43,30 +112,24 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     
     def create(self, validatedData):
 
-        memberUserIds = validatedData.pop('members')
-        chat_room = ChatRoom.objects.create(**validatedData)
-        users = User.objects.filter(id__in=memberUserIds)
-        chat_room.member.set(users)
-
-        for user in users:
-            ChatRoomMembership.objects.get_or_create(
-                user=user,
-                room=chat_room
-            )
-        
-        return chat_room
+        return next(iter(create_rooms([validatedData])))
     
     class Meta:
         model = ChatRoom
-        exclude = ['id']
+        exclude = ['id', 'messages_updated_at']
     
-class ChatMessageSerializer(serializers.ModelSerializer):
+# History pages are rendered by apps.chat.fastread, keep its output in step
+class ChatMessageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     userName = serializers.SerializerMethodField()
     userImage = serializers.SerializerMethodField()
     userId = serializers.SerializerMethodField()
     roomId = serializers.CharField(write_only=True, required=False)
     
     image = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    imageWidth = serializers.IntegerField(source="image_width", read_only=True)
+    imageHeight = serializers.IntegerField(source="image_height", read_only=True)
+    placeholder = serializers.CharField(source="image_placeholder", read_only=True)
     file = serializers.SerializerMethodField()
     fileName = serializers.CharField(source="file_name", read_only=True)
     fileType = serializers.CharField(source="file_type", read_only=True)
@@ -78,11 +141,25 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         fields = [
             'roomId', 'user', 'userId',
             'message', 'timestamp', 'userName', 
-            'userImage', 'image', 'file',
+            'userImage', 'image', 'thumbnail',
+            'imageWidth', 'imageHeight', 'placeholder', 'file',
             'fileName', 'fileType', 'fileSize'
         ]
         read_only_fields = ['messageId', 'timestamp', 'userName', 'userImage', 'userId']
 
+    # Compact payloads describe the author once, in the response `users`
+    compact_fields = {'userName': None, 'userImage': None}
+
+    def to_representation(self, instance):
+
+        ret = super().to_representation(instance)
+
+        users = self.context.get('users')
+        if users is not None:
+            users.add(ret.get('userId'))
+
+        return ret
+
     def get_image(self, obj):
 
         if obj.image:
@@ -92,6 +169,15 @@ class ChatMessageSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
     
+    def get_thumbnail(self, obj):
+
+        if obj.thumbnail:
+            request = self.context.get("request")
+            if request:
+                return request.build_absolute_uri(obj.thumbnail.url)
+            return obj.thumbnail.url
+        return None
+
     def get_file(self, obj):
 
         if obj.file:
@@ -110,8 +196,8 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         if obj.user and obj.user.image:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(obj.user.image.url)
-            return obj.user.image.url
+                return request.build_absolute_uri(obj.user.avatar_url())
+            return obj.user.avatar_url()
         return None
     
     def get_userId(self, obj):
@@ -123,4 +209,27 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     def validate_roomId(self, value):
         if not ChatRoom.objects.filter(roomId=value).exists():
             raise serializers.ValidationError("Chat room with this id doesnt exists")
-        return value
\ No newline at end of file
+        return value
+
+
+class RoomMembersSerializer(serializers.Serializer):
+
+    members = serializers.ListField(
+        child = serializers.IntegerField(min_value = 1),
+        allow_empty = False,
+        max_length = BULK_MEMBERS_MAX
+    )
+
+
+class BulkGroupRoomSerializer(serializers.Serializer):
+
+    name = serializers.CharField(max_length = 20, required = False, allow_null = True)
+    members = serializers.ListField(
+        child = serializers.IntegerField(min_value = 1),
+        max_length = BULK_MEMBERS_MAX
+    )
+
+
+class BulkGroupRoomsSerializer(serializers.Serializer):
+
+    rooms = BulkGroupRoomSerializer(many = True, allow_empty = False, max_length = BULK_ROOMS_MAX)
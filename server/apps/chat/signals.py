@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_delete
+from django.dispatch import receiver
+from apps.user.models import User
+from .models import ChatRoom, ChatMessage, ChatRoomMembership, RoomTombstone
+from .cache import room_cache
+
+# Fields of User rendered inside the cached room payloads
+ROOM_PAYLOAD_USER_FIELDS = {'username', 'email', 'image', 'first_name', 'last_name'}
+
+
+def invalidate_after_commit(*room_ids):
+    """
+    Until the write commits, readers still see the old rows and would cache
+    them again, so the entries are dropped once it is visible.
+    """
+
+    room_ids = list(room_ids)
+    transaction.on_commit(lambda: room_cache.invalidate(*room_ids))
+
+
+@receiver(post_save, sender=ChatMessage)
+@receiver(post_delete, sender=ChatMessage)
+def invalidate_message_room(sender, instance, **kwargs):
+    invalidate_after_commit(instance.room_id)
+
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def invalidate_room(sender, instance, **kwargs):
+    invalidate_after_commit(instance.id)
+
+
+@receiver(m2m_changed, sender=ChatRoom.member.through)
+def invalidate_room_members(sender, instance, action, reverse, pk_set, **kwargs):
+
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        invalidate_after_commit(instance.id)
+    elif pk_set:
+        invalidate_after_commit(*pk_set)
+    else:
+        invalidate_after_commit(*ChatRoom.objects.filter(member=instance).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=ChatRoom.member.through)
+def create_room_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Read marks exist from the moment a member is added. Created lazily by
+    the first serialization, they would change the room list validators
+    right after a client received them.
+    """
+
+    if action != 'post_add' or not pk_set:
+        return
+
+    if reverse:
+        memberships = [ChatRoomMembership(user = instance, room_id = room_id) for room_id in pk_set]
+    else:
+        memberships = [ChatRoomMembership(user_id = user_id, room = instance) for user_id in pk_set]
+
+    ChatRoomMembership.objects.bulk_create(memberships, ignore_conflicts = True)
+
+
+@receiver(post_save, sender=User)
+@receiver(pre_delete, sender=User)
+def invalidate_user_rooms(sender, instance, update_fields=None, **kwargs):
+
+    if update_fields and not ROOM_PAYLOAD_USER_FIELDS.intersection(update_fields):
+        return
+
+    if kwargs.get('created'):
+        return
+
+    invalidate_after_commit(*ChatRoom.objects.filter(member=instance).values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=ChatRoom)
+def tombstone_deleted_room(sender, instance, **kwargs):
+    RoomTombstone.record(instance.roomId, list(instance.member.values_list('id', flat=True)))
+
+
+@receiver(m2m_changed, sender=ChatRoom.member.through)
+def tombstone_removed_members(sender, instance, action, reverse, pk_set, **kwargs):
+
+    if action not in ('post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        user_ids = pk_set if action == 'post_remove' else instance.member.values_list('id', flat=True)
+        RoomTombstone.record(instance.roomId, list(user_ids))
+        return
+
+    rooms = ChatRoom.objects.filter(member=instance) if action == 'pre_clear' else ChatRoom.objects.filter(id__in=pk_set)
+    for roomId in rooms.values_list('roomId', flat=True):
+        RoomTombstone.record(roomId, [instance.id])
@@ -1,3 +1,1783 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.utils import timezone
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from asgiref.sync import async_to_sync
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.chat.models import Attachment, ChatRoom, ChatMessage, ArchivedChatMessage, ChatRoomMembership, RoomTombstone, OutboxEvent, ChatUpload
+from apps.chat.memberships import create_rooms, remove_members
+from apps.chat.outbox import publish_event, dispatch_pending, wake_dispatcher
+from V0X.settings import OUTBOX_MAX_ATTEMPTS, TIME_HOUR_CHAT_EXPIRED, MEDIA_URL_TTL, MEDIA_URL_WINDOW
+from apps.chat.conditional import room_list_validators, message_list_validators
+from apps.chat.writer import database_write_to_async
+from apps.chat.ingest import MessageIngestor
+from apps.chat.export import fetch_chunk, transcript_querysets, stream_transcript
+from apps.chat.media import parse_range
+from apps.chat.storage import sign_media, verify_media
+from apps.chat.views import ChatRoomCreateView, ChunkedUploadDetailView
+from apps.chat.serializers import ChatRoomSerializer, ChatMessageSerializer
+from apps.chat.cache import DjangoCacheBackend, room_cache
+from apps.chat.archive import archive_batch, archive_messages, room_history
+from apps.chat.retention import RetentionJob
+from apps.chat.mediagc import MediaCollector
+from apps.chat.fastread import message_rows, render_messages
+from apps.chat.previews import schedule_previews, thumbnail_name
+from apps.chat.blobs import store_path, store_uploaded_file
+from apps.chat.fieldsets import fieldset_context
+from apps.chat.compression import CompressionMiddleware, negotiate
+from apps.user.models import User, UserType
+from concurrent.futures import Future
+from datetime import timedelta
+from PIL import Image
+from unittest import mock
+from urllib.parse import parse_qs
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+# Writes per second the stress tests must sustain without lock errors
+TARGET_WRITE_RATE = 200
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    """
+    Runs against a temporary database file with the production OPTIONS,
+    the test database lives in memory where WAL does not apply.
+    """
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'stress.sqlite3')
+        self.wrappers = []
+
+    def tearDown(self):
+
+        for wrapper in self.wrappers:
+            wrapper.close()
+        self.directory.cleanup()
+
+    def open(self):
+
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': self.path}, alias = 'stress')
+        wrapper.ensure_connection()
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def test_pragmas_applied(self):
+
+        with self.open().cursor() as cursor:
+            pragmas = {
+                name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store')
+            }
+
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual(pragmas['synchronous'], 1) # NORMAL
+        self.assertEqual(pragmas['busy_timeout'], 5000)
+        self.assertEqual(pragmas['cache_size'], -20000)
+        self.assertEqual(pragmas['temp_store'], 2) # MEMORY
+
+    def test_concurrent_writers_without_lock_errors(self):
+
+        threads_count = 8
+        writes_per_thread = 150
+
+        with self.open().cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)")
+            cursor.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, worker INTEGER)")
+            cursor.execute("INSERT INTO counter (id, value) VALUES (1, 0)")
+
+        errors = []
+        barrier = threading.Barrier(threads_count)
+
+        def worker(index):
+
+            # Connections belong to the thread that opened them
+            wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': self.path}, alias = 'stress')
+            barrier.wait()
+
+            # Read-modify-write: with DEFERRED transactions the read lock
+            # upgrade fails with "database is locked" under contention
+            with wrapper.cursor() as cursor:
+                for _ in range(writes_per_thread):
+                    try:
+                        cursor.execute(f"BEGIN {wrapper.transaction_mode}")
+                        value = cursor.execute("SELECT value FROM counter WHERE id = 1").fetchone()[0]
+                        cursor.execute("UPDATE counter SET value = %s WHERE id = 1", [value + 1])
+                        cursor.execute("INSERT INTO events (worker) VALUES (%s)", [index])
+                        cursor.execute("COMMIT")
+                    except Exception as e:
+                        errors.append(str(e))
+                        wrapper.connection.rollback()
+
+            wrapper.close()
+
+        threads = [
+            threading.Thread(target = worker, args = (index,))
+            for index in range(threads_count)
+        ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with self.open().cursor() as cursor:
+            counter = cursor.execute("SELECT value FROM counter WHERE id = 1").fetchone()[0]
+            events = cursor.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+        total = threads_count * writes_per_thread
+
+        self.assertEqual(errors, [])
+        self.assertEqual(counter, total)
+        self.assertEqual(events, total)
+        self.assertGreaterEqual(total / elapsed, TARGET_WRITE_RATE)
+
+
+class WriteQueueTests(TransactionTestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create(username = 'writer', email = 'writer@example.com')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'stress')
+
+    def test_async_writes_are_serialized(self):
+
+        total = 500
+
+        @database_write_to_async
+        def save(index):
+            ChatMessage.objects.create(room = self.room, user = self.user, message = f"message {index}")
+
+        async def main():
+
+            ticks = 0
+            done = asyncio.Event()
+
+            async def heartbeat():
+                # The event loop keeps running while writes are queued
+                nonlocal ticks
+                while not done.is_set():
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            beat = asyncio.create_task(heartbeat())
+            results = await asyncio.gather(*(save(index) for index in range(total)), return_exceptions = True)
+            done.set()
+            await beat
+
+            return results, ticks
+
+        started = time.perf_counter()
+        results, ticks = async_to_sync(main)()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual([result for result in results if isinstance(result, Exception)], [])
+        self.assertEqual(ChatMessage.objects.filter(room = self.room).count(), total)
+        self.assertGreater(ticks, 0)
+        self.assertGreaterEqual(total / elapsed, TARGET_WRITE_RATE)
+
+
+class QueryPlanMixin:
+    """
+    Runs EXPLAIN QUERY PLAN on every query a callable executes and fails
+    when SQLite scans a whole table instead of searching an index.
+    """
+
+    def query_plans(self, run):
+
+        with CaptureQueriesContext(connection) as context:
+            run()
+
+        self.assertTrue(context.captured_queries, "no query executed")
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                cursor.execute("EXPLAIN QUERY PLAN " + query['sql'])
+                plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertNoFullScan(self, run):
+
+        for sql, details in self.query_plans(run):
+            for detail in details:
+                # "SCAN table" reads every row, "SCAN table USING INDEX" walks an index
+                full_scan = detail.startswith('SCAN ') and 'USING' not in detail
+                self.assertFalse(full_scan, f"{detail}\n{sql}")
+
+    def assertUsesIndex(self, run, index):
+
+        details = [detail for _, details in self.query_plans(run) for detail in details]
+        self.assertTrue(
+            any(index in detail for detail in details),
+            f"{index} not used:\n" + "\n".join(details)
+        )
+
+
+class HotQueryPlanTests(QueryPlanMixin, TestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create(username = 'agent', email = 'agent@example.com')
+        self.other = User.objects.create(username = 'guest', email = 'guest@example.com')
+
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.SUPPORT, created_by = self.other)
+        self.room.member.add(self.user, self.other)
+        self.membership = self.room.get_membership(self.user)
+
+        ChatMessage.objects.create(room = self.room, user = self.other, message = 'hello')
+
+    def test_message_history(self):
+
+        history = ChatMessage.objects.filter(
+            room__roomId = self.room.roomId
+        ).select_related('user').order_by('-timestamp')
+
+        self.assertNoFullScan(lambda: list(history.all()[:50]))
+        self.assertUsesIndex(lambda: list(history.all()[:50]), 'messages_room_time_user_idx')
+
+    def test_last_message(self):
+
+        self.assertNoFullScan(self.room.get_last_message)
+        self.assertUsesIndex(self.room.get_last_message, 'messages_room_time_user_idx')
+
+    def test_unread_count(self):
+
+        self.assertNoFullScan(self.membership.get_unread_count)
+        self.assertUsesIndex(self.membership.get_unread_count, 'messages_room_time_user_idx')
+
+    def test_support_queue(self):
+
+        queue = ChatRoom.objects.filter(type = ChatRoom.ChatType.SUPPORT).order_by('-updated_at')
+
+        self.assertNoFullScan(lambda: list(queue.all()))
+        self.assertUsesIndex(lambda: list(queue.all()), 'rooms_type_updated_idx')
+
+    def test_support_expiry(self):
+
+        expired = ChatRoom.objects.filter(
+            type = ChatRoom.ChatType.SUPPORT,
+            taken_at__lt = timezone.now() - timedelta(hours = 1)
+        ).values_list('id', flat = True)
+
+        self.assertNoFullScan(lambda: list(expired.all()))
+
+    def test_assigned_chats(self):
+
+        assigned = ChatRoom.objects.filter(
+            assigned_agent = self.user,
+            type = ChatRoom.ChatType.SUPPORT
+        ).order_by('-updated_at')
+
+        self.assertNoFullScan(lambda: list(assigned.all()))
+        self.assertUsesIndex(lambda: list(assigned.all()), 'rooms_agent_type_idx')
+
+    def test_room_by_room_id(self):
+
+        self.assertNoFullScan(lambda: ChatRoom.objects.get(roomId = self.room.roomId))
+
+    def test_user_rooms(self):
+
+        rooms = ChatRoom.objects.filter(member = self.user).order_by('-updated_at')
+
+        self.assertNoFullScan(lambda: list(rooms.all()))
+
+    def test_memberships_by_user(self):
+
+        memberships = ChatRoomMembership.objects.filter(
+            user = self.user,
+            last_read_at__gt = timezone.now() - timedelta(days = 1)
+        )
+
+        self.assertNoFullScan(lambda: list(memberships.all()))
+
+    def test_list_validators(self):
+
+        rooms = ChatRoom.objects.filter(member = self.user)
+
+        self.assertNoFullScan(lambda: room_list_validators(rooms, self.user))
+        self.assertNoFullScan(lambda: message_list_validators(self.room, self.user))
+
+    def test_transcript_export(self):
+
+        since = timezone.now() - timedelta(days = 1)
+        last = (timezone.now(), 1)
+
+        for queryset in transcript_querysets(since = since):
+            index = 'archived_time_id_idx' if queryset.model is ArchivedChatMessage else 'messages_time_id_idx'
+
+            self.assertNoFullScan(lambda: fetch_chunk(queryset))
+            self.assertUsesIndex(lambda: fetch_chunk(queryset), index)
+            self.assertNoFullScan(lambda: fetch_chunk(queryset, last))
+
+
+class FakeChannelLayer:
+
+    def __init__(self, fail = False):
+        self.fail = fail
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if self.fail:
+            raise ConnectionError('layer down')
+        self.sent.append((group, message['message']))
+
+
+class OutboxTests(TestCase):
+
+    def publish(self, action = 'new_message'):
+        return publish_event(['user_1'], {'action': action})
+
+    def test_commit_then_deliver(self):
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.publish()
+
+        self.assertEqual(callbacks, [wake_dispatcher])
+
+        layer = FakeChannelLayer()
+        self.assertEqual(dispatch_pending(channel_layer = layer), 1)
+        self.assertEqual(layer.sent, [('user_1', {'action': 'new_message'})])
+
+        event = OutboxEvent.objects.get()
+        self.assertIsNotNone(event.dispatched_at)
+        self.assertEqual(event.claimed_by, '')
+
+        # Delivered once
+        self.assertEqual(dispatch_pending(channel_layer = layer), 0)
+
+    def test_rollback_then_nothing(self):
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    self.publish()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        layer = FakeChannelLayer()
+        self.assertEqual(dispatch_pending(channel_layer = layer), 0)
+        self.assertEqual(layer.sent, [])
+
+    def test_claimed_events_are_skipped(self):
+
+        event = self.publish()
+        OutboxEvent.objects.filter(id = event.id).update(
+            claimed_by = 'other', next_attempt_at = timezone.now() + timedelta(seconds = 60)
+        )
+
+        layer = FakeChannelLayer()
+        self.assertEqual(dispatch_pending(channel_layer = layer), 0)
+
+        # The other dispatcher died, its lease ran out
+        OutboxEvent.objects.filter(id = event.id).update(next_attempt_at = timezone.now() - timedelta(seconds = 1))
+        self.assertEqual(dispatch_pending(channel_layer = layer), 1)
+        self.assertEqual(len(layer.sent), 1)
+
+    def test_crashed_claims_count_as_attempts(self):
+
+        event = self.publish()
+
+        # The dispatcher dies mid-send every time, the lease runs out
+        for attempt in range(1, OUTBOX_MAX_ATTEMPTS + 1):
+            with mock.patch('apps.chat.outbox._send_events', side_effect = SystemExit):
+                with self.assertRaises(SystemExit):
+                    dispatch_pending(channel_layer = FakeChannelLayer())
+
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, attempt)
+            OutboxEvent.objects.filter(id = event.id).update(next_attempt_at = timezone.now() - timedelta(seconds = 1))
+
+        # Given up, like an event that keeps failing
+        layer = FakeChannelLayer()
+        self.assertEqual(dispatch_pending(channel_layer = layer), 0)
+        self.assertEqual(layer.sent, [])
+
+    def test_failed_events_back_off(self):
+
+        event = self.publish()
+
+        self.assertEqual(dispatch_pending(channel_layer = FakeChannelLayer(fail = True)), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 1)
+        self.assertIsNone(event.dispatched_at)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+
+        # Not retried before the delay
+        layer = FakeChannelLayer()
+        self.assertEqual(dispatch_pending(channel_layer = layer), 0)
+
+        OutboxEvent.objects.filter(id = event.id).update(next_attempt_at = timezone.now())
+        self.assertEqual(dispatch_pending(channel_layer = layer), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNotNone(event.dispatched_at)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+
+        # Room ids are reused between tests, the process-wide payload cache
+        # is not rolled back with them
+        room_cache.clear()
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com')
+
+        # A DM the user did not create, whose history is old enough to archive
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.DM, created_by = self.other)
+        self.room.member.add(self.user, self.other)
+
+        start = timezone.now() - timedelta(days = 400)
+        for index in range(5):
+            ChatMessage.objects.create(
+                room = self.room, user = self.other, message = f"old {index}",
+                timestamp = start + timedelta(minutes = index)
+            )
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def listed_rooms(self):
+        return [room['roomId'] for room in self.client.get('/api/v1/user/chats').data['results']]
+
+    def test_archived_room_stays_listed(self):
+
+        self.assertEqual(self.listed_rooms(), [self.room.roomId])
+
+        self.assertEqual(sum(archive_messages()), 5)
+        self.assertFalse(ChatMessage.objects.filter(room = self.room).exists())
+
+        self.assertEqual(self.listed_rooms(), [self.room.roomId])
+
+        response = self.client.get(f'/api/v1/chats/messages/{self.room.roomId}?limit=2&offset=2')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([message['message'] for message in response.data['results']], ['old 2', 'old 1'])
+
+
+class IngestTests(TestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'ingest', created_by = self.user)
+        self.room.member.add(self.user)
+
+    def test_malformed_values_are_line_errors(self):
+
+        room_id = self.room.roomId
+        lines = [
+            json.dumps({'roomId': room_id, 'message': 'first'}),
+            json.dumps({'roomId': room_id, 'message': 'bad date', 'timestamp': '2024-13-45T00:00:00'}),
+            json.dumps({'roomId': [room_id], 'message': 'list room'}),
+            json.dumps({'roomId': {'id': room_id}, 'message': 'dict room'}),
+            json.dumps({'roomId': room_id, 'userId': [self.user.id], 'message': 'list user'}),
+            json.dumps({'roomId': room_id, 'message': 'last'}),
+        ]
+
+        # One line per chunk, the bad lines come after a committed chunk
+        report = MessageIngestor(self.user, fanout = False, chunk_size = 1).ingest(enumerate(lines, 1))
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['failed'], 4)
+        self.assertEqual(
+            [error['error'] for error in report['errors']],
+            [
+                "timestamp is not a valid ISO-8601 datetime.",
+                "roomId must be a string.",
+                "roomId must be a string.",
+                "userId must be an integer or a string.",
+            ]
+        )
+        self.assertEqual(
+            list(ChatMessage.objects.filter(room = self.room).order_by('id').values_list('message', flat = True)),
+            ['first', 'last']
+        )
+
+
+class SupportRoomCreateTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def create_support(self):
+        return self.client.post('/api/v1/chats/create', {'type': 'SUPPORT', 'members': [self.user.id]}, format = 'json')
+
+    def test_second_support_room_returns_the_first(self):
+
+        first = self.create_support()
+        second = self.create_support()
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['chat']['roomId'], first.data['roomId'])
+        self.assertEqual(ChatRoom.objects.filter(type = ChatRoom.ChatType.SUPPORT).count(), 1)
+
+    def test_concurrent_create_returns_the_winner(self):
+
+        winner = ChatRoom.objects.create(type = ChatRoom.ChatType.SUPPORT, created_by = self.user)
+
+        # The existence check ran before the other request committed
+        with mock.patch.object(ChatRoomCreateView, 'support_room_of', side_effect = [None, winner]):
+            response = self.create_support()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['chat']['roomId'], winner.roomId)
+        self.assertEqual(ChatRoom.objects.filter(type = ChatRoom.ChatType.SUPPORT).count(), 1)
+
+
+def streamed_body(response):
+
+    async def read():
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    return async_to_sync(read)()
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'export', created_by = self.user)
+        self.room.member.add(self.user)
+
+        start = timezone.now() - timedelta(hours = 1)
+        for index in range(5):
+            ChatMessage.objects.create(
+                room = self.room, user = self.user, message = f"m{index}", timestamp = start + timedelta(minutes = index)
+            )
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def test_response_streams_asynchronously(self):
+
+        response = self.client.get(f'/api/v1/chats/export/{self.room.roomId}')
+
+        self.assertTrue(response.is_async)
+        lines = streamed_body(response).decode().splitlines()
+        self.assertEqual([json.loads(line)['message'] for line in lines], [f"m{index}" for index in range(5)])
+
+    def test_chunks_follow_the_keyset(self):
+
+        async def collect(export_format):
+            querysets = transcript_querysets(room = self.room)
+            return [chunk async for chunk in stream_transcript(querysets, export_format, chunk_size = 2)]
+
+        chunks = async_to_sync(collect)('ndjson')
+        self.assertEqual([chunk.count("\n") for chunk in chunks], [2, 2, 1])
+
+        csv_rows = ''.join(async_to_sync(collect)('csv')).splitlines()
+        self.assertEqual(len(csv_rows), 6)
+        self.assertTrue(csv_rows[0].startswith('messageId,'))
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+
+        self.name = default_storage.save('chat_files/media-test.bin', ContentFile(bytes(range(256)) * 4))
+        self.addCleanup(default_storage.delete, self.name)
+
+    def test_parse_range(self):
+
+        cases = [
+            (None, None),
+            ('bytes=0-99', (0, 99)),
+            ('bytes=500-', (500, 999)),
+            ('bytes=500-5000', (500, 999)),
+            ('bytes=-100', (900, 999)),
+            ('bytes=-5000', (0, 999)),
+            ('bytes=-0', False),
+            ('bytes=1000-', False),
+            ('bytes=1000-2000', False),
+            ('bytes=20-10', False),
+            ('bytes=0-1,5-6', None),
+            ('bytes=-', None),
+            ('items=0-10', None),
+        ]
+
+        for header, expected in cases:
+            with self.subTest(header = header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+    def test_signatures(self):
+
+        expires = int(time.time()) + 60
+        signature = sign_media(self.name, expires)
+
+        self.assertTrue(verify_media(self.name, expires, signature))
+        self.assertFalse(verify_media(self.name, expires, signature[:-1] + ('0' if signature[-1] != '0' else '1')))
+        self.assertFalse(verify_media('chat_files/other.bin', expires, signature))
+        self.assertFalse(verify_media(self.name, expires + 1, signature))
+        self.assertFalse(verify_media(self.name, 'soon', signature))
+
+        expired = int(time.time()) - 1
+        self.assertFalse(verify_media(self.name, expired, sign_media(self.name, expired)))
+
+        response = self.client.get(f"/media/{self.name}", {'e': expires, 's': '0' * 32})
+        self.assertEqual(response.status_code, 403)
+
+    def test_expired_or_tampered_urls_are_forbidden(self):
+
+        url = f"/media/{self.name}"
+        expires = int(time.time()) + 60
+        signature = sign_media(self.name, expires)
+        expired = int(time.time()) - 1
+
+        self.assertEqual(self.client.get(url, {'e': expires, 's': signature}).status_code, 200)
+
+        forbidden = [
+            {},
+            {'e': expires},
+            {'e': expired, 's': sign_media(self.name, expired)},
+            {'e': expires + 3600, 's': signature},
+            {'e': expires, 's': signature[:-1] + ('0' if signature[-1] != '0' else '1')},
+            {'e': expires, 's': sign_media('chat_files/other.bin', expires)},
+        ]
+        for query in forbidden:
+            with self.subTest(query = query):
+                self.assertEqual(self.client.get(url, query).status_code, 403)
+
+    def test_signed_urls_expire_within_window_and_ttl(self):
+
+        now = time.time()
+        query = parse_qs(default_storage.url(self.name).split('?', 1)[1])
+        expires = int(query['e'][0])
+
+        # Also the longest a member removed from the room keeps access
+        self.assertGreater(expires, now)
+        self.assertLessEqual(expires, now + MEDIA_URL_WINDOW + MEDIA_URL_TTL)
+        self.assertTrue(verify_media(self.name, expires, query['s'][0]))
+
+    def test_files_stream_asynchronously(self):
+
+        url = default_storage.url(self.name)
+
+        full = self.client.get(url)
+        self.assertTrue(full.is_async)
+        self.assertEqual(full['Content-Length'], '1024')
+        self.assertEqual(streamed_body(full), bytes(range(256)) * 4)
+
+        partial = self.client.get(url, HTTP_RANGE = 'bytes=-10')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], 'bytes 1014-1023/1024')
+        self.assertEqual(streamed_body(partial), bytes(range(246, 256)))
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE = 'bytes=1024-').status_code, 416)
+
+
+class RoomCacheTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com', first_name = 'Me')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com', first_name = 'Other')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'cached', created_by = self.user)
+        self.room.member.add(self.user, self.other)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def cached(self):
+        return room_cache.backend.get(self.room.id)
+
+    def room_payload(self):
+        return self.client.get('/api/v1/user/chats').data['results'][0]
+
+    def assertInvalidatedOnCommit(self, write):
+
+        self.room_payload()
+        self.assertIsNotNone(self.cached())
+
+        with self.captureOnCommitCallbacks(execute = True):
+            write()
+            # Still uncommitted, a reader would cache the old rows again
+            self.assertIsNotNone(self.cached())
+
+        self.assertIsNone(self.cached())
+
+    def test_message_save_and_delete(self):
+
+        message = ChatMessage(room = self.room, user = self.other, message = 'hello')
+
+        self.assertInvalidatedOnCommit(message.save)
+        self.assertEqual(self.room_payload()['last_message'], 'hello')
+
+        self.assertInvalidatedOnCommit(message.delete)
+        self.assertIsNone(self.room_payload()['last_message'])
+
+    def test_member_changes(self):
+
+        third = User.objects.create(username = 'third', email = 'third@example.com')
+
+        self.assertInvalidatedOnCommit(lambda: self.room.member.add(third))
+        self.assertEqual(len(self.room_payload()['member']), 3)
+
+        self.assertInvalidatedOnCommit(lambda: third.chatroom_set.remove(self.room))
+        self.assertEqual(len(self.room_payload()['member']), 2)
+
+    def test_member_profile_change(self):
+
+        def rename():
+            self.other.first_name = 'Renamed'
+            self.other.save(update_fields = ['first_name'])
+
+        self.assertInvalidatedOnCommit(rename)
+        names = {member['first_name'] for member in self.room_payload()['member']}
+        self.assertIn('Renamed', names)
+
+    def test_rolled_back_write_keeps_the_entry(self):
+
+        self.room_payload()
+
+        with self.captureOnCommitCallbacks(execute = True):
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.create(room = self.room, user = self.other, message = 'never')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        self.assertIsNotNone(self.cached())
+
+    def test_django_backend_clear_is_scoped(self):
+
+        backend = DjangoCacheBackend()
+        shared = backend.cache
+
+        shared.set('ratelimit:other', 7)
+        backend.set(1, {'full': {'name': 'cached'}})
+        backend.clear()
+
+        self.assertIsNone(backend.get(1))
+        self.assertEqual(shared.get('ratelimit:other'), 7)
+
+        backend.set(1, {'full': {'name': 'again'}})
+        self.assertEqual(backend.get(1), {'full': {'name': 'again'}})
+
+
+class DeltaSyncTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com', first_name = 'Me')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com', first_name = 'Other')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'team', created_by = self.other)
+        self.room.member.add(self.user, self.other)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def changes(self, since):
+        return self.client.get('/api/v1/user/chats/changes', {'since': since})
+
+    def watermark(self):
+        return (timezone.now() - timedelta(minutes = 1)).isoformat()
+
+    def test_malformed_watermark(self):
+
+        # Matches the datetime pattern but is out of range
+        for since in ('yesterday', '2024-13-45T10:00:00Z', '2024-01-15T25:00:00Z'):
+            response = self.changes(since)
+            self.assertEqual(response.status_code, 400, since)
+
+    def test_removed_member_gets_the_room_id(self):
+
+        since = self.watermark()
+        remove_members(self.room, [self.user.id])
+
+        response = self.changes(since)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['removed'], [self.room.roomId])
+        self.assertEqual(response.data['rooms'], [])
+
+        # The others are not told the room is gone
+        self.assertFalse(RoomTombstone.objects.filter(user = self.other).exists())
+
+    def test_deleted_room_is_removed_for_every_member(self):
+
+        since = self.watermark()
+        roomId = self.room.roomId
+        self.room.delete()
+
+        self.assertEqual(self.changes(since).data['removed'], [roomId])
+        self.assertEqual(
+            set(RoomTombstone.objects.filter(roomId = roomId).values_list('user_id', flat = True)),
+            {self.user.id, self.other.id}
+        )
+
+    def test_rejoined_room_is_not_removed(self):
+
+        since = self.watermark()
+        self.user.chatroom_set.remove(self.room)
+        self.room.member.add(self.user)
+
+        response = self.changes(since)
+
+        self.assertEqual(response.data['removed'], [])
+        self.assertEqual([room['roomId'] for room in response.data['rooms']], [self.room.roomId])
+
+    def test_old_watermark_gets_a_full_sync(self):
+
+        since = (timezone.now() - timedelta(days = 365)).isoformat()
+        response = self.changes(since)
+
+        self.assertTrue(response.data['full'])
+        self.assertEqual(response.data['removed'], [])
+
+
+class MediaFilesMixin:
+
+    def setUp(self):
+
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT = media.name))
+        self.media_root = media.name
+
+    def write_media(self, *names):
+
+        for name in names:
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(path, 'wb') as handle:
+                handle.write(b'x' * 10)
+            # Past the collector's grace period
+            os.utime(path, (time.time() - 7 * 86400,) * 2)
+
+    def assertMedia(self, present = (), missing = ()):
+
+        for name in present:
+            self.assertTrue(default_storage.exists(name), name)
+        for name in missing:
+            self.assertFalse(default_storage.exists(name), name)
+
+
+class RetentionTests(MediaFilesMixin, TestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        room_cache.clear()
+
+        self.owner = User.objects.create(username = 'owner', email = 'owner@example.com')
+        self.expired = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'old', created_by = self.owner)
+        self.kept = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'new', created_by = self.owner)
+        self.expired.member.add(self.owner)
+        self.kept.member.add(self.owner)
+
+        self.write_media('chat_images/old.png', 'chat_files/old.pdf', 'chat_thumbnails/shared.webp')
+
+        for index in range(5):
+            ChatMessage.objects.create(room = self.expired, user = self.owner, message = f"old {index}")
+        ChatMessage.objects.create(
+            room = self.expired, user = self.owner,
+            image = 'chat_images/old.png', thumbnail = 'chat_thumbnails/shared.webp'
+        )
+        ChatMessage.objects.create(room = self.expired, user = self.owner, file = 'chat_files/old.pdf')
+        # Same picture forwarded to a room that is kept
+        ChatMessage.objects.create(
+            room = self.kept, user = self.owner,
+            image = 'chat_images/kept.png', thumbnail = 'chat_thumbnails/shared.webp'
+        )
+
+        ChatRoom.objects.filter(id = self.expired.id).update(updated_at = timezone.now() - timedelta(days = 60))
+
+    def job(self, **kwargs):
+        return RetentionJob(batch_size = 2, pause = 0, room_days = {'GROUP': 30}, user_days = {}, **kwargs)
+
+    def test_room_purged_in_batches(self):
+
+        report = self.job().run()
+
+        self.assertEqual((report.rooms, report.messages), (1, 7))
+        self.assertFalse(ChatRoom.objects.filter(id = self.expired.id).exists())
+        self.assertTrue(ChatRoom.objects.filter(id = self.kept.id).exists())
+
+        self.assertMedia(present = ['chat_thumbnails/shared.webp'], missing = ['chat_images/old.png', 'chat_files/old.pdf'])
+
+    def test_messages_sent_during_the_purge(self):
+
+        job = self.job()
+        purge_messages = job.purge_messages
+        late = []
+
+        def purge_then_send(room_id):
+            purge_messages(room_id)
+            if not late:
+                late.append(ChatMessage.objects.create(room_id = room_id, user = self.owner, message = 'late'))
+
+        with mock.patch.object(job, 'purge_messages', side_effect = purge_then_send):
+            report = job.run()
+
+        self.assertEqual(report.messages, 8)
+        self.assertFalse(ChatMessage.objects.filter(id = late[0].id).exists())
+        self.assertFalse(ChatRoom.objects.filter(id = self.expired.id).exists())
+
+    def test_dry_run_deletes_nothing(self):
+
+        report = self.job(dry_run = True).run()
+
+        self.assertEqual((report.rooms, report.messages, report.files), (1, 7, 2))
+        self.assertTrue(ChatRoom.objects.filter(id = self.expired.id).exists())
+        self.assertEqual(ChatMessage.objects.filter(room = self.expired).count(), 7)
+        self.assertMedia(present = ['chat_images/old.png', 'chat_files/old.pdf', 'chat_thumbnails/shared.webp'])
+
+    def test_shared_avatar_variants_survive(self):
+
+        guest_type = UserType.objects.create(code = 'GUEST', name = 'Guest')
+        variants = {'small': 'avatars/shared-small.webp'}
+        self.write_media('user/guest.png', 'user/keeper.png', 'avatars/shared-small.webp', 'avatars/guest-only.webp')
+
+        joined = timezone.now() - timedelta(days = 200)
+        guest = User.objects.create(
+            username = 'guest', email = 'guest@example.com', user_type = guest_type,
+            image = 'user/guest.png', image_variants = {**variants, 'large': 'avatars/guest-only.webp'}
+        )
+        User.objects.filter(id = guest.id).update(date_joined = joined)
+        User.objects.create(username = 'keeper', email = 'keeper@example.com', image = 'user/keeper.png', image_variants = variants)
+
+        RetentionJob(pause = 0, room_days = {}, user_days = {'GUEST': 90}).run()
+
+        self.assertFalse(User.objects.filter(id = guest.id).exists())
+        self.assertMedia(
+            present = ['avatars/shared-small.webp', 'user/keeper.png'],
+            missing = ['user/guest.png', 'avatars/guest-only.webp']
+        )
+
+
+class MediaCollectorTests(MediaFilesMixin, TestCase):
+
+    def test_referenced_names_are_kept(self):
+
+        user = User.objects.create(
+            username = 'me', email = 'me@example.com',
+            image = 'user/me.png', image_variants = {'small': 'avatars/me-small.webp'}
+        )
+        room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'gc', created_by = user)
+        ChatMessage.objects.create(room = room, user = user, image = 'chat_images/a.png', thumbnail = 'chat_thumbnails/a.webp')
+        archived = ChatMessage.objects.create(room = room, user = user, file = 'chat_files/old.pdf')
+        archive_batch([archived.id])
+        upload = ChatUpload.objects.create(user = user, room = room, file_name = 'big.bin', file_type = 'application/octet-stream', file_size = 100)
+
+        referenced = [
+            'user/me.png', 'avatars/me-small.webp', 'chat_images/a.png', 'chat_thumbnails/a.webp',
+            'chat_files/old.pdf', f"chat_uploads/{upload.uploadId}.part",
+        ]
+        orphans = ['avatars/gone-small.webp', 'chat_uploads/gone.part', 'chat_images/gone.png']
+        self.write_media(*referenced, *orphans)
+
+        collector = MediaCollector(root = self.media_root, grace_hours = 24).run()
+
+        self.assertEqual(collector.collected, len(orphans))
+        self.assertMedia(present = referenced, missing = orphans)
+
+    def test_dry_run_keeps_orphans(self):
+
+        self.write_media('chat_images/gone.png')
+
+        collector = MediaCollector(root = self.media_root, grace_hours = 24, dry_run = True).run()
+
+        self.assertEqual(collector.collected, 1)
+        self.assertMedia(present = ['chat_images/gone.png'])
+
+
+class ChunkedUploadTests(MediaFilesMixin, TestCase):
+
+    content = b'%PDF-1.4 ' + b'x' * 11
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'files', created_by = self.user)
+        self.room.member.add(self.user)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def start(self, **extra):
+
+        return self.client.post('/api/v1/chats/uploads', {
+            'roomId': self.room.roomId,
+            'fileName': 'report.pdf',
+            'fileType': 'application/pdf',
+            'fileSize': len(self.content),
+            **extra
+        }, format = 'json')
+
+    def append(self, uploadId, offset, data):
+
+        return self.client.generic(
+            'PATCH', f'/api/v1/chats/uploads/{uploadId}', data,
+            content_type = 'application/octet-stream', HTTP_UPLOAD_OFFSET = str(offset)
+        )
+
+    def finalize(self, uploadId):
+        return self.client.post(f'/api/v1/chats/uploads/{uploadId}/finalize')
+
+    def part(self, uploadId):
+
+        with open(ChatUpload.objects.get(uploadId = uploadId).get_part_path(), 'rb') as handle:
+            return handle.read()
+
+    def test_out_of_order_offsets(self):
+
+        uploadId = self.start().data['uploadId']
+
+        ahead = self.append(uploadId, 10, self.content[10:])
+        self.assertEqual(ahead.status_code, 409)
+        self.assertEqual(ahead.data['offset'], 0)
+
+        self.assertEqual(self.append(uploadId, 0, self.content[:10]).data['offset'], 10)
+
+        # The same chunk sent again
+        replayed = self.append(uploadId, 0, self.content[:10])
+        self.assertEqual(replayed.status_code, 409)
+        self.assertEqual(replayed.data['offset'], 10)
+
+        self.assertEqual(self.append(uploadId, 10, self.content[10:]).data['offset'], len(self.content))
+        self.assertEqual(self.part(uploadId), self.content)
+
+    def test_concurrent_chunk_writes_nothing(self):
+
+        uploadId = self.start().data['uploadId']
+        stale = ChatUpload.objects.select_related('room').get(uploadId = uploadId)
+
+        self.append(uploadId, 0, self.content[:10])
+
+        # Read before the first chunk was counted, the offset check alone would pass
+        fresh = ChatUpload.objects.select_related('room').get(uploadId = uploadId)
+        with mock.patch.object(ChunkedUploadDetailView, 'get_upload', side_effect = [stale, fresh]):
+            response = self.append(uploadId, 0, b'%PDF-9.9 ' + b'y')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 10)
+        self.assertEqual(self.part(uploadId), self.content[:10])
+
+    def test_finalize_checksum(self):
+
+        uploadId = self.start(checksum = hashlib.sha256(self.content).hexdigest()).data['uploadId']
+        self.append(uploadId, 0, self.content)
+
+        response = self.finalize(uploadId)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ChatMessage.objects.get(id = response.data['messageId']).file_size, len(self.content))
+
+    def test_finalize_checksum_mismatch(self):
+
+        uploadId = self.start(checksum = hashlib.sha256(b'something else').hexdigest()).data['uploadId']
+        self.append(uploadId, 0, self.content)
+        part_path = ChatUpload.objects.get(uploadId = uploadId).get_part_path()
+
+        response = self.finalize(uploadId)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChatUpload.objects.filter(uploadId = uploadId).exists())
+        self.assertFalse(os.path.exists(part_path))
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_malformed_checksum(self):
+        self.assertEqual(self.start(checksum = 'not-a-digest').status_code, 400)
+
+    def test_abandoned_uploads_expire(self):
+
+        abandoned = self.start().data['uploadId']
+        active = self.start().data['uploadId']
+        ChatUpload.objects.filter(uploadId = abandoned).update(updated_at = timezone.now() - timedelta(hours = 48))
+        abandoned_path = os.path.join(self.media_root, 'chat_uploads', f"{abandoned}.part")
+
+        report = RetentionJob(pause = 0, room_days = {}, user_days = {}, upload_hours = 24).run()
+
+        self.assertEqual(report.uploads, 1)
+        self.assertFalse(ChatUpload.objects.filter(uploadId = abandoned).exists())
+        self.assertFalse(os.path.exists(abandoned_path))
+        self.assertTrue(ChatUpload.objects.filter(uploadId = active).exists())
+
+
+class BlobTests(MediaFilesMixin, TestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'blobs', created_by = self.user)
+
+    def blob(self, name, used_hours_ago):
+
+        self.write_media(name)
+        return Attachment.objects.create(
+            sha256 = hashlib.sha256(name.encode()).hexdigest(),
+            file = name,
+            size = 10,
+            content_type = 'text/plain',
+            last_used_at = timezone.now() - timedelta(hours = used_hours_ago)
+        )
+
+    def test_same_bytes_are_stored_once(self):
+
+        first = store_uploaded_file(SimpleUploadedFile('a.txt', b'same bytes'), 'text/plain')
+
+        with mock.patch('apps.chat.blobs.open', create = True, side_effect = AssertionError('written again')):
+            second = store_uploaded_file(SimpleUploadedFile('b.txt', b'same bytes'), 'text/plain')
+
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(Attachment.objects.count(), 1)
+        self.assertEqual(first.sha256, hashlib.sha256(b'same bytes').hexdigest())
+        self.assertMedia(present = [first.file.name])
+
+        # A finished chunked upload with the same content is dropped, not stored
+        part = os.path.join(self.media_root, 'part')
+        with open(part, 'wb') as handle:
+            handle.write(b'same bytes')
+
+        self.assertEqual(store_path(part, 'c.txt', 'text/plain').id, first.id)
+        self.assertFalse(os.path.exists(part))
+        self.assertEqual(Attachment.objects.count(), 1)
+
+    def test_sweep_reclaims_only_idle_unreferenced_blobs(self):
+
+        orphan = self.blob('blobs/or/ph/orphan.txt', used_hours_ago = 48)
+        recent = self.blob('blobs/re/ce/recent.txt', used_hours_ago = 1)
+        live = self.blob('blobs/li/ve/live.txt', used_hours_ago = 48)
+        archived = self.blob('blobs/ar/ch/archived.txt', used_hours_ago = 48)
+
+        ChatMessage.objects.create(room = self.room, user = self.user, file = live.file.name, attachment = live)
+        ArchivedChatMessage.objects.create(
+            id = 1, room = self.room, user = self.user, file = archived.file.name, attachment = archived
+        )
+
+        call_command('sweep_attachments', stdout = io.StringIO())
+
+        self.assertEqual(
+            set(Attachment.objects.values_list('id', flat = True)),
+            {recent.id, live.id, archived.id}
+        )
+        self.assertMedia(
+            present = [recent.file.name, live.file.name, archived.file.name],
+            missing = [orphan.file.name]
+        )
+
+
+class SynchronousExecutor:
+    """
+    Stands in for the preview process pool, runs jobs as they are submitted.
+    """
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, function, *args):
+
+        self.submitted += 1
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+class PreviewTests(MediaFilesMixin, TestCase):
+
+    def setUp(self):
+
+        super().setUp()
+        room_cache.clear()
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'pics', created_by = self.user)
+        self.room.member.add(self.user)
+
+        os.makedirs(os.path.join(self.media_root, 'chat_images'))
+        Image.new('RGB', (640, 480), 'red').save(os.path.join(self.media_root, 'chat_images/red.png'))
+
+        self.executor = SynchronousExecutor()
+        self.enterContext(mock.patch('apps.chat.previews.get_pool', return_value = self.executor))
+        # Would close the test case's connection, it belongs to the pool callback thread
+        self.enterContext(mock.patch('apps.chat.previews.close_old_connections'))
+        self.enterContext(mock.patch('apps.chat.outbox.wake_dispatcher'))
+
+    def send_image(self):
+
+        with self.captureOnCommitCallbacks(execute = True):
+            with transaction.atomic():
+                message = ChatMessage.objects.create(room = self.room, user = self.user, image = 'chat_images/red.png')
+                schedule_previews(message)
+
+        message.refresh_from_db()
+        return message
+
+    def test_previews_are_stored_and_published(self):
+
+        self.room.refresh_from_db()
+        updated_at = self.room.updated_at
+        etag, _ = message_list_validators(self.room, self.user)
+
+        message = self.send_image()
+
+        self.assertEqual(self.executor.submitted, 1)
+        self.assertEqual((message.image_width, message.image_height), (640, 480))
+        self.assertEqual(message.thumbnail.name, thumbnail_name(message.id))
+        self.assertMedia(present = [thumbnail_name(message.id)])
+        self.assertTrue(message.image_placeholder.startswith('data:image/'))
+
+        payload = OutboxEvent.objects.get(payload__action = 'preview').payload
+        self.assertEqual(payload['messageId'], message.id)
+        self.assertEqual((payload['imageWidth'], payload['imageHeight']), (640, 480))
+
+        # The history validators change, the room keeps its place in the lists
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.updated_at, updated_at)
+        self.assertIsNotNone(self.room.messages_updated_at)
+        self.assertNotEqual(message_list_validators(self.room, self.user)[0], etag)
+
+    def test_backfill_command(self):
+
+        message = ChatMessage.objects.create(room = self.room, user = self.user, image = 'chat_images/red.png')
+
+        with mock.patch('apps.chat.management.commands.generate_previews.get_pool', return_value = self.executor):
+            call_command('generate_previews', stdout = io.StringIO())
+
+        message.refresh_from_db()
+        self.assertEqual((message.image_width, message.image_height), (640, 480))
+        self.assertMedia(present = [thumbnail_name(message.id)])
+
+    def test_same_image_reuses_previews(self):
+
+        first = self.send_image()
+        second = self.send_image()
+
+        self.assertEqual(self.executor.submitted, 1)
+        self.assertEqual(second.thumbnail.name, first.thumbnail.name)
+        self.assertEqual(second.image_placeholder, first.image_placeholder)
+        self.assertEqual((second.image_width, second.image_height), (640, 480))
+
+
+class MembershipTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+
+        self.creator = User.objects.create(username = 'creator', email = 'creator@example.com')
+        self.member = User.objects.create(username = 'member', email = 'member@example.com')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'team', created_by = self.creator)
+        self.room.member.add(self.creator, self.member, self.other)
+
+    def client_for(self, user):
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(user)))
+        return client
+
+    def remove(self, user, members):
+        return self.client_for(user).delete(f'/api/v1/chats/members/{self.room.roomId}', {'members': members}, format = 'json')
+
+    def insert_batches(self, model, count):
+        """
+        INSERTs `bulk_create` splits `count` new rows of `model` into on
+        this backend.
+        """
+
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        batch_size = connection.ops.bulk_batch_size(fields, [model()] * count) or count
+        return -(-count // batch_size)
+
+    def test_create_query_budget(self):
+
+        users = User.objects.bulk_create([
+            User(username = f"bulk-{index}", email = f"bulk-{index}@example.com") for index in range(1000)
+        ])
+        user_ids = [user.id for user in users]
+
+        for room_count, per_room in ((1, 1000), (20, 50)):
+
+            rows = room_count * per_room
+
+            # Users, current members, touch, outbox events and two savepoint
+            # pairs, plus the bulk insert batches
+            expected = 8 + (
+                self.insert_batches(ChatRoom, room_count)
+                + self.insert_batches(ChatRoom.member.through, rows)
+                + self.insert_batches(ChatRoomMembership, rows)
+            )
+
+            with self.assertNumQueries(expected):
+                added = create_rooms(
+                    [
+                        {'type': ChatRoom.ChatType.GROUP, 'name': f"big {index}", 'members': user_ids[:per_room]}
+                        for index in range(room_count)
+                    ],
+                    created_by = self.creator
+                )
+
+            self.assertEqual([len(member_ids) for member_ids in added.values()], [per_room] * room_count)
+            self.assertEqual(ChatRoomMembership.objects.filter(room__in = list(added)).count(), rows)
+
+    def test_bulk_create_counts_without_queries(self):
+
+        self.creator.is_staff = True
+        self.creator.save(update_fields = ['is_staff'])
+
+        rooms = [{'name': f"team {index}", 'members': [self.member.id, self.other.id]} for index in range(5)]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client_for(self.creator).post('/api/v1/chats/bulk-create', {'rooms': rooms}, format = 'json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([room['members'] for room in response.data['rooms']], [2] * 5)
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+
+    def test_member_removes_themselves(self):
+
+        response = self.remove(self.member, [self.member.id])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['removed'], [self.member.id])
+
+    def test_member_cannot_remove_others(self):
+
+        response = self.remove(self.member, [self.other.id, self.member.id])
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.room.member.count(), 3)
+
+    def test_creator_and_admin_remove_others(self):
+
+        self.assertEqual(self.remove(self.creator, [self.other.id]).status_code, 200)
+
+        self.other.is_staff = True
+        self.other.save(update_fields = ['is_staff'])
+        self.room.member.remove(self.other)
+
+        # Admins need not be members
+        self.assertEqual(self.remove(self.other, [self.member.id]).status_code, 200)
+        self.assertEqual(list(self.room.member.values_list('id', flat = True)), [self.creator.id])
+
+
+class BootstrapTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+        self.user = User.objects.create(username = 'me', email = 'me@example.com')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com')
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def create_rooms(self, count):
+
+        for index in range(count):
+            room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = f"room {index}")
+            room.member.add(self.user, self.other)
+            room.get_membership(self.user)
+
+            for number in range(3):
+                ChatMessage.objects.create(room = room, user = self.other, message = f"{index}-{number}")
+
+    def bootstrap_queries(self):
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/bootstrap')
+
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_fixed_query_budget(self):
+
+        self.create_rooms(2)
+        _, few = self.bootstrap_queries()
+
+        self.create_rooms(10)
+        response, many = self.bootstrap_queries()
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.data['rooms']), 12)
+
+    def test_payload(self):
+
+        self.create_rooms(4)
+        response, _ = self.bootstrap_queries()
+
+        top = response.data['rooms'][0]
+        self.assertEqual(top['unread_count'], 3)
+        self.assertEqual(top['last_message'], '3-2')
+
+        page = response.data['messages'][top['roomId']]
+        self.assertEqual([message['message'] for message in page['results']], ['3-2', '3-1', '3-0'])
+        self.assertFalse(page['hasMore'])
+        self.assertEqual(len(response.data['messages']), 3)
+        self.assertEqual(response.data['profile']['username'], 'me')
+
+
+    def test_archived_history(self):
+
+        self.create_rooms(2)
+        hot, idle = ChatRoom.objects.order_by('id')
+
+        # Part of one history and all of the other moved to the archive
+        archive_batch(ChatMessage.objects.filter(room = hot).order_by('timestamp').values_list('id', flat = True)[:2])
+        archive_batch(ChatMessage.objects.filter(room = idle).values_list('id', flat = True))
+
+        response, _ = self.bootstrap_queries()
+        listed = {room['roomId']: room for room in self.client.get('/api/v1/user/chats').data['results']}
+
+        for room in (hot, idle):
+
+            top = next(item for item in response.data['rooms'] if item['roomId'] == room.roomId)
+            self.assertEqual(top['last_message'], listed[room.roomId]['last_message'])
+            self.assertEqual(top['last_message_at'], listed[room.roomId]['last_message_at'])
+
+            page = response.data['messages'][room.roomId]
+            history = self.client.get(f'/api/v1/chats/messages/{room.roomId}', {'limit': 50}).data['results']
+            self.assertEqual(page['results'], history)
+            self.assertEqual(len(page['results']), 3)
+            self.assertFalse(page['hasMore'])
+
+class FieldsetTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+        self.user = User.objects.create(username = 'me', email = 'me@example.com', first_name = 'Me')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com')
+
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'fields', created_by = self.user)
+        self.room.member.add(self.user, self.other)
+        ChatMessage.objects.create(room = self.room, user = self.other, message = 'hello')
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def test_skipped_fields_are_not_computed(self):
+
+        with mock.patch.object(ChatRoomSerializer, 'get_last_message') as get_last_message:
+            response = self.client.get('/api/v1/user/chats?fields=roomId,name')
+
+        get_last_message.assert_not_called()
+        self.assertEqual(response.data['results'], [{'roomId': self.room.roomId, 'name': 'fields'}])
+
+    def test_compact_messages_reference_users(self):
+
+        response = self.client.get(f'/api/v1/chats/messages/{self.room.roomId}?compact=1')
+        message = response.data['results'][0]
+
+        self.assertNotIn('userName', message)
+        self.assertNotIn('userImage', message)
+        self.assertEqual(list(response.data['users']), [str(self.other.id)])
+        self.assertEqual(response.data['users'][str(self.other.id)]['username'], 'other')
+
+    def test_compact_rooms_list_member_ids(self):
+
+        full = self.client.get('/api/v1/user/chats').data['results'][0]
+        compact = self.client.get('/api/v1/user/chats?compact=1').data
+
+        self.assertEqual(compact['results'][0]['member'], [self.user.id, self.other.id])
+        self.assertEqual(set(compact['users']), {str(self.user.id), str(self.other.id)})
+
+        # Cached payloads of one shape are never served for another
+        self.assertEqual(self.client.get('/api/v1/user/chats').data['results'][0], full)
+
+
+class FastReadTests(TestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com', first_name = 'Me', last_name = 'Too')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com')
+        gone = User.objects.create(username = 'gone', email = 'gone@example.com')
+        User.objects.filter(id = self.user.id).update(image = 'user/me.png', image_variants = {'small': 'avatars/me-small.webp'})
+        User.objects.filter(id = self.other.id).update(image = 'user/other.png')
+
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'fast', created_by = self.user)
+        self.room.member.add(self.user, self.other)
+
+        start = timezone.now() - timedelta(hours = 1)
+        archived = ChatMessage.objects.create(room = self.room, user = self.other, message = 'old', timestamp = start)
+        ChatMessage.objects.create(
+            room = self.room, user = self.user, timestamp = start + timedelta(minutes = 1),
+            image = 'chat_images/a b.png', thumbnail = 'chat_thumbnails/a.webp',
+            image_width = 640, image_height = 480, image_placeholder = 'data:image/png;base64,AA'
+        )
+        ChatMessage.objects.create(
+            room = self.room, user = self.other, timestamp = start + timedelta(minutes = 2),
+            file = 'chat_files/report.pdf', file_name = 'report.pdf', file_type = 'application/pdf', file_size = 1234
+        )
+        ChatMessage.objects.create(room = self.room, user = gone, message = 'bye', timestamp = start + timedelta(minutes = 3))
+        gone.delete()
+        archive_batch([archived.id])
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def render_both(self, query = ''):
+
+        request = Request(APIRequestFactory().get(f'/api/v1/chats/messages/{self.room.roomId}{query}'))
+        history = room_history(self.room)
+
+        reference_context = {'request': request, **fieldset_context(request)}
+        fast_context = {'request': request, **fieldset_context(request)}
+
+        reference = ChatMessageSerializer(history[0:50], many = True, context = reference_context).data
+        fast = render_messages(message_rows(history)[0:50], fast_context)
+
+        return reference, fast, reference_context['users'], fast_context['users']
+
+    def test_matches_serializer(self):
+
+        for query in ('', '?compact=1', '?fields=userId,image,file', '?compact=1&fields=message'):
+            with self.subTest(query = query):
+
+                reference, fast, reference_users, fast_users = self.render_both(query)
+
+                self.assertEqual(len(fast), 4)
+                self.assertEqual(json.loads(json.dumps(fast)), json.loads(json.dumps(reference)))
+                if reference_users is not None:
+                    self.assertEqual(fast_users.ids, reference_users.ids)
+
+    def test_view_pages_into_archive(self):
+
+        response = self.client.get(f'/api/v1/chats/messages/{self.room.roomId}?limit=3&offset=2')
+
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual([message['message'] for message in response.data['results']], [None, 'old'])
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com', first_name = 'Me')
+        self.other = User.objects.create(username = 'other', email = 'other@example.com', first_name = 'Other')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'etag', created_by = self.user)
+        self.room.member.add(self.user, self.other)
+        ChatMessage.objects.create(room = self.room, user = self.other, message = 'hello')
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+        self.messages_url = f'/api/v1/chats/messages/{self.room.roomId}'
+
+    def etag(self, url):
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertNotModified(self, url, queries, **headers):
+
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, **headers)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_room_list_not_modified(self):
+
+        response = self.client.get('/api/v1/user/chats')
+
+        with mock.patch.object(ChatRoomSerializer, "to_representation", side_effect = AssertionError("serialized")) as serialize:
+            # User, then the three validator aggregates
+            self.assertNotModified('/api/v1/user/chats', 4, HTTP_IF_NONE_MATCH = response['ETag'])
+            self.assertNotModified('/api/v1/user/chats', 4, HTTP_IF_MODIFIED_SINCE = response['Last-Modified'])
+
+        serialize.assert_not_called()
+
+    def test_message_list_not_modified(self):
+
+        response = self.client.get(self.messages_url)
+
+        with mock.patch('apps.chat.views.render_messages') as render:
+            # Room, membership, user, message stats and authors
+            self.assertNotModified(self.messages_url, 5, HTTP_IF_NONE_MATCH = response['ETag'])
+            self.assertNotModified(self.messages_url, 5, HTTP_IF_MODIFIED_SINCE = response['Last-Modified'])
+
+        render.assert_not_called()
+
+    def test_support_list_not_modified(self):
+
+        url = '/api/v1/chats/support/'
+        ChatRoom.objects.create(type = ChatRoom.ChatType.SUPPORT, created_by = self.other)
+        response = self.client.get(url)
+
+        with mock.patch.object(ChatRoomSerializer, "to_representation", side_effect = AssertionError("serialized")) as serialize:
+            # Expiry lookup, user, unmarked rooms and the three validator aggregates
+            self.assertNotModified(url, 6, HTTP_IF_NONE_MATCH = response['ETag'])
+
+        serialize.assert_not_called()
+
+    def test_new_message_changes_validators(self):
+
+        rooms, messages = self.etag('/api/v1/user/chats'), self.etag(self.messages_url)
+
+        self.client.post(self.messages_url, {'message': 'again'})
+
+        self.assertNotEqual(self.etag('/api/v1/user/chats'), rooms)
+        self.assertNotEqual(self.etag(self.messages_url), messages)
+
+    def test_read_mark_changes_validators(self):
+
+        rooms = self.etag('/api/v1/user/chats')
+
+        self.client.post(f'/api/v1/chats/mark-read/{self.room.roomId}')
+
+        self.assertNotEqual(self.etag('/api/v1/user/chats'), rooms)
+
+    def test_membership_change_changes_validators(self):
+
+        third = User.objects.create(username = 'third', email = 'third@example.com')
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(third)))
+        url = f'/api/v1/chats/members/{self.room.roomId}'
+
+        rooms, other_rooms = self.etag('/api/v1/user/chats'), other_client.get('/api/v1/user/chats')['ETag']
+
+        self.client.post(url, {'members': [third.id]}, format = 'json')
+
+        self.assertNotEqual(self.etag('/api/v1/user/chats'), rooms)
+        self.assertNotEqual(other_client.get('/api/v1/user/chats')['ETag'], other_rooms)
+
+        rooms = self.etag('/api/v1/user/chats')
+        self.client.delete(url, {'members': [third.id]}, format = 'json')
+
+        self.assertNotEqual(self.etag('/api/v1/user/chats'), rooms)
+
+    def test_support_expiry_changes_validators(self):
+
+        url = '/api/v1/chats/support/'
+        support = ChatRoom.objects.create(
+            type = ChatRoom.ChatType.SUPPORT,
+            created_by = self.other,
+            assigned_agent = self.user,
+            taken_at = timezone.now()
+        )
+        etag = self.etag(url)
+
+        # Leaves updated_at alone, only the release may change the validators
+        ChatRoom.objects.filter(id = support.id).update(
+            taken_at = timezone.now() - timedelta(hours = TIME_HOUR_CHAT_EXPIRED, minutes = 1)
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        support.refresh_from_db()
+        self.assertIsNone(support.assigned_agent)
+
+    def test_author_profile_changes_message_validators(self):
+
+        messages = self.etag(self.messages_url)
+
+        self.other.first_name = 'Renamed'
+        self.other.save()
+
+        self.assertNotEqual(self.etag(self.messages_url), messages)
+
+
+class CompressionTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+        self.user = User.objects.create(username = 'me', email = 'me@example.com', first_name = 'Me')
+        self.room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = 'zip', created_by = self.user)
+        self.room.member.add(self.user)
+
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room = self.room, user = self.user, message = f"Message number {index}")
+            for index in range(40)
+        ])
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def test_negotiation(self):
+
+        encodings = ['zstd', 'br', 'gzip']
+
+        self.assertEqual(negotiate('gzip, deflate, br, zstd', encodings), 'zstd')
+        self.assertEqual(negotiate('gzip, br;q=0.5', encodings), 'gzip')
+        self.assertEqual(negotiate('zstd;q=0, *;q=0.1', encodings), 'br')
+        self.assertEqual(negotiate('identity', encodings), None)
+        self.assertEqual(negotiate(None, encodings), None)
+
+    def test_message_page_is_compressed(self):
+
+        url = f'/api/v1/chats/messages/{self.room.roomId}'
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING = 'gzip')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+
+        # The weakened ETag still validates
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        cached = self.client.get(url, HTTP_ACCEPT_ENCODING = 'gzip', HTTP_IF_NONE_MATCH = response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_small_and_media_responses_are_left_alone(self):
+
+        small = self.client.get('/api/v1/user/chats?fields=roomId', HTTP_ACCEPT_ENCODING = 'gzip')
+        self.assertNotIn('Content-Encoding', small)
+
+        middleware = CompressionMiddleware(lambda request: None)
+        request = APIRequestFactory().get('/media/a.txt', HTTP_ACCEPT_ENCODING = 'gzip')
+
+        text = HttpResponse(b'x' * 4096, content_type = 'text/plain')
+        text['Accept-Ranges'] = 'bytes'
+        image = HttpResponse(b'x' * 4096, content_type = 'image/png')
+
+        self.assertNotIn('Content-Encoding', middleware.process_response(request, text))
+        self.assertNotIn('Content-Encoding', middleware.process_response(request, image))
+
+    def test_streamed_export_is_compressed(self):
+
+        url = f'/api/v1/chats/export/{self.room.roomId}'
+        plain = streamed_body(self.client.get(url))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING = 'gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response)
+        self.assertEqual(gzip.decompress(streamed_body(response)), plain)
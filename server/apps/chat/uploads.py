@@ -0,0 +1,118 @@
+from django.db import transaction
+from V0X.settings import ALLOWED_FILE_TYPES, MAX_FILE_SIZE
+from .models import ChatMessage
+from .outbox import publish_event, user_groups
+from .previews import schedule_previews
+import re
+
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+CONTENT_SIGNATURES = {
+    'image/jpeg': [b'\xff\xd8\xff'],
+    'image/png': [b'\x89PNG\r\n\x1a\n'],
+    'image/gif': [b'GIF87a', b'GIF89a'],
+    'application/pdf': [b'%PDF-'],
+    'application/msword': [OLE_SIGNATURE],
+    'application/vnd.ms-excel': [OLE_SIGNATURE],
+    'application/vnd.ms-powerpoint': [OLE_SIGNATURE],
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': [ZIP_SIGNATURE],
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': [ZIP_SIGNATURE],
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation': [ZIP_SIGNATURE],
+}
+
+# Bytes needed from the first chunk to recognize every signature
+SNIFF_SIZE = 12
+
+
+def matches_content_type(content_type, head):
+    """
+    Checks the first bytes of a file against the declared content type.
+    """
+
+    if content_type not in ALLOWED_FILE_TYPES:
+        return False
+
+    if content_type == 'image/webp':
+        return head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+
+    if content_type == 'text/plain':
+        return b'\x00' not in head
+
+    return any(head.startswith(signature) for signature in CONTENT_SIGNATURES[content_type])
+
+
+def validate_declared_file(file_name, content_type, file_size, checksum = ''):
+    """
+    Returns an error message, or None when the declared file is accepted.
+    """
+
+    if not file_name:
+        return "fileName not provided."
+
+    if content_type not in ALLOWED_FILE_TYPES:
+        return f"File type '{content_type}' is not allowed."
+
+    if file_size <= 0:
+        return "fileSize must be greater than 0."
+
+    if file_size > MAX_FILE_SIZE:
+        return f"File size exceeds the maximum limit of {MAX_FILE_SIZE / (1024 * 1024)} MB."
+
+    if checksum and not re.fullmatch(r'[0-9a-f]{64}', checksum):
+        return "checksum must be the SHA-256 of the file, in hex."
+
+    return None
+
+
+def create_attachment_message(request, chatroom, user, message, is_image, **attachment):
+    """
+    Creates a ChatMessage for an uploaded image or file, publishes its
+    real-time event and returns the upload response payload.
+    """
+
+    with transaction.atomic():
+        chat_message = ChatMessage.objects.create(
+            room = chatroom,
+            user = user,
+            message = message if message else None,
+            **attachment
+        )
+        chatroom.save(update_fields = ['updated_at'])
+
+        if is_image:
+            schedule_previews(chat_message)
+
+        response_data = {
+            "messageId": chat_message.id,
+            "roomId": chatroom.roomId,
+            "message": message if message else None,
+            "userId": user.id,
+            "userName": f"{user.first_name} {user.last_name}",
+            "userImage": request.build_absolute_uri(user.avatar_url()) if user.image else None,
+            "timestamp": str(chat_message.timestamp),
+            "type": "image" if is_image else "file",
+        }
+
+        if is_image:
+            response_data["image"] = request.build_absolute_uri(chat_message.image.url)
+            response_data["thumbnail"] = (
+                request.build_absolute_uri(chat_message.thumbnail.url) if chat_message.thumbnail else None
+            )
+        else:
+            response_data["file"] = request.build_absolute_uri(chat_message.file.url)
+            response_data["fileName"] = chat_message.file_name
+            response_data["fileType"] = chat_message.file_type
+            response_data["fileSize"] = chat_message.file_size
+
+        members = chatroom.member.values_list('id', flat=True)
+        publish_event(
+            user_groups(members),
+            {
+                **response_data,
+                'action': 'message',
+                'chatType': chatroom.type,
+            }
+        )
+
+    return response_data
@@ -2,21 +2,42 @@ from django.urls import path
 from .views import (
     ChatRoomListView,
     ChatRoomCreateView,
+    BootstrapView,
+    BulkChatRoomCreateView,
+    RoomMembersView,
     UserChatRoomView,
+    ChatRoomChangesView,
     MessagesView,
+    BulkMessageIngestView,
+    ChatTranscriptExportView,
     MarkChatAsReadView,
     UploadChatFileView,
+    ChunkedUploadView,
+    ChunkedUploadDetailView,
+    ChunkedUploadFinalizeView,
     SupportChatsListView,
-    TakeReleaseChatView
+    TakeReleaseChatView,
+    RoomCacheStatsView
 )
 
 urlpatterns = [
     path("chats", ChatRoomListView.as_view(), name="chat-room-list"),
     path("chats/create", ChatRoomCreateView.as_view(), name="chat-room-create"),
+    path("chats/bulk-create", BulkChatRoomCreateView.as_view(), name="chat-room-bulk-create"), # POST
+    path("chats/members/<str:roomId>", RoomMembersView.as_view(), name="chat-room-members"), # POST, DELETE
+    path("bootstrap", BootstrapView.as_view(), name="bootstrap"), # GET
     path("user/chats", UserChatRoomView.as_view(), name="user-chat-rooms"),
+    path("user/chats/changes", ChatRoomChangesView.as_view(), name="user-chat-room-changes"), # GET
+    path('chats/messages/bulk', BulkMessageIngestView.as_view(), name="bulk-ingest-messages"),  # POST
     path('chats/messages/upload-file', UploadChatFileView.as_view(), name="upload-chat-file"),  # POST
+    path('chats/uploads', ChunkedUploadView.as_view(), name="chunked-upload"), # POST
+    path('chats/uploads/<str:uploadId>', ChunkedUploadDetailView.as_view(), name="chunked-upload-detail"), # GET, PATCH
+    path('chats/uploads/<str:uploadId>/finalize', ChunkedUploadFinalizeView.as_view(), name="chunked-upload-finalize"), # POST
     path("chats/messages/<str:roomId>", MessagesView.as_view(), name="list-chat-messages"), # GET
+    path('chats/export', ChatTranscriptExportView.as_view(), name="export-transcripts"), # GET
+    path('chats/export/<str:roomId>', ChatTranscriptExportView.as_view(), name="export-room-transcript"), # GET
     path('chats/mark-read/<str:roomId>', MarkChatAsReadView.as_view(), name="mark-chat-as-read"), #POST
     path('chats/support/', SupportChatsListView.as_view(), name = "support-chats-list"),
+    path('chats/cache/stats', RoomCacheStatsView.as_view(), name="room-cache-stats"), # GET
     path('chats/support/<str:roomId>/<str:action>', TakeReleaseChatView.as_view(), name="take-release-chat"),
 ]
\ No newline at end of file
@@ -6,21 +6,51 @@ from rest_framework.generics import ListAPIView
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
-from .serializers import ChatRoomSerializer, ChatMessageSerializer
-from .models import ChatRoom, ChatMessage
-from apps.user.models import User
-from django.db.models import Q, Exists, OuterRef
+from .serializers import (
+    ChatRoomSerializer,
+    ChatMessageSerializer,
+    RoomMembersSerializer,
+    BulkGroupRoomsSerializer
+)
+from .parsers import NDJSONParser
+from .ingest import MessageIngestor
+from .cache import room_cache
+from .conditional import ConditionalGetMixin, room_list_validators, message_list_validators
+from .export import EXPORT_FORMATS, parse_bound, transcript_querysets, stream_transcript
+from .archive import room_history
+from .models import ChatRoom, ChatMessage, ChatRoomMembership, ChatUpload, RoomTombstone
+from .outbox import publish_event, user_groups
+from .previews import schedule_previews
+from .uploads import (
+    SNIFF_SIZE,
+    matches_content_type,
+    validate_declared_file,
+    create_attachment_message
+)
+from .blobs import store_uploaded_file, store_path, attachment_fields, hash_path
+from .memberships import add_members, remove_members, create_rooms
+from .bootstrap import user_room_queryset, build_bootstrap
+from .fieldsets import FieldsetViewMixin, fieldset_context
+from .fastread import message_rows, render_messages
+from apps.user.loader import get_request_user
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.http import StreamingHttpResponse
 from V0X.settings import (
     MAX_FILE_SIZE, 
     ALLOWED_IMAGE_TYPES, 
-    TIME_HOUR_CHAT_EXPIRED
+    TIME_HOUR_CHAT_EXPIRED,
+    MEDIA_URL,
+    DELTA_SYNC_OVERLAP_SECONDS,
+    DELTA_SYNC_TOMBSTONE_DAYS,
+    UPLOAD_CHUNK_MAX_SIZE
 )
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from drf_spectacular.utils import extend_schema, OpenApiParameter, inline_serializer
 from datetime import timedelta
+import os
 
 class ChatRoomPagination(LimitOffsetPagination):
 
@@ -31,7 +61,7 @@ class ChatRoomListView(APIView):
     #permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user_instance = User.objects.get(id = request.user.id)
+        user_instance = get_request_user(request)
         chatRooms = ChatRoom.objects.filter(member=user_instance)
 
         serializer = ChatRoomSerializer(
@@ -71,51 +101,247 @@ class ChatRoomCreateView(APIView):
             existing_chat = ChatRoom.get_existing_dm_room(members)
 
             if existing_chat:
+                return self.existing_chat_response(request, existing_chat)
 
-                serializer = ChatRoomSerializer(
-                    existing_chat,
-                    context={'request': request}
-                )
+        current_user = get_request_user(request)
 
-                return Response(
-                    {
-                        'message': 'Chat already exists',
-                        'chat': serializer.data,
-                    },
-                    status = status.HTTP_200_OK
-                )
+        # One support room per user (one_support_room_per_user)
+        if chat_type == ChatRoom.ChatType.SUPPORT:
+            existing_support = self.support_room_of(current_user)
+
+            if existing_support:
+                return self.existing_chat_response(request, existing_support)
 
         data['members'] = members
 
         serializer = ChatRoomSerializer(data = data)
 
         if serializer.is_valid():
-            current_user = User.objects.get(id=request.user.id)
-            serializer.save(created_by=current_user)
+            try:
+                serializer.save(created_by=current_user)
+            except IntegrityError:
+                # A concurrent request created the user's support room first
+                existing_support = self.support_room_of(current_user)
+                if not existing_support:
+                    raise
+                return self.existing_chat_response(request, existing_support)
+
             return Response(serializer.data, status = status.HTTP_201_CREATED)
         return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
 
-class UserChatRoomView(ListAPIView):
+    def support_room_of(self, user):
+        return ChatRoom.objects.filter(type = ChatRoom.ChatType.SUPPORT, created_by = user).first()
+
+    def existing_chat_response(self, request, chat):
+
+        serializer = ChatRoomSerializer(chat, context={'request': request})
+
+        return Response(
+            {
+                'message': 'Chat already exists',
+                'chat': serializer.data,
+            },
+            status = status.HTTP_200_OK
+        )
+
+class BulkChatRoomCreateView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        request = BulkGroupRoomsSerializer,
+        responses = {
+            201: inline_serializer(
+                name = "BulkRoomsResponse",
+                fields = {
+                    'rooms': inline_serializer(
+                        name = "BulkRoom",
+                        many = True,
+                        fields = {
+                            'roomId': drf_serializers.CharField(),
+                            'name': drf_serializers.CharField(allow_null = True),
+                            'members': drf_serializers.IntegerField(),
+                        }
+                    )
+                }
+            )
+        },
+        description = "Create group rooms with their members in one request (admin only)."
+    )
+
+    def post(self, request):
+
+        user = get_request_user(request)
+
+        if not (user.is_staff or user.is_admin()):
+            return Response(
+                {"error": "Only administrators can create rooms in bulk."},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = BulkGroupRoomsSerializer(data = request.data)
+        serializer.is_valid(raise_exception = True)
+
+        added = create_rooms(
+            [
+                {**room, 'type': ChatRoom.ChatType.GROUP}
+                for room in serializer.validated_data['rooms']
+            ],
+            created_by = user
+        )
+
+        return Response(
+            {
+                'rooms': [
+                    {'roomId': room.roomId, 'name': room.name, 'members': len(member_ids)}
+                    for room, member_ids in added.items()
+                ]
+            },
+            status = status.HTTP_201_CREATED
+        )
+
+class RoomMembersView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    def get_room(self, request, roomId):
+        """
+        Returns (room, error response). Members of a group, or admins, may
+        change its members; DM, personal and support rooms are fixed.
+        """
+
+        chatroom = ChatRoom.objects.filter(roomId = roomId).first()
+        if not chatroom:
+            return None, Response(
+                {"error": "Chat room does not exists."},
+                status = status.HTTP_404_NOT_FOUND
+            )
+
+        if chatroom.type != ChatRoom.ChatType.GROUP:
+            return None, Response(
+                {"error": "Only group chats accept member changes."},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        user = get_request_user(request)
+        if not (user.is_staff or user.is_admin()) and not chatroom.member.filter(id = user.id).exists():
+            return None, Response(
+                {"error": "You aren't member of this chat room!"},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        return chatroom, None
+
+    @extend_schema(
+        request = RoomMembersSerializer,
+        responses = {
+            200: inline_serializer(
+                name = "MembersAddedResponse",
+                fields = {
+                    'roomId': drf_serializers.CharField(),
+                    'added': drf_serializers.ListField(child = drf_serializers.IntegerField()),
+                }
+            )
+        },
+        description = "Add users to a group chat. Unknown users and existing members are skipped."
+    )
+
+    def post(self, request, roomId):
+
+        chatroom, error = self.get_room(request, roomId)
+        if error:
+            return error
+
+        serializer = RoomMembersSerializer(data = request.data)
+        serializer.is_valid(raise_exception = True)
+
+        added = add_members(chatroom, serializer.validated_data['members'])
+
+        return Response({'roomId': roomId, 'added': added}, status = status.HTTP_200_OK)
+
+    @extend_schema(
+        request = RoomMembersSerializer,
+        responses = {
+            200: inline_serializer(
+                name = "MembersRemovedResponse",
+                fields = {
+                    'roomId': drf_serializers.CharField(),
+                    'removed': drf_serializers.ListField(child = drf_serializers.IntegerField()),
+                }
+            )
+        },
+        description = "Remove users from a group chat. Members may remove themselves, only its creator or an admin may remove others."
+    )
+
+    def delete(self, request, roomId):
+
+        chatroom, error = self.get_room(request, roomId)
+        if error:
+            return error
+
+        serializer = RoomMembersSerializer(data = request.data)
+        serializer.is_valid(raise_exception = True)
+        members = serializer.validated_data['members']
+
+        user = get_request_user(request)
+        if not (
+            user.is_staff or user.is_admin()
+            or chatroom.created_by_id == user.id
+            or set(members) <= {user.id}
+        ):
+            return Response(
+                {"error": "Only the creator of the chat room or an administrator can remove other members."},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        removed = remove_members(chatroom, members)
+
+        return Response({'roomId': roomId, 'removed': removed}, status = status.HTTP_200_OK)
+
+class BootstrapView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        responses = {
+            200: inline_serializer(
+                name = "BootstrapResponse",
+                fields = {
+                    'profile': drf_serializers.DictField(),
+                    'rooms': ChatRoomSerializer(many = True),
+                    'support': ChatRoomSerializer(many = True),
+                    'messages': drf_serializers.DictField(),
+                    'onlineUsers': drf_serializers.ListField(child = drf_serializers.IntegerField()),
+                }
+            )
+        },
+        description = (
+            "Startup payload: profile, latest rooms and support chats with unread counts and "
+            "last messages, the first message page of the top rooms (by roomId) and the online users."
+        )
+    )
+
+    def get(self, request):
+        return Response(build_bootstrap(request), status = status.HTTP_200_OK)
+
+class UserChatRoomView(FieldsetViewMixin, ConditionalGetMixin, ListAPIView):
     serializer_class = ChatRoomSerializer
     pagination_class = ChatRoomPagination
     #permission_classes = [IsAuthenticated]
 
-    def get_queryset(self):
+    def get(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().get, *args, **kwargs)
 
-        user = self.request.user
-        user_instance = User.objects.get(id=user.id)
+    def get_validators(self, request):
 
-        has_messages = ChatMessage.objects.filter(room=OuterRef('pk'))
+        user_instance = get_request_user(request)
+        return room_list_validators(
+            self.get_queryset(), user_instance, request.get_full_path()
+        )
 
-        return ChatRoom.objects.filter(
-            member = user_instance
-        ).exclude(
-            type = ChatRoom.ChatType.SUPPORT
-        ).annotate(
-            has_messages = Exists(has_messages)
-        ).filter(
-            Q(has_messages=True) | Q(created_by=user_instance)
-        ).distinct().order_by('-updated_at')
+    def get_queryset(self):
+
+        return user_room_queryset(get_request_user(self.request))
     
     def get_serializer_context(self):
 
@@ -123,38 +349,147 @@ class UserChatRoomView(ListAPIView):
         context['request'] = self.request
         return context
 
-class MessagesView(ListAPIView):
+class ChatRoomChangesView(APIView):
+
+    @extend_schema(
+        parameters = [
+            OpenApiParameter(
+                name = 'since',
+                type = str,
+                location = OpenApiParameter.QUERY,
+                required = False,
+                description = 'Watermark returned by the previous call. Omit it for a full sync.'
+            ),
+        ],
+        responses = {
+            200: inline_serializer(
+                name = "ChatRoomChangesResponse",
+                fields = {
+                    'watermark': drf_serializers.DateTimeField(),
+                    'full': drf_serializers.BooleanField(),
+                    'rooms': ChatRoomSerializer(many=True),
+                    'removed': drf_serializers.ListField(child=drf_serializers.CharField()),
+                }
+            )
+        },
+        description = "Rooms of the current user whose state changed since the watermark, and the roomIds they left or that were deleted."
+    )
+
+    def get(self, request):
+
+        since = request.query_params.get('since')
+
+        if since:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None:
+                return Response(
+                    {"error": "since is not a valid watermark."},
+                    status = status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+            # Tombstones older than this are pruned, only a full sync is exact
+            if since < timezone.now() - timedelta(days=DELTA_SYNC_TOMBSTONE_DAYS):
+                since = None
+
+        # Overlap the next window so writes committed while this one runs are not lost
+        watermark = timezone.now() - timedelta(seconds=DELTA_SYNC_OVERLAP_SECONDS)
+        user_instance = get_request_user(request)
+
+        chatRooms = ChatRoom.objects.filter(member=user_instance)
+
+        if since:
+            chatRooms = chatRooms.filter(
+                Q(updated_at__gt = since) |
+                Q(
+                    memberships__user = user_instance,
+                    memberships__last_read_at__gt = since
+                ) |
+                Q(
+                    memberships__user = user_instance,
+                    memberships__joined_at__gt = since
+                )
+            ).distinct()
+
+        serializer = ChatRoomSerializer(
+            chatRooms.order_by('-updated_at'), many=True, context={'request': request}
+        )
+
+        removed = []
+        if since:
+            removed = set(
+                RoomTombstone.objects.filter(user=user_instance, removed_at__gt=since)
+                .values_list('roomId', flat=True)
+            )
+            # Left, then added back
+            removed -= set(
+                ChatRoom.objects.filter(member=user_instance, roomId__in=removed)
+                .values_list('roomId', flat=True)
+            )
+            removed = sorted(removed)
+
+        return Response(
+            {
+                'watermark': watermark,
+                'full': not since,
+                'rooms': serializer.data,
+                'removed': removed,
+            },
+            status = status.HTTP_200_OK
+        )
+
+class MessagesView(FieldsetViewMixin, ConditionalGetMixin, ListAPIView):
     serializer_class = ChatMessageSerializer
     pagination_class = LimitOffsetPagination 
     #permission_classes = [IsAuthenticated]
 
+    def get(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().get, *args, **kwargs)
+
+    def get_validators(self, request):
+
+        chatroom = ChatRoom.objects.filter(roomId = self.kwargs.get('roomId')).first()
+        if not chatroom:
+            return None
+
+        user_instance = get_request_user(request)
+        if not chatroom.member.filter(id=user_instance.id).exists():
+            return None
+
+        return message_list_validators(chatroom, user_instance, request.get_full_path())
+
     def get_queryset(self):
 
         roomId = self.kwargs.get('roomId')
 
         if roomId:
             chatroom = get_object_or_404(ChatRoom, roomId = roomId)
-            user_instance = User.objects.get(id=self.request.user.id)
+            user_instance = get_request_user(self.request)
 
             if not chatroom.member.filter(username=user_instance).exists():
                 return ChatMessage.objects.none()
             
-            
-            query_set = ChatMessage.objects.filter(
-                room__roomId = roomId
-            ).select_related('user').order_by('-timestamp')
-
-            return query_set
+            # Pages past the hot messages continue into the archive
+            return room_history(chatroom)
         
         return ChatMessage.objects.none()
 
+    def list(self, request, *args, **kwargs):
+
+        # Same payload as ChatMessageSerializer, built from rows (apps.chat.fastread)
+        page = self.paginate_queryset(message_rows(self.get_queryset()))
+        return self.get_paginated_response(render_messages(page, self.get_serializer_context()))
 
     def post(self, request, roomId):
 
         serializer = self.get_serializer(data = request.data)
         serializer.is_valid(raise_exception = True)
         chatroom = get_object_or_404(ChatRoom, roomId = roomId)
-        user_instance = User.objects.get(id=request.user.id)
+        user_instance = get_request_user(request)
 
         if not chatroom.member.filter(id=user_instance.id).exists():
             return Response(
@@ -171,28 +506,30 @@ class MessagesView(ListAPIView):
                     )
 
         image = request.FILES.get('image', None)
-        message = serializer.save(user = user_instance, room=chatroom, image=image)
-        chatroom.save(update_fields = ['updated_at'])
-        
-        channel_layer = get_channel_layer()
-        members = chatroom.member.all()
+        attachment = {}
+
+        if image:
+            stored = store_uploaded_file(image, image.content_type.split(';')[0].strip())
+            attachment = attachment_fields(stored, True, image.name)
 
-        for member in members:
-            async_to_sync(channel_layer.group_send)(
-                f"user_{member.id}",
+        with transaction.atomic():
+            message = serializer.save(user = user_instance, room=chatroom, **attachment)
+            chatroom.save(update_fields = ['updated_at'])
+            schedule_previews(message)
+
+            members = chatroom.member.values_list('id', flat=True)
+            publish_event(
+                user_groups(members),
                 {
-                    'type': 'chat_message',
-                    'message': {
                     'action': 'message',
                     'userId': user_instance.id,
                     'chatType': chatroom.type,
                     'roomId': roomId,
                     'message': message.message,
                     'userName': f"{user_instance.first_name} {user_instance.last_name}",
-                    'userImage': user_instance.image.url if user_instance.image else None,
+                    'userImage': user_instance.avatar_url(),
                     'timestamp': str(message.timestamp),
                     'image': None,
-                    }
                 }
             )
 
@@ -207,6 +544,140 @@ class MessagesView(ListAPIView):
         return context
 
   
+class BulkMessageIngestView(APIView):
+
+    parser_classes = [NDJSONParser]
+
+    @extend_schema(
+        request = {
+            'application/x-ndjson': {
+                'type': 'string',
+                'description': 'One JSON object per line: {"roomId", "userId", "message", "timestamp"}'
+            }
+        },
+        parameters = [
+            OpenApiParameter(
+                name = 'fanout',
+                type = bool,
+                location = OpenApiParameter.QUERY,
+                required = False,
+                description = 'Send real-time events for the ingested messages (default: true)'
+            ),
+        ],
+        responses = {
+            200: inline_serializer(
+                name = "BulkIngestResponse",
+                fields = {
+                    'created': drf_serializers.IntegerField(),
+                    'failed': drf_serializers.IntegerField(),
+                    'rooms': drf_serializers.IntegerField(),
+                    'errors': drf_serializers.ListField(child=drf_serializers.DictField()),
+                    'errorsTruncated': drf_serializers.BooleanField(),
+                }
+            )
+        },
+        description = "Bulk load of historical messages for many rooms (admin only)."
+    )
+
+    def post(self, request):
+
+        user = get_request_user(request)
+
+        if not (user.is_staff or user.is_admin()):
+            return Response(
+                {"error": "Only administrators can ingest messages."},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        fanout = request.query_params.get('fanout', 'true').lower() not in ('0', 'false', 'no')
+
+        ingestor = MessageIngestor(default_user = user, fanout = fanout)
+        result = ingestor.ingest(request.data)
+
+        return Response(result, status = status.HTTP_200_OK)
+
+
+class ChatTranscriptExportView(APIView):
+
+    @extend_schema(
+        parameters = [
+            OpenApiParameter(
+                name = 'output',
+                type = str,
+                location = OpenApiParameter.QUERY,
+                required = False,
+                enum = list(EXPORT_FORMATS),
+                description = 'Transcript format (default: ndjson)'
+            ),
+            OpenApiParameter(
+                name = 'since',
+                type = str,
+                location = OpenApiParameter.QUERY,
+                required = False,
+                description = 'ISO-8601 date or datetime, inclusive'
+            ),
+            OpenApiParameter(
+                name = 'until',
+                type = str,
+                location = OpenApiParameter.QUERY,
+                required = False,
+                description = 'ISO-8601 date or datetime, exclusive'
+            ),
+        ],
+        responses = {200: {'type': 'string', 'format': 'binary'}},
+        description = "Stream a room transcript, or every room in a date range (admin only), as NDJSON or CSV."
+    )
+
+    def get(self, request, roomId=None):
+
+        export_format = request.query_params.get('output', 'ndjson').lower()
+
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Invalid output. Use one of: {', '.join(EXPORT_FORMATS)}."},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            since = parse_bound(request.query_params.get('since'))
+            until = parse_bound(request.query_params.get('until'))
+        except ValueError as e:
+            return Response(
+                {"error": str(e)},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        user = get_request_user(request)
+        is_admin = user.is_staff or user.is_admin()
+        chatroom = None
+
+        if roomId:
+            chatroom = get_object_or_404(ChatRoom, roomId = roomId)
+
+            if not is_admin and not chatroom.member.filter(id = user.id).exists():
+                return Response(
+                    {"error": "You aren't member of this chat room!"},
+                    status = status.HTTP_403_FORBIDDEN
+                )
+        elif not is_admin:
+            return Response(
+                {"error": "Only administrators can export every room."},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        querysets = transcript_querysets(room = chatroom, since = since, until = until)
+        media_base = request.build_absolute_uri(MEDIA_URL)
+
+        response = StreamingHttpResponse(
+            stream_transcript(querysets, export_format, media_base),
+            content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        )
+        filename = f"transcript-{roomId or 'all'}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+        return response
+
+
 class MarkChatAsReadView(APIView):
 
     @extend_schema(
@@ -234,7 +705,7 @@ class MarkChatAsReadView(APIView):
                 status = status.HTTP_404_NOT_FOUND
             )
         
-        user = User.objects.get(id=request.user.id)
+        user = get_request_user(request)
 
         if not chatroom.member.filter(id = user.id).exists():
 
@@ -290,6 +761,7 @@ class UploadChatFileView(APIView):
                     'timestamp': drf_serializers.DateTimeField(),
                     'type': drf_serializers.ChoiceField(choices=['image', 'file']),
                     'image': drf_serializers.URLField(allow_null=True),
+                    'thumbnail': drf_serializers.URLField(allow_null=True),
                     'file': drf_serializers.URLField(allow_null=True),
                     'fileName': drf_serializers.CharField(allow_null=True),
                     'fileType': drf_serializers.CharField(allow_null=True),
@@ -333,7 +805,7 @@ class UploadChatFileView(APIView):
                 status = status.HTTP_404_NOT_FOUND
             )
         
-        user = User.objects.get(id=request.user.id)
+        user = get_request_user(request)
 
         if not chatroom.member.filter(id=user.id).exists():
             return Response(
@@ -344,67 +816,397 @@ class UploadChatFileView(APIView):
         content_type = uploaded_file.content_type.split(';')[0].strip()
         is_image = content_type in ALLOWED_IMAGE_TYPES
 
-        chat_message = ChatMessage.objects.create(
-            room = chatroom,
+        stored = store_uploaded_file(uploaded_file, content_type)
+        attachment = attachment_fields(stored, is_image, uploaded_file.name)
+
+        response_data = create_attachment_message(
+            request, chatroom, user, message, is_image, **attachment
+        )
+        
+        return Response(response_data, status = status.HTTP_201_CREATED)
+
+UPLOAD_RESPONSE_FIELDS = {
+    'uploadId': drf_serializers.CharField(),
+    'roomId': drf_serializers.CharField(),
+    'fileName': drf_serializers.CharField(),
+    'fileType': drf_serializers.CharField(),
+    'fileSize': drf_serializers.IntegerField(),
+    'offset': drf_serializers.IntegerField(),
+    'chunkSize': drf_serializers.IntegerField(),
+    'status': drf_serializers.CharField(),
+}
+
+def upload_state(upload):
+
+    return {
+        'uploadId': upload.uploadId,
+        'roomId': upload.room.roomId,
+        'fileName': upload.file_name,
+        'fileType': upload.file_type,
+        'fileSize': upload.file_size,
+        'offset': upload.received,
+        'chunkSize': UPLOAD_CHUNK_MAX_SIZE,
+        'status': upload.status,
+    }
+
+class ChunkedUploadView(APIView):
+
+    @extend_schema(
+        request = inline_serializer(
+            name = "ChunkedUploadInit",
+            fields = {
+                'roomId': drf_serializers.CharField(),
+                'fileName': drf_serializers.CharField(),
+                'fileType': drf_serializers.CharField(),
+                'fileSize': drf_serializers.IntegerField(),
+                'message': drf_serializers.CharField(required=False),
+                'checksum': drf_serializers.CharField(required=False, help_text='SHA-256 of the file (hex), checked on finalize'),
+            }
+        ),
+        responses = {201: inline_serializer(name = "ChunkedUploadState", fields = UPLOAD_RESPONSE_FIELDS)},
+        description = "Start a resumable upload. Size and content type are checked before any byte is sent."
+    )
+
+    def post(self, request):
+
+        roomId = request.data.get('roomId')
+        file_name = os.path.basename(str(request.data.get('fileName') or ''))
+        content_type = str(request.data.get('fileType') or '').split(';')[0].strip()
+        checksum = str(request.data.get('checksum') or '').strip().lower()
+
+        try:
+            file_size = int(request.data.get('fileSize') or 0)
+        except (TypeError, ValueError):
+            file_size = 0
+
+        if not roomId:
+            return Response(
+                {"error": "roomId not provided."},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        error = validate_declared_file(file_name, content_type, file_size, checksum)
+        if error:
+            return Response({"error": error}, status = status.HTTP_400_BAD_REQUEST)
+
+        try:
+            chatroom = ChatRoom.objects.get(roomId = roomId)
+        except ChatRoom.DoesNotExist:
+            return Response(
+                {"error": "Chat room does not exists."},
+                status = status.HTTP_404_NOT_FOUND
+            )
+
+        user = get_request_user(request)
+
+        if not chatroom.member.filter(id=user.id).exists():
+            return Response(
+                {"error": "You aren't member of this chat room!"},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        upload = ChatUpload.objects.create(
             user = user,
-            message = message if message else None,
-            image = uploaded_file if is_image else None,
-            file = uploaded_file if not is_image else None,
-            file_name = uploaded_file.name if not is_image else None,
-            file_type = content_type if not is_image else None,
-            file_size = uploaded_file.size if not is_image else None
+            room = chatroom,
+            message = request.data.get('message') or None,
+            file_name = file_name,
+            file_type = content_type,
+            file_size = file_size,
+            checksum = checksum
         )
 
+        os.makedirs(os.path.dirname(upload.get_part_path()), exist_ok=True)
+        open(upload.get_part_path(), 'wb').close()
+
+        return Response(upload_state(upload), status = status.HTTP_201_CREATED)
+
+class ChunkedUploadDetailView(APIView):
+
+    def get_upload(self, request, uploadId):
+
+        return get_object_or_404(
+            ChatUpload.objects.select_related('room'),
+            uploadId = uploadId,
+            user_id = request.user.id
+        )
+
+    @extend_schema(
+        responses = {200: inline_serializer(name = "ChunkedUploadStatus", fields = UPLOAD_RESPONSE_FIELDS)},
+        description = "Current offset of a resumable upload, to resume after a dropped connection."
+    )
+
+    def get(self, request, uploadId):
+
+        upload = self.get_upload(request, uploadId)
+        return Response(upload_state(upload), status = status.HTTP_200_OK)
+
+    @extend_schema(
+        request = {'application/octet-stream': {'type': 'string', 'format': 'binary'}},
+        parameters = [
+            OpenApiParameter(
+                name = 'Upload-Offset',
+                type = int,
+                location = OpenApiParameter.HEADER,
+                required = True,
+                description = 'Offset of this chunk, must match the current upload offset'
+            ),
+        ],
+        responses = {200: inline_serializer(name = "ChunkedUploadAppend", fields = UPLOAD_RESPONSE_FIELDS)},
+        description = "Append a chunk (raw body) to a resumable upload."
+    )
+
+    def patch(self, request, uploadId):
+
+        upload = self.get_upload(request, uploadId)
+
+        if upload.status != ChatUpload.Status.PENDING:
+            return Response(
+                {"error": "Upload already finalized."},
+                status = status.HTTP_409_CONFLICT
+            )
+
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return Response(
+                {"error": "Upload-Offset header is required."},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        if offset != upload.received:
+            return Response(
+                {"error": "Upload-Offset does not match.", **upload_state(upload)},
+                status = status.HTTP_409_CONFLICT
+            )
+
+        if length <= 0 or length > UPLOAD_CHUNK_MAX_SIZE:
+            return Response(
+                {"error": f"Chunk size must be between 1 and {UPLOAD_CHUNK_MAX_SIZE} bytes."},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        if offset + length > upload.file_size:
+            return Response(
+                {"error": "Chunk exceeds the declared file size."},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        # Claims the range: of two requests at the same offset only one
+        # updates the row, the other gets the conflict and writes nothing
+        claimed = ChatUpload.objects.filter(
+            id = upload.id,
+            status = ChatUpload.Status.PENDING,
+            received = offset
+        ).update(received = offset + length, updated_at = timezone.now())
+
+        if not claimed:
+            upload = self.get_upload(request, uploadId)
+            return Response(
+                {"error": "Upload-Offset does not match.", **upload_state(upload)},
+                status = status.HTTP_409_CONFLICT
+            )
+
+        part_path = upload.get_part_path()
+        written = 0
+
+        with open(part_path, 'r+b') as part:
+            part.seek(offset)
+
+            while written < length:
+                data = request.stream.read(min(64 * 1024, length - written))
+                if not data:
+                    break
+
+                if offset == 0 and written == 0 and not matches_content_type(upload.file_type, data[:SNIFF_SIZE]):
+                    upload.delete()
+                    os.remove(part_path)
+                    return Response(
+                        {"error": f"File content does not match '{upload.file_type}'."},
+                        status = status.HTTP_400_BAD_REQUEST
+                    )
+
+                part.write(data)
+                written += len(data)
+
+        # Dropped connection: only the bytes that arrived count, whatever
+        # was claimed after this range is sent again from here
+        if written < length:
+            ChatUpload.objects.filter(
+                id = upload.id,
+                received__gt = offset + written
+            ).update(received = offset + written, updated_at = timezone.now())
+
+        upload.refresh_from_db()
+        return Response(upload_state(upload), status = status.HTTP_200_OK)
+
+class ChunkedUploadFinalizeView(APIView):
+
+    @extend_schema(
+        request = None,
+        responses = {
+            201: inline_serializer(
+                name = 'ChunkedUploadFinalizeResponse',
+                fields = {
+                    'messageId': drf_serializers.IntegerField(),
+                    'roomId': drf_serializers.CharField(),
+                    'message': drf_serializers.CharField(allow_null=True),
+                    'type': drf_serializers.ChoiceField(choices=['image', 'file']),
+                    'image': drf_serializers.URLField(allow_null=True),
+                    'file': drf_serializers.URLField(allow_null=True),
+                }
+            )
+        },
+        description = "Finish a resumable upload and post it to the chat room."
+    )
+
+    def post(self, request, uploadId):
+
+        upload = get_object_or_404(
+            ChatUpload.objects.select_related('room', 'user'),
+            uploadId = uploadId,
+            user_id = request.user.id,
+            status = ChatUpload.Status.PENDING
+        )
+
+        part_path = upload.get_part_path()
+        size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        if upload.received != upload.file_size or size != upload.file_size:
+            return Response(
+                {"error": "Upload is incomplete.", **upload_state(upload)},
+                status = status.HTTP_409_CONFLICT
+            )
+
+        if upload.checksum and hash_path(part_path)[0] != upload.checksum:
+            # Some chunk was corrupted on the way, the upload starts over
+            upload.delete()
+            os.remove(part_path)
+            return Response(
+                {"error": "File checksum does not match, upload it again."},
+                status = status.HTTP_400_BAD_REQUEST
+            )
+
+        chatroom = upload.room
+        user = upload.user
+
+        if not chatroom.member.filter(id=user.id).exists():
+            return Response(
+                {"error": "You aren't member of this chat room!"},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        is_image = upload.is_image()
+        stored = store_path(part_path, upload.file_name, upload.file_type)
+        attachment = attachment_fields(stored, is_image, upload.file_name)
+
+        response_data = create_attachment_message(
+            request, chatroom, user, upload.message, is_image, **attachment
+        )
+
+        upload.status = ChatUpload.Status.COMPLETE
+        upload.save(update_fields = ['status', 'updated_at'])
 
-        response_data = {
-            "messageId": chat_message.id,
-            "roomId": chatroom.roomId,
-            "message": message if message else None,
-            "userId": user.id,
-            "userName": f"{user.first_name} {user.last_name}",
-            "userImage": request.build_absolute_uri(user.image.url) if user.image else None,
-            "timestamp": str(chat_message.timestamp),
-            "type": "image" if is_image else "file",
-        }
-
-        if is_image:
-            response_data["image"] = request.build_absolute_uri(chat_message.image.url)
-        else:
-            response_data["file"] = request.build_absolute_uri(chat_message.file.url)
-            response_data["fileName"] = chat_message.file_name
-            response_data["fileType"] = chat_message.file_type
-            response_data["fileSize"] = chat_message.file_size
-        
         return Response(response_data, status = status.HTTP_201_CREATED)
 
-class SupportChatsListView(APIView):
+class SupportChatsListView(ConditionalGetMixin, APIView):
 
     def get(self, request):
 
-        user = request.user
-        
-        ChatRoom.objects.filter(
+        expired = ChatRoom.objects.filter(
             type = ChatRoom.ChatType.SUPPORT,
             taken_at__lt = timezone.now() - timedelta(hours=TIME_HOUR_CHAT_EXPIRED)
-        ).update(assigned_agent=None, taken_at=None)
+        )
+        expired_ids = list(expired.values_list('id', flat=True))
+
+        if expired_ids:
+            ChatRoom.objects.filter(id__in = expired_ids).update(
+                assigned_agent=None, taken_at=None, updated_at=timezone.now()
+            )
+            room_cache.invalidate(*expired_ids)
+
+        # Agents get read marks for the queued chats they are not in. The
+        # serializer would create them lazily, after the validators were
+        # taken, and the first ETag would never match.
+        user_instance = get_request_user(request)
+        unmarked = ChatRoom.objects.filter(
+            type = ChatRoom.ChatType.SUPPORT
+        ).exclude(memberships__user = user_instance).values_list('id', flat=True)
+
+        ChatRoomMembership.objects.bulk_create(
+            [ChatRoomMembership(user = user_instance, room_id = room_id) for room_id in unmarked],
+            ignore_conflicts = True
+        )
+
+        return self.conditional_get(request, self.list_support_chats)
+
+    def get_validators(self, request):
+
+        user_instance = get_request_user(request)
+        return room_list_validators(
+            ChatRoom.objects.filter(type = ChatRoom.ChatType.SUPPORT),
+            user_instance
+        )
+
+    def list_support_chats(self, request):
 
         chats = ChatRoom.objects.filter(
             type = ChatRoom.ChatType.SUPPORT
         ).order_by('-updated_at')
 
+        fieldsets = fieldset_context(request)
         serializer = ChatRoomSerializer(
             chats,
             many=True,
-            context={'request': request}
+            context={'request': request, **fieldsets}
         )
 
+        # Compact lists carry the users next to the rooms
+        if fieldsets['users'] is not None:
+            return Response(
+                {'results': serializer.data, 'users': fieldsets['users'].data(request)},
+                status = status.HTTP_200_OK
+            )
+
         return Response(serializer.data, status = status.HTTP_200_OK)
 
+class RoomCacheStatsView(APIView):
+
+    @extend_schema(
+        responses = {
+            200: inline_serializer(
+                name = "RoomCacheStatsResponse",
+                fields = {
+                    'backend': drf_serializers.CharField(),
+                    'hits': drf_serializers.IntegerField(),
+                    'misses': drf_serializers.IntegerField(),
+                    'hitRate': drf_serializers.FloatField(allow_null=True),
+                    'invalidations': drf_serializers.IntegerField(),
+                    'evictions': drf_serializers.IntegerField(),
+                    'size': drf_serializers.IntegerField(allow_null=True),
+                }
+            )
+        },
+        description = "Hit and miss counters of the room payload cache in this process (admin only)."
+    )
+
+    def get(self, request):
+
+        user = get_request_user(request)
+
+        if not (user.is_staff or user.is_admin()):
+            return Response(
+                {"error": "Only administrators can see cache stats."},
+                status = status.HTTP_403_FORBIDDEN
+            )
+
+        return Response(room_cache.stats(), status = status.HTTP_200_OK)
+
 class TakeReleaseChatView(APIView):
 
     def post(self, request, roomId, action):
 
-        user = User.objects.get(id=request.user.id)
+        user = get_request_user(request)
         
         chat = get_object_or_404(
             ChatRoom, 
@@ -0,0 +1,55 @@
+"""
+Single-writer queue. SQLite allows one writer at a time; instead of letting
+consumer threads race for the lock, async code hands its writes to one
+dedicated thread and awaits the result without blocking the event loop.
+"""
+from django.db import close_old_connections, Error as DatabaseError
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+
+
+class SingleWriter:
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "db-writer")
+
+    def call(self, fn, *args, **kwargs):
+
+        try:
+            return fn(*args, **kwargs)
+        except DatabaseError:
+            # Drop a broken connection, the next write opens a fresh one
+            close_old_connections()
+            raise
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        From sync code: returns a concurrent.futures.Future.
+        """
+
+        return self.executor.submit(self.call, fn, *args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(self.call, fn, *args, **kwargs)
+        )
+
+
+db_writer = SingleWriter()
+
+
+def database_write_to_async(fn):
+    """
+    Like channels' `database_sync_to_async`, for functions that write: they
+    run one at a time in the writer thread.
+    """
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await db_writer.run(fn, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,101 @@
+"""
+Hot path support for `ApiKey.validate_key`: validated keys are cached in
+process for a few seconds and usage is counted in memory, then written in
+batches by a background thread. Validating a cached key does no query and
+no write. Only that thread writes: counts recorded in the last
+API_KEY_USAGE_FLUSH_INTERVAL before the process stops are not saved.
+"""
+from django.db import close_old_connections
+from django.db.models import F
+from apps.chat.cache import LRUCacheBackend
+from V0X.settings import (
+    API_KEY_CACHE_TTL,
+    API_KEY_CACHE_MAX_ENTRIES,
+    API_KEY_USAGE_FLUSH_INTERVAL
+)
+import threading
+import time
+
+api_key_cache = LRUCacheBackend(max_entries = API_KEY_CACHE_MAX_ENTRIES, timeout = API_KEY_CACHE_TTL)
+
+
+class UsageRecorder:
+    """
+    Accumulates (count, last used) per key id until `flush` writes them,
+    one UPDATE per key instead of one per request.
+    """
+
+    def __init__(self):
+
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def record(self, key_id, used_at):
+
+        with self.lock:
+            count, _ = self.pending.get(key_id, (0, None))
+            self.pending[key_id] = (count + 1, used_at)
+
+        start_usage_flusher()
+
+    def flush(self):
+
+        from .models import ApiKey
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        for key_id, (count, used_at) in pending.items():
+            ApiKey.objects.filter(id = key_id).update(
+                usage_count = F('usage_count') + count,
+                last_used_at = used_at
+            )
+
+        return len(pending)
+
+    def reset(self):
+        """
+        Drops the pending counts without writing them (tests).
+        """
+
+        with self.lock:
+            self.pending = {}
+
+
+usage_recorder = UsageRecorder()
+
+
+class UsageFlusher(threading.Thread):
+
+    def __init__(self, interval = API_KEY_USAGE_FLUSH_INTERVAL):
+
+        super().__init__(name = "api-key-usage-flusher", daemon = True)
+        self.interval = interval
+
+    def run(self):
+
+        while True:
+            time.sleep(self.interval)
+            try:
+                usage_recorder.flush()
+            except Exception as e:
+                print(f"[API KEY] Usage flush error: {str(e)}")
+            finally:
+                close_old_connections()
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def start_usage_flusher():
+
+    global _flusher
+
+    if _flusher is not None and _flusher.is_alive():
+        return
+
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = UsageFlusher()
+            _flusher.start()
@@ -0,0 +1,65 @@
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from V0X.settings import AVATAR_VARIANTS
+import hashlib
+import os
+
+
+def avatar_variant_name(digest, variant):
+    """
+    Variants are named after the hash of the original, a new picture always
+    gets new URLs and the old ones can be cached forever.
+    """
+
+    return f"avatars/{digest[:24]}-{variant}.webp"
+
+
+def render_avatar(source, target_path, size):
+
+    with Image.open(source) as image:
+
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        variant = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        variant.save(target_path, 'WEBP', quality=85, method=4)
+
+
+def generate_avatar_variants(user):
+    """
+    Renders the square variants in AVATAR_VARIANTS for `user.image` and
+    stores their names in `user.image_variants`.
+    """
+
+    if not user.image:
+        if user.image_variants:
+            user.image_variants = None
+            user.save(update_fields = ['image_variants', 'updated_at'])
+        return None
+
+    hasher = hashlib.sha256()
+    with user.image.open('rb') as source:
+        for chunk in source.chunks():
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+
+    variants = {}
+
+    for variant, size in AVATAR_VARIANTS.items():
+
+        name = avatar_variant_name(digest, variant)
+
+        # Same picture uploaded again: the variant is already there
+        if not default_storage.exists(name):
+            render_avatar(user.image.path, default_storage.path(name), size)
+
+        variants[variant] = name
+
+    user.image_variants = variants
+    user.save(update_fields = ['image_variants', 'updated_at'])
+
+    return variants
@@ -0,0 +1,61 @@
+"""
+JWTTokenUserAuthentication gives views a TokenUser that only carries the
+id. `get_request_user` loads the real User once per request and shares it
+between the view, its serializers and its helpers; `user_profile` keeps the
+few fields rendered in payloads cached for a short time.
+"""
+from apps.chat.cache import LRUCacheBackend
+from V0X.settings import USER_PROFILE_CACHE_TTL, USER_PROFILE_CACHE_MAX_ENTRIES
+from .models import User
+
+profile_cache = LRUCacheBackend(
+    max_entries = USER_PROFILE_CACHE_MAX_ENTRIES,
+    timeout = USER_PROFILE_CACHE_TTL
+)
+
+
+def get_request_user(request):
+    """
+    User behind `request.user`, queried at most once per request. Works
+    with the DRF Request or the HttpRequest it wraps.
+    """
+
+    http_request = getattr(request, '_request', request)
+    user = getattr(http_request, '_loaded_user', None)
+
+    # TokenUser.id comes from the token claim, a string
+    if user is None or str(user.id) != str(request.user.id):
+        user = User.objects.select_related('user_type').get(id = request.user.id)
+        http_request._loaded_user = user
+
+    return user
+
+
+def build_profile(user):
+
+    return {
+        'id': user.id,
+        'userName': f"{user.first_name} {user.last_name}",
+        'userImage': user.avatar_url(),
+        'userType': user.get_type_code(),
+    }
+
+
+def user_profile(user_id):
+    """
+    Name, avatar URL and type code of a user, cached for
+    USER_PROFILE_CACHE_TTL seconds and dropped when the user is saved.
+    """
+
+    user_id = int(user_id)
+    profile = profile_cache.get(user_id)
+
+    if profile is None:
+        user = User.objects.select_related('user_type').only(
+            'id', 'first_name', 'last_name', 'image', 'image_variants', 'user_type'
+        ).get(id = user_id)
+
+        profile = build_profile(user)
+        profile_cache.set(user_id, profile)
+
+    return profile
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.user.models import ApiKey, UserType
+from apps.user.serializers import GuestAuthSerializer
+import time
+import uuid
+
+class Command(BaseCommand):
+
+    help = "Measure guest auths per second (new and returning guests). Everything is rolled back"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=200,
+            help="Guest auths per phase (default: 200)"
+        )
+
+    def authenticate(self, api_key, email):
+
+        serializer = GuestAuthSerializer(
+            data = {'email': email, 'first_name': 'Bench', 'last_name': 'Guest'},
+            api_key = api_key
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.authenticate()
+
+    def run_phase(self, label, api_key, emails):
+
+        started = time.perf_counter()
+
+        for email in emails:
+            self.authenticate(api_key, email)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'  ➜ {label}: {len(emails)} auths in {elapsed:.2f}s, {len(emails) / elapsed:.1f} auths/s'
+        )
+
+    def handle(self, *args, **options):
+
+        count = options['count']
+        emails = [f"bench-{uuid.uuid4().hex[:12]}@example.com" for _ in range(count)]
+
+        with transaction.atomic():
+
+            UserType.objects.get_or_create(
+                code = 'GUEST',
+                defaults = {'name': 'Guest', 'priority': 0}
+            )
+            api_key, _ = ApiKey.create_key(name = 'bench', rate_limit = 0)
+
+            self.run_phase('New guests', api_key, emails)
+            self.run_phase('Returning guests', api_key, emails)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished, changes rolled back.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from apps.user.models import User
+from apps.user.avatars import generate_avatar_variants
+
+class Command(BaseCommand):
+
+    help = "Generate resized avatar variants for users that have a profile image"
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Regenerate variants for users that already have them"
+        )
+
+    def handle(self, *args, **options):
+
+        queryset = User.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            queryset = queryset.filter(image_variants__isnull=True)
+
+        generated = 0
+        failed = 0
+
+        for user in queryset.only('id', 'image', 'image_variants').iterator():
+            try:
+                generate_avatar_variants(user)
+                generated += 1
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'  ➜ User {user.id}: {str(e)}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Avatar variants generated: {generated} ok, {failed} failed.')
+        )
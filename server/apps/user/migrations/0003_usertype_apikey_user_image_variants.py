@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user', '0002_alter_user_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserType',
+            fields=[
+                ('code', models.CharField(help_text='Unique type code example: (ADMIN, MOD, USER)', max_length=8, primary_key=True, serialize=False, unique=True)),
+                ('name', models.CharField(help_text='Readable name for the user type', max_length=32)),
+                ('description', models.TextField(blank=True, help_text='Description about the user type', null=True)),
+                ('priority', models.IntegerField(default=0, help_text='Priority level/privileges of the user type')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'User Type',
+                'verbose_name_plural': 'User Types',
+                'db_table': 'user_types',
+                'ordering': ['-priority'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='user',
+            options={},
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='userId',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='guess_metadata',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='image_variants',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterModelTable(
+            name='user',
+            table='users',
+        ),
+        migrations.CreateModel(
+            name='ApiKey',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(help_text='Name for the API key', max_length=24)),
+                ('key_hash', models.CharField(db_index=True, max_length=64, unique=True)),
+                ('key_prefix', models.CharField(help_text='Prefix for the API key, used for identification', max_length=8)),
+                ('status', models.CharField(choices=[('ACTIVE', 'active'), ('INACTIVE', 'inactive'), ('REVOKED', 'revoked'), ('EXPIRED', 'expired')], default='ACTIVE', max_length=8)),
+                ('scopes', models.JSONField(default=list, help_text='List of scopes/permissions associated with the API key')),
+                ('metadata', models.JSONField(blank=True, null=True)),
+                ('rate_limit', models.IntegerField(default=10000, help_text='Number of request for hour (0 = unlimited)')),
+                ('usage_count', models.IntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Expiration date for the API key.', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='owner_api_keys', to=settings.AUTH_USER_MODEL)),
+                ('default_user_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='api_keys', to='user.usertype')),
+            ],
+            options={
+                'verbose_name': 'Api Key',
+                'verbose_name_plural': 'Api Keys',
+                'db_table': 'api_keys',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='user_type',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='users', to='user.usertype'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:50
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def blank_duplicate_emails(apps, schema_editor):
+    """
+    Keeps each non-blank email on its oldest user, the one email lookups
+    (`.filter(email=...).first()`) already resolved to, and blanks it on
+    the others so the constraint can be created. Those users keep their
+    rows, rooms and messages.
+    """
+
+    User = apps.get_model('user', 'User')
+
+    duplicated = (
+        User.objects.exclude(email = '')
+        .values('email')
+        .annotate(users = Count('id'))
+        .filter(users__gt = 1)
+        .values_list('email', flat = True)
+    )
+
+    for email in list(duplicated):
+        keep = User.objects.filter(email = email).order_by('id').values_list('id', flat = True).first()
+        User.objects.filter(email = email).exclude(id = keep).update(email = '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_usertype_apikey_user_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(condition=models.Q(('email', ''), _negated=True), fields=('email',), name='users_email_unique'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_users_email_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['email'], name='users_email_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 from django.db.models import Count
 from django.contrib.auth.models import AbstractUser
+from django.core.files.storage import default_storage
 from django.utils import timezone
+from .apikeys import api_key_cache, usage_recorder
 import secrets
 import hashlib
     
@@ -43,12 +45,42 @@ class UserType(models.Model):
     def __str__(self):
 
         return f"{self.code} - {self.name}"
+
+    @classmethod
+    def get_by_code(cls, code):
+        """
+        Process-cached lookup, user types are seed data.
+        """
+
+        user_type = _user_types_by_code.get(code)
+
+        if user_type is None:
+            user_type = cls.objects.get(code = code)
+            _user_types_by_code[code] = user_type
+
+        return user_type
+
+    def save(self, *args, **kwargs):
+
+        super().save(*args, **kwargs)
+        _user_types_by_code.pop(self.code, None)
+
+    def delete(self, *args, **kwargs):
+
+        _user_types_by_code.pop(self.code, None)
+        return super().delete(*args, **kwargs)
+
+
+_user_types_by_code = {}
     
 
 
 class User(AbstractUser):
     image = models.ImageField(upload_to="user", null=True, blank=True)
 
+    # Storage names of the resized copies of `image`, by AVATAR_VARIANTS key
+    image_variants = models.JSONField(null=True, blank=True)
+
     user_type = models.ForeignKey(
         UserType,
         on_delete = models.PROTECT,
@@ -63,8 +95,24 @@ class User(AbstractUser):
         blank=True
     )
 
+    # Name and avatar are rendered in message lists, their validators read this
+    updated_at = models.DateTimeField(auto_now = True)
+
     class Meta:
         db_table = "users"
+        indexes = [
+            # The partial unique index below is not usable for `email = ?`
+            # lookups, SQLite can not prove they satisfy its condition
+            models.Index(fields = ['email'], name = 'users_email_idx'),
+        ]
+        constraints = [
+            # Guest auth finds users by email, concurrent first visits rely on it
+            models.UniqueConstraint(
+                fields = ['email'],
+                condition = ~models.Q(email = ''),
+                name = 'users_email_unique'
+            ),
+        ]
     
     def is_guest(self):
         return self.user_type and self.user_type.code == "GUEST"
@@ -78,6 +126,16 @@ class User(AbstractUser):
     def get_priority(self):
         return self.user_type.priority if self.user_type else 0
 
+    def avatar_url(self, variant='small'):
+
+        if not self.image:
+            return None
+
+        if self.image_variants and variant in self.image_variants:
+            return default_storage.url(self.image_variants[variant])
+
+        return self.image.url
+
 class OnlineUser(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
@@ -213,26 +271,30 @@ class ApiKey(models.Model):
             return None
         
         key_hash = cls.hash_key(key_plain)
+        api_key = api_key_cache.get(key_hash)
 
-        try:
-            api_key = cls.objects.get(key_hash = key_hash)
-
-            if api_key.status != cls.Status.ACTIVE:
-                return None
-            
-            if api_key.expires_at and api_key.expires_at < timezone.now():
-                api_key.status = cls.Status.EXPIRED
-                api_key.save(update_fields = ['status'])
+        if api_key is None:
+            try:
+                api_key = cls.objects.get(key_hash = key_hash)
+            except cls.DoesNotExist:
                 return None
-            
-            api_key.usage_count += 1
-            api_key.last_used_at = timezone.now()
-            api_key.save(update_fields = ['usage_count', 'last_used_at'])
 
-            return api_key
+            api_key_cache.set(key_hash, api_key)
 
-        except cls.DoesNotExist:
+        if api_key.status != cls.Status.ACTIVE:
             return None
+        
+        now = timezone.now()
+
+        if api_key.expires_at and api_key.expires_at < now:
+            api_key.status = cls.Status.EXPIRED
+            api_key.save(update_fields = ['status'])
+            return None
+        
+        # Counted in memory, written in batches by the usage flusher
+        usage_recorder.record(api_key.id, now)
+
+        return api_key
     
     def has_scope(self, scope):
 
@@ -242,4 +304,15 @@ class ApiKey(models.Model):
 
         self.status = self.Status.REVOKED
         self.save(update_fields = ['status'])
+
+    def save(self, *args, **kwargs):
+
+        super().save(*args, **kwargs)
+        # Status, scopes or expiry may have changed (admin edits)
+        api_key_cache.delete_many([self.key_hash])
+
+    def delete(self, *args, **kwargs):
+
+        api_key_cache.delete_many([self.key_hash])
+        return super().delete(*args, **kwargs)
     
@@ -0,0 +1,209 @@
+"""
+Token-bucket rate limiting for public endpoints.
+
+A bucket holds up to `burst` tokens and refills at `limit / period` tokens
+per second; every request takes one. Buckets live in a backend: in process
+(`LocalRateLimitBackend`) or in a Django cache shared by every worker
+(`CacheRateLimitBackend`).
+"""
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import Throttled
+from V0X.settings import (
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_CACHE_ALIAS,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_TRUST_FORWARDED
+)
+from collections import OrderedDict
+import math
+import threading
+import time
+
+
+class RateLimitResult:
+
+    def __init__(self, allowed, limit, remaining, reset_after, retry_after):
+
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_after = reset_after
+        self.retry_after = retry_after
+
+    def headers(self):
+
+        headers = {
+            'RateLimit-Limit': str(self.limit),
+            'RateLimit-Remaining': str(self.remaining),
+            'RateLimit-Reset': str(self.reset_after),
+        }
+
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+
+        return headers
+
+
+def take_token(state, now, rate, capacity, cost = 1):
+    """
+    Refills a bucket `state` (tokens, updated_at) up to `now` and tries to
+    take `cost` tokens. Returns (new_state, allowed).
+    """
+
+    if state is None:
+        tokens = capacity
+    else:
+        tokens, updated_at = state
+        tokens = min(capacity, tokens + max(0, now - updated_at) * rate)
+
+    allowed = tokens >= cost
+    if allowed:
+        tokens -= cost
+
+    return (tokens, now), allowed
+
+
+class LocalRateLimitBackend:
+    """
+    Buckets in a dict of this process, bounded to `max_keys` (least recently
+    used buckets are dropped, which only makes them full again).
+    """
+
+    def __init__(self, max_keys = RATE_LIMIT_MAX_KEYS):
+
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def update(self, key, apply):
+
+        with self.lock:
+            state, result = apply(self.buckets.get(key))
+
+            self.buckets[key] = state
+            self.buckets.move_to_end(key)
+
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last = False)
+
+        return result
+
+    def clear(self):
+
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheRateLimitBackend:
+    """
+    Buckets in CACHES[RATE_LIMIT_CACHE_ALIAS], shared between processes when
+    that cache is. Read and write are separate calls, concurrent requests
+    for one key can overshoot the limit by a few.
+    """
+
+    prefix = "ratelimit:"
+
+    def __init__(self, alias = RATE_LIMIT_CACHE_ALIAS):
+        self.cache = caches[alias]
+
+    def update(self, key, apply):
+
+        cache_key = self.prefix + key
+        state, result = apply(self.cache.get(cache_key))
+        self.cache.set(cache_key, state, math.ceil(result.reset_after) + 1)
+
+        return result
+
+
+class RateLimiter:
+
+    def __init__(self, backend, clock = time.time):
+
+        self.backend = backend
+        self.clock = clock
+
+    def hit(self, key, limit, period = 3600, burst = None, cost = 1):
+        """
+        Takes `cost` tokens from the bucket of `key`, allowing `limit`
+        requests per `period` seconds with bursts of up to `burst`.
+        """
+
+        capacity = min(burst, limit) if burst else limit
+        rate = limit / period
+        now = self.clock()
+
+        def apply(state):
+
+            state, allowed = take_token(state, now, rate, capacity, cost)
+            tokens = state[0]
+
+            result = RateLimitResult(
+                allowed = allowed,
+                limit = limit,
+                remaining = int(tokens),
+                reset_after = math.ceil((capacity - tokens) / rate),
+                retry_after = 0 if allowed else math.ceil((cost - tokens) / rate)
+            )
+            return state, result
+
+        return self.backend.update(key, apply)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+
+    global _limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(import_string(RATE_LIMIT_BACKEND)())
+    return _limiter
+
+
+def client_ip(request):
+
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class RateLimitMixin:
+    """
+    For APIViews: `self.rate_limit(...)` raises Throttled (429 with
+    Retry-After) once the bucket is empty, and the response carries
+    RateLimit-* headers of the most restrictive bucket checked.
+    """
+
+    def rate_limit(self, request, key, limit, period = 3600, burst = None):
+
+        if not limit:
+            return None
+
+        result = get_limiter().hit(key, limit, period, burst)
+
+        current = getattr(request, '_rate_limit', None)
+        if current is None or not result.allowed or result.remaining < current.remaining:
+            request._rate_limit = result
+
+        if not result.allowed:
+            raise Throttled(wait = result.retry_after)
+
+        return result
+
+    def finalize_response(self, request, response, *args, **kwargs):
+
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        result = getattr(request, '_rate_limit', None)
+        if result:
+            for header, value in result.headers().items():
+                response[header] = value
+
+        return response
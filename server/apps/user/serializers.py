@@ -1,11 +1,15 @@
 from django.contrib.auth.password_validation import validate_password
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.core.cache import caches
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from apps.user.models import User, UserType, ApiKey
+from apps.user.avatars import generate_avatar_variants
+from apps.user.loader import get_request_user
 from apps.chat.models import ChatRoom
 from django.contrib.auth import authenticate
+from V0X.settings import GUEST_IDEMPOTENCY_CACHE_ALIAS, GUEST_IDEMPOTENCY_TTL
 from django.utils.translation import gettext_lazy as lazy
 from rest_framework_simplejwt.tokens import RefreshToken
 from apps.chat.models import ChatRoom
@@ -115,6 +119,13 @@ class SignupSerializer(serializers.ModelSerializer):
 
         user.set_password(validated_data['password'])
         user.save()
+
+        if user.image:
+            try:
+                generate_avatar_variants(user)
+            except Exception as e:
+                print(f"[AVATARS] User {user.id} variants not generated: {str(e)}")
+
         chatRoom = ChatRoom.objects.create(
             type=ChatRoom.ChatType.SELF, 
             name=user.first_name + user.last_name
@@ -157,8 +168,17 @@ class ProfileSerializer(serializers.ModelSerializer):
 
         if 'image' in validated_data:
             instance.image = validated_data['image']
+            # Rendered from the old picture, regenerated below
+            instance.image_variants = None
         
         instance.save()
+
+        if 'image' in validated_data:
+            try:
+                generate_avatar_variants(instance)
+            except Exception as e:
+                print(f"[AVATARS] User {instance.id} variants not generated: {str(e)}")
+
         return instance
 
 class ChangePasswordSerializer(serializers.Serializer):
@@ -175,11 +195,10 @@ class ChangePasswordSerializer(serializers.Serializer):
 
     def validate_current_password(self, value):
 
-        user = self.context['request'].user
-        main_user = User.objects.get(id=user.id)
+        main_user = get_request_user(self.context['request'])
 
         if not main_user.check_password(value):
-            raise serializer.ValidationError("The password is incorrect from server!")
+            raise serializers.ValidationError("The password is incorrect from server!")
         return value
 
     
@@ -194,14 +213,17 @@ class ChangePasswordSerializer(serializers.Serializer):
     
     def save(self):
 
-        user = self.context["request"].user
-        main_user = User.objects.get(id=user.id)
+        main_user = get_request_user(self.context["request"])
         main_user.set_password(self.validated_data["new_password"])
         main_user.save()
 
         return main_user
 
 
+class IdempotencyConflict(Exception):
+    pass
+
+
 class GuestAuthSerializer(serializers.Serializer):
 
     email = serializers.EmailField(required=True, allow_blank=False)
@@ -231,39 +253,58 @@ class GuestAuthSerializer(serializers.Serializer):
     def get_or_created_guest(self, validated_data):
 
         email = validated_data.get('email')
-        first_name = validated_data.get('first_name')
-        last_name = validated_data.get('last_name')
 
-        username = None
-        created = False
+        user = User.objects.select_related('user_type').filter(email=email).first()
+
+        if user:
+            return user, False
+
+        user_preffix = uuid.uuid4().hex[:8]
+        base_username = email.split('@')[0]
+
+        user = User(
+            username = f"{base_username}_{user_preffix}",
+            email = email,
+            first_name = validated_data.get('first_name'),
+            last_name = validated_data.get('last_name'),
+            user_type = UserType.get_by_code('GUEST'),
+            is_active = True
+        )
+        # Guests never log in with a password, skip the hashing
+        user.set_unusable_password()
 
         try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            user = None
-        
-        if not user:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # Concurrent first visit with the same email created it first
+            return User.objects.select_related('user_type').get(email=email), False
 
-            user_preffix = uuid.uuid4().hex[:8]
-            base_username = email.split('@')[0]
-            username = f"{base_username}_{user_preffix}"
-            user_type = UserType.objects.get(code='GUEST')
-
-            user = User.objects.create(
-                username=username,
-                email=email,
-                first_name = first_name,
-                last_name = last_name,
-                user_type = user_type,
-                is_active = True
-            )
+        return user, True
 
-            user.set_password(uuid.uuid4().hex)
-            user.save()
+    def get_or_create_support_room(self, user, created):
 
-            created = True
-        
-        return user, created
+        if not created:
+            support_room = ChatRoom.objects.filter(
+                type = ChatRoom.ChatType.SUPPORT,
+                created_by = user
+            ).only('id', 'roomId').first()
+
+            if support_room:
+                return support_room
+
+        try:
+            with transaction.atomic():
+                support_room = ChatRoom.objects.create(
+                    type = ChatRoom.ChatType.SUPPORT,
+                    created_by = user,
+                    name = f"{user.first_name} {user.last_name}"
+                )
+                ChatRoom.member.through.objects.create(chatroom = support_room, user = user)
+        except IntegrityError:
+            support_room = ChatRoom.objects.get(type = ChatRoom.ChatType.SUPPORT, created_by = user)
+
+        return support_room
     
     def generate_tokens(self, user):
 
@@ -276,21 +317,57 @@ class GuestAuthSerializer(serializers.Serializer):
             'access_token': str(refresh.access_token)
         }
 
-    def authenticate(self):
+    def idempotency_cache_key(self, idempotency_key):
 
-        user, created = self.get_or_created_guest(self.validated_data)
-        tokens = self.generate_tokens(user)
+        api_key_id = self.api_key.id if self.api_key else 0
+        return f"guest-auth:{api_key_id}:{idempotency_key}"
 
-        support_room, room_created = ChatRoom.objects.get_or_create(
-            type = ChatRoom.ChatType.SUPPORT,
-            created_by = user,
-            defaults = {
-                'name': f"{user.first_name} {user.last_name}"
-            }
-        )
+    def replay(self, idempotency_key):
+        """
+        User and room of an earlier auth sent with the same Idempotency-Key,
+        or None. Raises IdempotencyConflict if it was for another email.
+        """
+
+        stored = caches[GUEST_IDEMPOTENCY_CACHE_ALIAS].get(self.idempotency_cache_key(idempotency_key))
+
+        if stored is None:
+            return None
+
+        if stored['email'] != self.validated_data['email']:
+            raise IdempotencyConflict("Idempotency-Key was already used with another email.")
 
-        if room_created:
-            support_room.member.add(user)
+        user = User.objects.select_related('user_type').filter(id = stored['userId']).first()
+        support_room = ChatRoom.objects.filter(id = stored['roomId']).only('id', 'roomId').first()
+
+        if not user or not support_room:
+            return None
+
+        return user, stored['is_new_user'], support_room
+
+    def authenticate(self, idempotency_key = None):
+
+        replayed = self.replay(idempotency_key) if idempotency_key else None
+
+        if replayed:
+            user, created, support_room = replayed
+        else:
+            with transaction.atomic():
+                user, created = self.get_or_created_guest(self.validated_data)
+                support_room = self.get_or_create_support_room(user, created)
+
+            if idempotency_key:
+                caches[GUEST_IDEMPOTENCY_CACHE_ALIAS].set(
+                    self.idempotency_cache_key(idempotency_key),
+                    {
+                        'email': user.email,
+                        'userId': user.id,
+                        'roomId': support_room.id,
+                        'is_new_user': created,
+                    },
+                    GUEST_IDEMPOTENCY_TTL
+                )
+
+        tokens = self.generate_tokens(user)
 
         return {
             **tokens,
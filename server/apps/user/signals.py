@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User
+from .loader import profile_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_profile(sender, instance, **kwargs):
+    profile_cache.delete_many([instance.id])
@@ -1,3 +1,396 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import QuerySet
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.chat.cache import room_cache
+from apps.chat.models import ChatRoom, ChatMessage
+from apps.chat.tests import QueryPlanMixin
+from apps.user.models import ApiKey, User, UserType
+from apps.user.serializers import GuestAuthSerializer, ProfileSerializer
+from apps.user.apikeys import api_key_cache, usage_recorder
+from apps.user.loader import get_request_user, profile_cache, user_profile
+from apps.user.ratelimit import (
+    RateLimiter,
+    LocalRateLimitBackend,
+    CacheRateLimitBackend,
+    get_limiter
+)
+from unittest import mock
+import uuid
 
-# Create your tests here.
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTests(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiters(self):
+        yield RateLimiter(LocalRateLimitBackend(), clock = self.clock)
+        yield RateLimiter(CacheRateLimitBackend(), clock = self.clock)
+
+    def test_burst_is_capped(self):
+
+        for limiter in self.limiters():
+            with self.subTest(backend = type(limiter.backend).__name__):
+
+                key = f"burst:{type(limiter.backend).__name__}"
+                results = [limiter.hit(key, 3600, 3600, burst = 10) for _ in range(12)]
+
+                self.assertTrue(all(result.allowed for result in results[:10]))
+                self.assertFalse(results[10].allowed)
+                self.assertFalse(results[11].allowed)
+                self.assertEqual(results[9].remaining, 0)
+                self.assertEqual(results[10].retry_after, 1)
+
+    def test_sustained_rate_refills(self):
+
+        for limiter in self.limiters():
+            with self.subTest(backend = type(limiter.backend).__name__):
+
+                key = f"sustained:{type(limiter.backend).__name__}"
+
+                # 60 per minute = 1 per second, burst of 5
+                for _ in range(5):
+                    self.assertTrue(limiter.hit(key, 60, 60, burst = 5).allowed)
+                self.assertFalse(limiter.hit(key, 60, 60, burst = 5).allowed)
+
+                # One request per second keeps passing, a second one does not
+                for _ in range(30):
+                    self.clock.advance(1)
+                    self.assertTrue(limiter.hit(key, 60, 60, burst = 5).allowed)
+                    self.assertFalse(limiter.hit(key, 60, 60, burst = 5).allowed)
+
+                # Idle time refills the bucket, never above the burst
+                self.clock.advance(3600)
+                allowed = sum(limiter.hit(key, 60, 60, burst = 5).allowed for _ in range(10))
+                self.assertEqual(allowed, 5)
+
+    def test_keys_are_independent(self):
+
+        limiter = RateLimiter(LocalRateLimitBackend(), clock = self.clock)
+
+        self.assertTrue(limiter.hit("a", 1, 3600).allowed)
+        self.assertFalse(limiter.hit("a", 1, 3600).allowed)
+        self.assertTrue(limiter.hit("b", 1, 3600).allowed)
+
+    def test_local_backend_is_bounded(self):
+
+        backend = LocalRateLimitBackend(max_keys = 3)
+        limiter = RateLimiter(backend, clock = self.clock)
+
+        for index in range(10):
+            limiter.hit(f"key:{index}", 10, 60)
+
+        self.assertEqual(len(backend.buckets), 3)
+
+
+class ApiKeyHotPathTests(TestCase):
+
+    def setUp(self):
+
+        api_key_cache.clear()
+        usage_recorder.reset()
+        self.addCleanup(usage_recorder.reset)
+
+        # Flushed by hand, not by the background thread
+        flusher = mock.patch('apps.user.apikeys.start_usage_flusher')
+        flusher.start()
+        self.addCleanup(flusher.stop)
+
+        self.api_key, self.key_plain = ApiKey.create_key('widget')
+
+    def test_cached_validation_runs_no_query(self):
+
+        ApiKey.validate_key(self.key_plain)
+
+        with self.assertNumQueries(0):
+            api_key = ApiKey.validate_key(self.key_plain)
+
+        self.assertEqual(api_key.id, self.api_key.id)
+        self.assertEqual(usage_recorder.pending[self.api_key.id][0], 2)
+
+        self.api_key.refresh_from_db()
+        self.assertEqual(self.api_key.usage_count, 0)
+        self.assertIsNone(self.api_key.last_used_at)
+
+    def test_revoke_evicts_the_cached_key(self):
+
+        ApiKey.validate_key(self.key_plain)
+        self.api_key.revoke()
+
+        self.assertIsNone(ApiKey.validate_key(self.key_plain))
+
+    def test_save_evicts_the_cached_key(self):
+
+        ApiKey.validate_key(self.key_plain)
+
+        # Edited through another instance, like the admin does
+        edited = ApiKey.objects.get(id = self.api_key.id)
+        edited.scopes = ['*']
+        edited.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(ApiKey.validate_key(self.key_plain).scopes, ['*'])
+
+    def test_flush_updates_each_key_once(self):
+
+        other, other_plain = ApiKey.create_key('other')
+
+        for _ in range(3):
+            ApiKey.validate_key(self.key_plain)
+        ApiKey.validate_key(other_plain)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(usage_recorder.flush(), 2)
+
+        updates = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(len(updates), 2)
+        for sql in updates:
+            self.assertTrue(sql.startswith('UPDATE "api_keys"'), sql)
+            self.assertIn('"usage_count" + ', sql)
+
+        self.api_key.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.api_key.usage_count, other.usage_count), (3, 1))
+        self.assertIsNotNone(self.api_key.last_used_at)
+        self.assertEqual(usage_recorder.pending, {})
+
+
+class GuestAuthRateLimitTests(TestCase):
+
+    def setUp(self):
+
+        get_limiter().backend.clear()
+        # Counts of this test must never reach another database
+        self.addCleanup(usage_recorder.reset)
+        self.api_key, self.key_plain = ApiKey.create_key('widget', rate_limit = 3)
+        self.client = APIClient()
+
+    def test_api_key_rate_limit(self):
+
+        responses = [
+            self.client.post('/api/v1/guest/auth', {}, format = 'json', HTTP_X_API_KEY = self.key_plain)
+            for _ in range(4)
+        ]
+
+        for response in responses[:3]:
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response['RateLimit-Limit'], '3')
+
+        self.assertEqual(responses[2]['RateLimit-Remaining'], '0')
+        self.assertEqual(responses[3].status_code, 429)
+        self.assertIn('Retry-After', responses[3])
+
+    def test_unlimited_api_key(self):
+
+        self.api_key.rate_limit = 0
+        self.api_key.save()
+
+        for _ in range(5):
+            response = self.client.post(
+                '/api/v1/guest/auth', {}, format = 'json', HTTP_X_API_KEY = self.key_plain
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class GuestAuthTests(TestCase):
+
+    def setUp(self):
+
+        get_limiter().backend.clear()
+        # Counts of this test must never reach another database
+        self.addCleanup(usage_recorder.reset)
+        UserType.objects.get_or_create(code = 'GUEST', defaults = {'name': 'Guest', 'priority': 0})
+        self.api_key, self.key_plain = ApiKey.create_key('widget', rate_limit = 0)
+        self.client = APIClient()
+
+    def auth(self, email, idempotency_key = None):
+
+        headers = {'HTTP_X_API_KEY': self.key_plain}
+        if idempotency_key:
+            headers['HTTP_IDEMPOTENCY_KEY'] = idempotency_key
+
+        return self.client.post(
+            '/api/v1/guest/auth',
+            {'email': email, 'first_name': 'Guest', 'last_name': 'Visitor'},
+            format = 'json',
+            **headers
+        )
+
+    def test_returning_guest_reuses_user_and_room(self):
+
+        first = self.auth('guest@example.com')
+        second = self.auth('guest@example.com')
+
+        self.assertTrue(first.data['is_new_user'])
+        self.assertFalse(second.data['is_new_user'])
+        self.assertEqual(second.data['userId'], first.data['userId'])
+        self.assertEqual(second.data['roomId'], first.data['roomId'])
+        self.assertEqual(ChatRoom.objects.filter(type = ChatRoom.ChatType.SUPPORT).count(), 1)
+
+    def test_idempotency_key_replays(self):
+
+        # Replays live in a cache that outlives the test database
+        key = uuid.uuid4().hex
+
+        first = self.auth('guest@example.com', idempotency_key = key)
+        replay = self.auth('guest@example.com', idempotency_key = key)
+        conflict = self.auth('other@example.com', idempotency_key = key)
+
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.data['userId'], first.data['userId'])
+        self.assertEqual(replay.data['roomId'], first.data['roomId'])
+        self.assertTrue(replay.data['is_new_user'])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertFalse(User.objects.filter(email = 'other@example.com').exists())
+
+    def test_concurrent_first_visit(self):
+
+        # The other request saved the guest and its room after our lookups
+        winner = User.objects.create(username = 'winner', email = 'guest@example.com')
+        room = ChatRoom.objects.create(type = ChatRoom.ChatType.SUPPORT, created_by = winner)
+
+        serializer = GuestAuthSerializer(
+            data = {'email': 'guest@example.com', 'first_name': 'Guest', 'last_name': 'Visitor'},
+            api_key = self.api_key
+        )
+        serializer.is_valid(raise_exception = True)
+
+        with mock.patch.object(QuerySet, 'first', return_value = None):
+            user, created = serializer.get_or_created_guest(serializer.validated_data)
+            support_room = serializer.get_or_create_support_room(user, True)
+
+        self.assertEqual((user.id, created), (winner.id, False))
+        self.assertEqual(support_room.id, room.id)
+        self.assertEqual(User.objects.filter(email = 'guest@example.com').count(), 1)
+
+
+class ProfileAvatarTests(TestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create(
+            username = 'me',
+            email = 'me@example.com',
+            image = 'user/old.png',
+            image_variants = {'small': 'avatars/old-small.webp'}
+        )
+
+    def test_failed_variants_drop_the_old_ones(self):
+
+        with mock.patch('apps.user.serializers.generate_avatar_variants', side_effect = OSError('broken')):
+            ProfileSerializer().update(self.user, {'image': 'user/new.png'})
+
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.image_variants)
+        self.assertEqual(self.user.avatar_url(), self.user.image.url)
+
+    def test_unchanged_image_keeps_the_variants(self):
+
+        with mock.patch('apps.user.serializers.generate_avatar_variants') as generate:
+            ProfileSerializer().update(self.user, {'first_name': 'Renamed'})
+
+        generate.assert_not_called()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.image_variants, {'small': 'avatars/old-small.webp'})
+
+
+class RequestUserTests(TestCase):
+
+    def setUp(self):
+
+        room_cache.clear()
+        profile_cache.clear()
+
+        self.user = User.objects.create(username = 'me', email = 'me@example.com', first_name = 'Me')
+        other = User.objects.create(username = 'other', email = 'other@example.com')
+
+        for index in range(5):
+            room = ChatRoom.objects.create(type = ChatRoom.ChatType.GROUP, name = f'room {index}', created_by = self.user)
+            room.member.add(self.user, other)
+            ChatMessage.objects.create(room = room, user = other, message = 'hello')
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION = 'Bearer ' + str(AccessToken.for_user(self.user)))
+
+    def test_shared_by_request_and_wrapped_request(self):
+
+        request = Request(APIRequestFactory().get('/'))
+        request.user = mock.Mock(id = str(self.user.id))
+
+        with self.assertNumQueries(1):
+            user = get_request_user(request)
+            self.assertIs(get_request_user(request._request), user)
+            self.assertIs(get_request_user(request), user)
+
+    def test_room_list_loads_the_user_once(self):
+
+        # Fills the room payload cache, the per-user fields are left
+        self.client.get('/api/v1/user/chats')
+
+        # User, 3 validators, count and page, then membership and unread count per room
+        with CaptureQueriesContext(connection) as context, self.assertNumQueries(16):
+            response = self.client.get('/api/v1/user/chats')
+
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([room['unread_count'] for room in response.data['results']], [1] * 5)
+
+        # Validators, queryset and serializer share it
+        users = [query for query in context.captured_queries if 'FROM "users"' in query['sql']]
+        self.assertEqual(len(users), 1)
+
+    def test_profile_is_cached_until_saved(self):
+
+        self.assertEqual(user_profile(self.user.id)['userName'], 'Me ')
+
+        with self.assertNumQueries(0):
+            user_profile(self.user.id)
+
+        self.user.last_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(user_profile(self.user.id)['userName'], 'Me Renamed')
+
+        # Avatar variants are saved with update_fields
+        self.user.image = 'user/me.png'
+        self.user.image_variants = {'small': 'avatars/me-small.webp'}
+        self.user.save(update_fields = ['image', 'image_variants'])
+        self.assertTrue(user_profile(self.user.id)['userImage'].endswith('avatars/me-small.webp'))
+
+        agents = UserType.objects.create(code = 'AGENT', name = 'Agent')
+        self.user.user_type = agents
+        self.user.save()
+        self.assertEqual(user_profile(self.user.id)['userType'], 'AGENT')
+
+
+class EmailLookupPlanTests(QueryPlanMixin, TestCase):
+
+    def setUp(self):
+        User.objects.create(username = 'someone', email = 'someone@example.com')
+
+    def test_login_by_email(self):
+
+        # LoginSerializer
+        self.assertUsesIndex(lambda: User.objects.get(email = 'someone@example.com'), 'users_email_idx')
+
+    def test_guest_by_email(self):
+
+        # GuestAuthSerializer.get_or_created_guest
+        lookup = lambda: User.objects.select_related('user_type').filter(email = 'someone@example.com').first()
+
+        self.assertNoFullScan(lookup)
+        self.assertUsesIndex(lookup, 'users_email_idx')
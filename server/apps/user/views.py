@@ -11,9 +11,18 @@ from rest_framework import serializers as drf_serializers
 from .models import User, ApiKey
 from .serializers import (
     UserSerializer, LoginSerializer, SignupSerializer, 
-    ProfileSerializer, ChangePasswordSerializer, GuestAuthSerializer
+    ProfileSerializer, ChangePasswordSerializer, GuestAuthSerializer,
+    IdempotencyConflict
 )
+from .ratelimit import RateLimitMixin, client_ip
+from .loader import get_request_user
 from django.db.models import Q
+from V0X.settings import (
+    API_KEY_RATE_BURST,
+    GUEST_AUTH_IP_RATE_LIMIT,
+    LOGIN_IP_RATE_LIMIT,
+    RATE_LIMIT_IP_BURST
+)
 
 class UserView(ListAPIView):
 
@@ -35,10 +44,18 @@ class UserView(ListAPIView):
         return queryset
 
 
-class LoginApiView(TokenObtainPairView):
+class LoginApiView(RateLimitMixin, TokenObtainPairView):
     permission_classes = [AllowAny]
     serializer_class = LoginSerializer
 
+    def post(self, request, *args, **kwargs):
+
+        self.rate_limit(
+            request, f"login:{client_ip(request)}",
+            LOGIN_IP_RATE_LIMIT, burst = RATE_LIMIT_IP_BURST
+        )
+        return super().post(request, *args, **kwargs)
+
 class SignupApiView(CreateAPIView):
 
     permission_classes = [AllowAny]
@@ -56,7 +73,7 @@ class ProfileView(RetrieveUpdateAPIView):
     parser_classes = [MultiPartParser, FormParser]
 
     def get_object(self):
-        return User.objects.get(id = self.request.user.id)
+        return get_request_user(self.request)
 
 class ChangePasswordView(APIView):
 
@@ -75,7 +92,7 @@ class ChangePasswordView(APIView):
         
         return Response(serializer.errors, status = status.HTTP_400_BAD_REQUEST)
     
-class GuestAuthView(APIView):
+class GuestAuthView(RateLimitMixin, APIView):
 
     permission_classes = [AllowAny]
     @extend_schema(
@@ -87,6 +104,13 @@ class GuestAuthView(APIView):
                 required=True,
                 description = 'API Key for guest access'
             ),
+            OpenApiParameter(
+                name = 'Idempotency-Key',
+                type=str,
+                location = OpenApiParameter.HEADER,
+                required=False,
+                description = 'Retries with the same key return the same guest and room'
+            ),
         ],
         request = GuestAuthSerializer,
         responses = {
@@ -107,6 +131,18 @@ class GuestAuthView(APIView):
                     'detail': drf_serializers.CharField()
                 }
             ),
+            409: inline_serializer(
+                name="GuestAuthConflict",
+                fields = {
+                    'detail': drf_serializers.CharField()
+                }
+            ),
+            429: inline_serializer(
+                name="GuestAuthThrottled",
+                fields = {
+                    'detail': drf_serializers.CharField()
+                }
+            ),
             400: inline_serializer(
                 name="GuestAuthError",
                 fields = {
@@ -135,6 +171,13 @@ class GuestAuthView(APIView):
                 status = status.HTTP_401_UNAUTHORIZED
             )
         
+        # ApiKey.rate_limit is per hour, 0 = unlimited
+        self.rate_limit(request, f"apikey:{api_key.id}", api_key.rate_limit, burst = API_KEY_RATE_BURST)
+        self.rate_limit(
+            request, f"apikey:{api_key.id}:ip:{client_ip(request)}",
+            GUEST_AUTH_IP_RATE_LIMIT, burst = RATE_LIMIT_IP_BURST
+        )
+
         if not api_key.has_scope('guest:created'):
             return Response(
                 {"detail": "X-API-KEY does not have 'guest:created' scope."},
@@ -151,12 +194,20 @@ class GuestAuthView(APIView):
             )
         
         try:
-            result = serializer.authenticate()
+            result = serializer.authenticate(
+                idempotency_key = request.headers.get('Idempotency-Key')
+            )
 
             action = "created" if result["is_new_user"] else "authenticated"
             print(f"[GUEST] User {result['userId']} {action} via API key: {api_key.name}")
 
             return Response(result, status = status.HTTP_200_OK)
+
+        except IdempotencyConflict as e:
+            return Response(
+                {"detail": str(e)},
+                status = status.HTTP_409_CONFLICT
+            )
             
         except Exception as e:
             return Response(